@@ -1,8 +1,5 @@
-from ultralytics import YOLO  # type: ignore
+from people_counter.models import load_model
 
-# Load a YOLO11n PyTorch model
-model = YOLO(model="yolo11n.pt", verbose=True)
-
-# Export the model to NCNN format
+# Export the YOLO11n PyTorch model (downloaded) to NCNN format in the model cache
 # Default exported image size is 640x640
-model.export(format="ncnn")  # creates 'yolo11n_ncnn_model'
+load_model(model_name="yolo11n", model_format="ncnn", imgsz=640)
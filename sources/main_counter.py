@@ -1,6 +1,8 @@
 import asyncio
 import logging
 import os
+import signal
+from contextlib import suppress
 from pathlib import Path
 from typing import Optional
 
@@ -22,7 +24,10 @@ logger.setLevel(logging.DEBUG)
 async def main() -> None:
     config_path = os.environ.get("CONFIG_PATH")
 
-    pgclient = PGClient()
+    # Detections waiting for insertion, kept on disk across restarts
+    spool_path = os.environ.get("SPOOL_PATH", "spool/detections.sqlite")
+
+    pgclient = PGClient(spool_path)
     counter = Counter(pgclient)
 
     configurator = Configuration(
@@ -41,11 +46,19 @@ async def main() -> None:
     if (config := (await configurator.read_configuration_from_file())) is not None:
         await configurator.apply_configuration(config)
 
-    await asyncio.gather(
-        web.start_web(), # Start the website firt to have an interactive interface
-        pgclient.start_pgclient(),
-        counter.start_counter(),
-    )
+    # Stop on SIGTERM (docker stop) as on Ctrl+C: the daemons are cancelled
+    with suppress(NotImplementedError):  # No signal handlers on Windows
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+
+    try:
+        await asyncio.gather(
+            web.start_web(), # Start the website firt to have an interactive interface
+            pgclient.start_pgclient(),
+            counter.start_counter(),
+        )
+    finally:
+        # Keep the time buckets being filled in the buffer for the next start
+        pgclient.flush_rollups()
 
 
 asyncio.run(main())
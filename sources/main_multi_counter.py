@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import os
+import signal
+from contextlib import suppress
+
+
+from people_counter.batching import InferenceBatcher
+from people_counter.counter import Counter
+from people_counter.pgclient import PGClient
+from people_counter.web import Web
+from people_counter.configuration import Configuration
+
+
+logging.basicConfig(
+    format='%(asctime)s:%(levelname)s:%(funcName)s:%(message)s',
+    datefmt='%m/%d/%Y %H:%M:%S',
+)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+async def main() -> None:
+    """
+    Count several cameras with one shared model and batched inferences.
+    Each camera has its own configuration file (camera source, device name...),
+    its own database client and its own web interface on the port 8080 + index.
+    """
+    # Comma separated list of the configuration files, one for each camera
+    config_paths = os.environ.get(
+        "CONFIG_PATHS",
+        "configuration/trafficount-0.json,configuration/trafficount-1.json").split(",")
+
+    batcher = InferenceBatcher()
+    pgclients: list[PGClient] = []
+    daemons = []
+
+    for index, config_path in enumerate(config_paths):
+        pgclient = PGClient(f"spool/detections-{index}.sqlite")
+        pgclients.append(pgclient)
+        counter = Counter(pgclient)
+        counter.set_camera_source(index)  # Default to the camera of the same index
+        batcher.add_counter(counter)
+
+        configurator = Configuration(
+            pgclient=pgclient,
+            counter=counter,
+            config_path=config_path.strip()
+        )
+
+        web = Web(
+            counter=counter,
+            pgclient=pgclient,
+            configurator=configurator,
+            port=8080 + index,
+        )
+
+        # Read the configuration and apply it if it exists
+        if (config := (await configurator.read_configuration_from_file())) is not None:
+            await configurator.apply_configuration(config)
+
+        daemons += [
+            web.start_web(), # Start the website firt to have an interactive interface
+            pgclient.start_pgclient(),
+            counter.start_counter(),
+        ]
+
+    # Load the model once for all the counters (model of the first configuration)
+    # in the executor: the web interfaces are available meanwhile.
+    first_counter = batcher.counters[0]
+    model_loading = asyncio.get_running_loop().run_in_executor(
+        batcher.inference_executor,
+        batcher.init_model,
+        first_counter.model_name,
+        first_counter.model_format,
+        first_counter.model_imgsz,
+    )
+
+    # Stop on SIGTERM (docker stop) as on Ctrl+C: the daemons are cancelled
+    with suppress(NotImplementedError):  # No signal handlers on Windows
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+
+    try:
+        await asyncio.gather(
+            model_loading,
+            batcher.start_batcher(),
+            *daemons,
+        )
+    finally:
+        # Keep the time buckets being filled in the buffers for the next start
+        for pgclient in pgclients:
+            pgclient.flush_rollups()
+
+
+asyncio.run(main())
@@ -0,0 +1,217 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Optional
+
+import cv2
+
+from .models import BACKENDS, load_model, warm_up_model
+
+if TYPE_CHECKING:
+    from ultralytics import YOLO # type: ignore
+    from ultralytics.engine.results import Results # type: ignore
+
+    from .counter import Counter
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+class InferenceBatcher:
+    """
+    Batch the frames of several counters (one per camera) into one inference.
+
+    Each counter keeps its own loop (pacing, aggregation, database) and awaits
+    track() instead of calling model.track() itself. The batcher waits until
+    all the counting counters have submitted a frame (or [batch_timeout]
+    seconds), runs one batched model.predict() in its executor thread, then
+    updates the tracker of each source. The counters without a pending
+    frame (paced on another tick, motion gated) are not waited for.
+
+    model.track() can't be used with a batch of images: the ultralytics
+    predictor shares one tracker for all the images which are not a stream.
+    The backends without batch support (NCNN, static exports) infer the
+    frames of the batch one by one.
+    """
+
+    def __init__(
+        self,
+        tracker_config: str = "botsort.yaml",
+        batch_timeout: float = 0.05,
+    ) -> None:
+        self.model: Optional["YOLO"] = None
+
+        # The backend of the model infers several frames at once (see ModelBackend.batched)
+        self.batched: bool = False
+
+        # Tracker configuration (ultralytics tracker yaml file)
+        self.tracker_config: str = tracker_config
+
+        # Maximum time to wait for the frames of the other counters
+        self.batch_timeout: float = batch_timeout
+
+        # Counters sharing the model
+        self.counters: list["Counter"] = []
+
+        # Tracker of each counter and its frame rate
+        self.trackers: dict[int, tuple[Any, int]] = {}
+
+        # Frames waiting for the next batch
+        self.pending: list[tuple["Counter", cv2.typing.MatLike, asyncio.Future]] = []
+        self.pending_event = asyncio.Event()
+
+        # Number of frames of the last batch
+        self.last_batch_size: int = 0
+
+        # One worker: the model is shared by all the counters
+        self.inference_executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="batch-inference")
+
+    def add_counter(self, counter: "Counter") -> None:
+        """
+        Share the batcher (and its model) with the counter.
+        """
+        counter.batcher = self
+        counter.model = self.model
+        self.counters.append(counter)
+
+    def init_model(self, model_name: str = "yolo11n", model_format: str = "ncnn", model_imgsz: int = 640) -> bool:
+        """
+        Load the model shared by all the counters and warm it up.
+        """
+        try:
+            model = load_model(model_name, model_format, model_imgsz)
+            warm_up_model(model, model_imgsz)
+            self.model = model
+            self.batched = BACKENDS[model_format].batched
+            for counter in self.counters:
+                counter.model = self.model
+            logger.info("Shared model loaded")
+            return True
+
+        except Exception:
+            self.model = None
+            logger.exception("Failed to load the shared model")
+            return False
+
+    def expected_batch_size(self) -> int:
+        """
+        Number of counters with a frame submitted or about to be submitted.
+        """
+        return sum(1 for counter in self.counters if counter.frame_pending)
+
+    @staticmethod
+    def tracker_frame_rate(counter: "Counter") -> int:
+        """
+        Frame rate of the counter (at least 1), from its delay between two frames.
+        The tracker keeps the lost tracks [track_buffer] frames at 30 fps.
+        """
+        return max(round(1 / counter.delay), 1) if counter.delay > 0 else 30
+
+    def create_tracker(self, frame_rate: int = 30) -> Any:
+        from ultralytics.trackers.track import TRACKER_MAP # type: ignore
+        from ultralytics.utils import IterableSimpleNamespace, yaml_load # type: ignore
+        from ultralytics.utils.checks import check_yaml # type: ignore
+
+        config = IterableSimpleNamespace(**yaml_load(check_yaml(self.tracker_config)))
+        return TRACKER_MAP[config.tracker_type](args=config, frame_rate=frame_rate)
+
+    async def track(self, counter: "Counter", frame: cv2.typing.MatLike) -> "Results":
+        """
+        Submit the frame of the counter to the next batch and wait for its result.
+        """
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.pending.append((counter, frame, future))
+        self.pending_event.set()
+        return await future
+
+    def infer_batch(
+        self,
+        batch: list[tuple["Counter", cv2.typing.MatLike, asyncio.Future]],
+    ) -> list["Results"]:
+        """
+        Run one inference for all the frames and update the tracker of each counter.
+        :raise RuntimeError: If the model doesn't return one result per frame.
+        """
+        assert self.model is not None
+        import torch # type: ignore
+
+        sources = [frame for _, frame, _ in batch]
+        conf = min(counter.confidence for counter, _, _ in batch) # Filtered by counter below
+        start = time.perf_counter()
+        if self.batched:
+            results = self.model.predict(source=sources, classes=[0], conf=conf, verbose=False)
+        else:
+            # One inference per frame, the backend only infers the first image of a batch
+            results = [
+                result
+                for source in sources
+                for result in self.model.predict(source=source, classes=[0], conf=conf, verbose=False)
+            ]
+        inference_duration = time.perf_counter() - start
+        if len(results) != len(batch):
+            raise RuntimeError(f"{len(results)} inference results for {len(batch)} frames")
+
+        tracked_results: list["Results"] = []
+        for (counter, _, _), result in zip(batch, results):
+            counter.metrics.observe("inference", inference_duration, "Batched inference of the frames")
+
+            # Confidence threshold of the counter
+            result = result[result.boxes.conf >= counter.confidence]
+
+            # New tracker if the delay of the counter changed
+            frame_rate = self.tracker_frame_rate(counter)
+            tracker, tracker_frame_rate = self.trackers.get(id(counter), (None, 0))
+            if tracker is None or tracker_frame_rate != frame_rate:
+                tracker = self.create_tracker(frame_rate)
+                self.trackers[id(counter)] = (tracker, frame_rate)
+
+            # Same as the ultralytics tracking callback, but with one tracker per source
+            with counter.metrics.time("tracking", "Tracking of the detections"):
+                tracks = tracker.update(result.boxes.cpu().numpy(), result.orig_img)
+                if len(tracks):
+                    result = result[tracks[:, -1].astype(int)]
+                    result.update(boxes=torch.as_tensor(tracks[:, :-1]))
+            tracked_results.append(result)
+
+        return tracked_results
+
+    async def start_batcher(self) -> None:
+        """
+        Run the batched inferences for the submitted frames
+        """
+        loop = asyncio.get_running_loop()
+        logger.info("Batcher daemon started")
+        while True:
+            await self.pending_event.wait()
+
+            # Wait for the frames of the other counters
+            deadline = time.time() + self.batch_timeout
+            while len(self.pending) < self.expected_batch_size() and time.time() < deadline:
+                await asyncio.sleep(0.005)
+
+            batch = self.pending
+            self.pending = []
+            self.pending_event.clear()
+
+            try:
+                results = await loop.run_in_executor(
+                    self.inference_executor, self.infer_batch, batch)
+                for (_, _, future), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+                self.last_batch_size = len(batch)
+            except Exception as e:
+                logger.exception("Batched inference failed")
+                # Every counter gets its error (handled by the counter, the batcher goes on)
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            finally:
+                # Never leave a counter waiting (batcher cancelled)
+                for _, _, future in batch:
+                    if not future.done():
+                        future.cancel()
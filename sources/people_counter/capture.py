@@ -0,0 +1,243 @@
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+import cv2
+
+from .metrics import Metrics
+from .motion import MotionDetector
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+class Capture:
+    """
+    Continuously read the frames of a cv2.VideoCapture in a background thread.
+
+    The frames are written in a small ring of preallocated buffers, so the
+    camera buffer (V4L2, RTSP) never fills up and the readers always get the
+    freshest frame: the latest frame wins and slow readers skip frames.
+
+    The frames are returned without copies. A reader must hold a frame
+    (acquire/release) while using it, otherwise its buffer may be overwritten
+    by the capture thread.
+    """
+
+    def __init__(
+        self,
+        source: int | str = 0,
+        ring_size: int = 4,
+        metrics: Optional[Metrics] = None,
+    ) -> None:
+        # Camera index, video file or stream url
+        self.source: int | str = source
+
+        # Duration of the frame reads
+        self.metrics: Metrics = metrics if metrics is not None else Metrics()
+
+        # Ring of preallocated frames, allocated at the first read.
+        # Must be greater than the number of held frames + 1.
+        self.ring_size: int = max(ring_size, 3)
+        self.frames: list[Optional[cv2.typing.MatLike]] = [None] * self.ring_size
+        self.timestamps: list[float] = [0] * self.ring_size
+        self.sequences: list[int] = [0] * self.ring_size
+        self.holds: list[int] = [0] * self.ring_size
+
+        # Sequence number of the last captured frame (0 if no frame captured)
+        self.sequence: int = 0
+        self.index: int = 0
+
+        # Captured frames per second, measured by the capture thread
+        self.fps: float = 0
+
+        # Motion detection on each captured frame, if activated
+        self.activate_motion_detection: bool = False
+        self.motion_detector: MotionDetector = MotionDetector()
+        self.last_motion_time: float = 0
+
+        self.cap: Optional[cv2.VideoCapture] = None
+        self.thread: Optional[threading.Thread] = None
+        self.running: bool = False
+
+        # Notify the readers waiting for a new frame
+        self.condition = threading.Condition()
+
+    @property
+    def is_running(self) -> bool:
+        return self.running
+
+    @property
+    def is_file(self) -> bool:
+        """
+        The source is a video file, not a live camera (index, device) or stream (url).
+        """
+        return isinstance(self.source, str) and Path(self.source).is_file()
+
+    def open(self) -> bool:
+        """
+        Open the capture source and start the capture thread.
+        :return: True if the source is opened, else False
+        """
+        self.cap = cv2.VideoCapture(self.source)
+        if not self.cap.isOpened():
+            logger.error(f"Capture source {self.source} not opened")
+            self.cap = None
+            return False
+
+        self.running = True
+        self.thread = threading.Thread(
+            target=self.capture_loop,
+            args=(self.cap,),
+            name=f"capture-{self.source}",
+            daemon=True)
+        self.thread.start()
+        logger.info(f"Capture source {self.source} opened")
+        return True
+
+    def stop(self) -> None:
+        """
+        Ask the capture thread to stop without waiting for it.
+        """
+        self.running = False
+
+    def release(self) -> None:
+        """
+        Stop the capture thread without waiting for it (a read may block for seconds):
+        the thread releases the capture source once its last read is over.
+        """
+        self.running = False
+        if self.thread is None and self.cap is not None:
+            self.cap.release()
+        self.thread = None
+        self.cap = None
+        with self.condition:
+            self.condition.notify_all()
+        logger.info(f"Capture source {self.source} released")
+
+    def next_index(self) -> Optional[int]:
+        """
+        Return the index of the next free buffer of the ring
+        (not held by a reader and not the latest frame).
+        """
+        for offset in range(1, self.ring_size):
+            index = (self.index + offset) % self.ring_size
+            if not self.holds[index]:
+                return index
+        return None
+
+    def capture_loop(self, cap: cv2.VideoCapture) -> None:
+        """
+        Read the frames until the capture is released or fails, then release the capture source.
+        The thread owns [cap]: it is never released during a read.
+        """
+        try:
+            self.read_loop(cap)
+        finally:
+            cap.release()
+            self.running = False
+            with self.condition:
+                self.condition.notify_all()
+
+    def read_loop(self, cap: cv2.VideoCapture) -> None:
+        last_time = time.time()
+
+        # A video file is read at its frame rate like a camera, not at the decoding speed
+        frame_duration = 1 / (cap.get(cv2.CAP_PROP_FPS) or 25) if self.is_file else 0
+        next_frame_time = last_time
+
+        while self.running:
+            if frame_duration:
+                # Sleep until the time of the frame in the video (no burst if the decoding lags)
+                next_frame_time = max(next_frame_time + frame_duration, time.time())
+                time.sleep(max(next_frame_time - time.time(), 0))
+
+            with self.condition:
+                index = self.next_index()
+            if index is None:
+                # All the buffers are held, drop the frame
+                cap.grab()
+                continue
+
+            # Read directly in the preallocated buffer if it exists
+            with self.metrics.time("capture", "Read of a camera frame"):
+                success, frame = cap.read(self.frames[index])
+            if not success:
+                logger.error(f"Can't read the next frame of {self.source}")
+                break
+
+            now = time.time()
+
+            # Detect the motion on the capture thread, before the frame is published:
+            # the buffer is not held by any reader yet, and the readers see the motion time of the frame
+            if self.activate_motion_detection:
+                with self.metrics.time("motion", "Motion detection of a frame"):
+                    if self.motion_detector.update(frame):
+                        self.last_motion_time = now
+            else:
+                self.motion_detector.reset()
+
+            with self.condition:
+                self.sequence += 1
+                self.index = index
+                self.frames[index] = frame
+                self.timestamps[index] = now
+                self.sequences[index] = self.sequence
+                self.condition.notify_all()
+
+            # Exponential moving average of the capture rate
+            elapsed = now - last_time
+            last_time = now
+            if elapsed > 0:
+                self.fps = 0.9 * self.fps + 0.1 / elapsed if self.fps else 1 / elapsed
+
+    def latest(self) -> tuple[int, Optional[cv2.typing.MatLike]]:
+        """
+        Return the sequence number and the latest frame (not held).
+        """
+        with self.condition:
+            return self.sequence, self.frames[self.index] if self.sequence else None
+
+    def frame(self, sequence: int) -> Optional[cv2.typing.MatLike]:
+        """
+        Return the frame of the given sequence number if it is still in the ring.
+        """
+        with self.condition:
+            for index in range(self.ring_size):
+                if self.sequences[index] == sequence and self.frames[index] is not None:
+                    return self.frames[index]
+        return None
+
+    def acquire(
+        self,
+        after_sequence: int = 0,
+        timeout: Optional[float] = None,
+    ) -> tuple[int, float, Optional[cv2.typing.MatLike]]:
+        """
+        Wait for a frame newer than [after_sequence] and hold it.
+        The frame must be released with release_frame() when it is no longer used.
+        :return: The sequence number, the capture time and the frame.
+            The frame is None if the timeout expired or the capture stopped.
+        """
+        with self.condition:
+            if not self.condition.wait_for(
+                lambda: self.sequence > after_sequence or not self.running,
+                timeout=timeout,
+            ) or self.sequence <= after_sequence:
+                return after_sequence, 0, None
+
+            self.holds[self.index] += 1
+            return self.sequence, self.timestamps[self.index], self.frames[self.index]
+
+    def release_frame(self, sequence: int) -> None:
+        """
+        Release a frame held with acquire().
+        """
+        with self.condition:
+            for index in range(self.ring_size):
+                if self.sequences[index] == sequence and self.holds[index]:
+                    self.holds[index] -= 1
+                    return
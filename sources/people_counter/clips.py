@@ -0,0 +1,404 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from contextlib import suppress
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Optional
+
+import cv2
+import numpy as np
+
+from .encoding import EncodedFrameCache
+from .recorder import VideoRecorder
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+class Clip:
+    """
+    Frames around one or more line crossings, written to one video file.
+    """
+
+    __slots__ = ("start_time", "end_time", "frames", "crossings")
+
+    def __init__(self, start_time: float, end_time: float) -> None:
+        self.start_time: float = start_time
+        self.end_time: float = end_time
+
+        # Encoded frames (capture time, JPEG bytes)
+        self.frames: list[tuple[float, bytes]] = []
+
+        # Crossings of the clip: {"track_id", "direction", "time"}
+        self.crossings: list[dict[str, Any]] = []
+
+
+class ClipRecorder:
+    """
+    Record a short clip around each line crossing, as evidence of the counts.
+
+    The last [pre_roll] seconds of frames are kept in memory as JPEG (bounded
+    to [max_memory] bytes). At a crossing, a clip starts with these frames and
+    goes on [post_roll] seconds after the last crossing (up to
+    [max_duration] seconds). The frames are encoded and the clips written by
+    a background thread, fed by a bounded queue like VideoRecorder.
+
+    The clips are indexed by track id and time in [directory]/index.jsonl.
+    The clips older than [max_age] seconds or over [max_size] bytes in total
+    are deleted with their index lines (the oldest first).
+    """
+
+    def __init__(
+        self,
+        directory: str | Path = "clips",
+        pre_roll: float = 5,
+        post_roll: float = 5,
+        frame_cache: Optional[EncodedFrameCache] = None,
+    ) -> None:
+        self.directory: Path = Path(directory)
+
+        # Seconds recorded before the first crossing and after the last one
+        self.pre_roll: float = pre_roll
+        self.post_roll: float = post_roll
+        self.max_duration: float = 60
+
+        # Encoding of the frames in memory, shared with the stream if the parameters are the same
+        self.frame_cache: EncodedFrameCache = frame_cache if frame_cache is not None else EncodedFrameCache()
+        self.quality: int = 70
+        self.width: int = 640
+
+        # Video files of the clips
+        self.codec: str = "mp4v"
+        self.fps: float = 5
+
+        # Retention of the clips (seconds, bytes, 0 for no limit)
+        self.max_age: float = 30 * 24 * 3600
+        self.max_size: int = 2 * 1024**3
+
+        # The index is read by the web server and written by the thread
+        self.index_lock = threading.Lock()
+
+        # Ring of the last encoded frames (capture time, JPEG bytes) and its size in bytes
+        self.max_memory: int = 32 * 1024**2
+        self.ring: deque[tuple[float, bytes]] = deque()
+        self.ring_bytes: int = 0
+
+        # Crossings of the frame being processed, sent with the frame to the thread
+        self.crossings: list[dict[str, Any]] = []
+        self.lock = threading.Lock()
+
+        # Frames waiting for the thread: (frame, sequence, capture time, crossings). None stops the thread.
+        self.queue_size: int = 30
+        self.frames: queue.Queue[Optional[tuple[cv2.typing.MatLike, int, float, list[dict[str, Any]]]]] = (
+            queue.Queue(maxsize=self.queue_size))
+        self.dropped_count: int = 0
+
+        self.thread: Optional[threading.Thread] = None
+        self.running: bool = False
+
+        # Clip being recorded, used by the thread only
+        self.clip: Optional[Clip] = None
+        self.clip_count: int = 0
+        self.last_clip_filename: str = ""
+
+    @property
+    def index_path(self) -> Path:
+        return self.directory / "index.jsonl"
+
+    def set_pre_roll(self, pre_roll: float | str) -> bool:
+        try:
+            pre_roll = float(pre_roll)
+        except ValueError:
+            logger.error(f"Pre-roll is not float: pre_roll={pre_roll}")
+            return False
+
+        if pre_roll < 0 or pre_roll > 60:
+            logger.error(f"Pre-roll not between 0 and 60 seconds: pre_roll={pre_roll}")
+            return False
+
+        self.pre_roll = pre_roll
+        logger.info(f"Set clip pre_roll={pre_roll}")
+        return True
+
+    def set_post_roll(self, post_roll: float | str) -> bool:
+        try:
+            post_roll = float(post_roll)
+        except ValueError:
+            logger.error(f"Post-roll is not float: post_roll={post_roll}")
+            return False
+
+        if post_roll < 0 or post_roll > 60:
+            logger.error(f"Post-roll not between 0 and 60 seconds: post_roll={post_roll}")
+            return False
+
+        self.post_roll = post_roll
+        logger.info(f"Set clip post_roll={post_roll}")
+        return True
+
+    def set_max_age(self, max_age: float | str) -> bool:
+        try:
+            max_age = float(max_age)
+        except ValueError:
+            logger.error(f"Clip max age is not float: max_age={max_age}")
+            return False
+
+        if max_age < 0:
+            logger.error(f"Clip max age must be positive: max_age={max_age}")
+            return False
+
+        self.max_age = max_age
+        logger.info(f"Set clip max_age={max_age}")
+        return True
+
+    def set_max_size(self, max_size: int | str) -> bool:
+        try:
+            max_size = int(max_size)
+        except ValueError:
+            logger.error(f"Clip max size is not integer: max_size={max_size}")
+            return False
+
+        if max_size < 0:
+            logger.error(f"Clip max size must be positive: max_size={max_size}")
+            return False
+
+        self.max_size = max_size
+        logger.info(f"Set clip max_size={max_size}")
+        return True
+
+    def start(self) -> None:
+        if self.running:
+            return
+
+        # The new thread waits for the previous one to write its last clip,
+        # the new frames are queued meanwhile
+        self.frames = queue.Queue(maxsize=self.queue_size)
+        self.running = True
+        self.thread = threading.Thread(
+            target=self.record_loop, args=(self.frames, self.thread), name="clip-recorder", daemon=True)
+        self.thread.start()
+        logger.info("Clip recorder started")
+
+    def stop(self) -> None:
+        """
+        Write the clip being recorded and stop the thread (in the background).
+        """
+        if not self.running:
+            return
+        self.running = False
+        # Never block: the oldest frame is dropped if the queue is full
+        while True:
+            try:
+                self.frames.put_nowait(None)
+                break
+            except queue.Full:
+                with suppress(queue.Empty):
+                    self.frames.get_nowait()
+                    self.dropped_count += 1
+        logger.info("Clip recorder stopped")
+
+    def trigger(self, track_id: int, direction: str, crossing_time: float) -> None:
+        """
+        Record a clip around the crossing of the track (called by the inference thread).
+        :param direction: "in" or "out".
+        """
+        if not self.running:
+            return
+        with self.lock:
+            self.crossings.append({"track_id": track_id, "direction": direction, "time": crossing_time})
+
+    def add_frame(self, frame: cv2.typing.MatLike, sequence: int, frame_time: float) -> bool:
+        """
+        Queue a copy of the processed frame with the crossings detected on it.
+        :param sequence: Sequence number of the processed frame (key of the frame cache).
+        :return: True if queued, False if dropped (queue full or recorder stopped)
+        """
+        if not self.running:
+            return False
+        with self.lock:
+            crossings, self.crossings = self.crossings, []
+        try:
+            self.frames.put_nowait((frame.copy(), sequence, frame_time, crossings))
+            return True
+        except queue.Full:
+            self.dropped_count += 1
+            # Keep the crossings for the next frame
+            with self.lock:
+                self.crossings = crossings + self.crossings
+            if self.dropped_count % 100 == 1:
+                logger.warning(f"Clip recorder lagging: {self.dropped_count} frames dropped")
+            return False
+
+    def append_ring(self, frame_time: float, image: bytes) -> None:
+        """
+        Keep the frame in the ring, without the frames older than the pre-roll or over the memory limit.
+        """
+        self.ring.append((frame_time, image))
+        self.ring_bytes += len(image)
+        while self.ring and (
+            self.ring[0][0] < frame_time - self.pre_roll or self.ring_bytes > self.max_memory
+        ):
+            self.ring_bytes -= len(self.ring.popleft()[1])
+
+    def process_frame(
+        self,
+        frame: cv2.typing.MatLike,
+        sequence: int,
+        frame_time: float,
+        crossings: list[dict[str, Any]],
+    ) -> None:
+        """
+        Encode the frame, start or extend the clip with the crossings and
+        write the clip once over (in the thread).
+        """
+        image = self.frame_cache.encode(frame, (sequence, "jpg", self.quality, self.width))
+        if image is None:
+            return
+        self.append_ring(frame_time, image)
+
+        for crossing in crossings:
+            if self.clip is None:
+                # The clip starts with the frames of the ring, including this one
+                self.clip = Clip(frame_time - self.pre_roll, crossing["time"] + self.post_roll)
+                self.clip.frames = list(self.ring)
+            else:
+                self.clip.end_time = max(self.clip.end_time, crossing["time"] + self.post_roll)
+            self.clip.end_time = min(self.clip.end_time, self.clip.start_time + self.max_duration)
+            self.clip.crossings.append(crossing)
+
+        if self.clip is None:
+            return
+        if self.clip.frames[-1][0] != frame_time:
+            self.clip.frames.append((frame_time, image))
+        if frame_time >= self.clip.end_time:
+            self.write_clip()
+
+    def write_clip(self) -> None:
+        """
+        Decode the frames of the clip, write them to a video file and index the clip.
+        """
+        clip, self.clip = self.clip, None
+        if clip is None or not clip.frames:
+            return
+
+        writer = VideoRecorder(self.directory, self.codec, self.fps, prefix="clip")
+        writer.segment_duration = 0
+        writer.segment_size = 0
+        writer.max_gap = float("inf")
+        for frame_time, image in clip.frames:
+            writer.write_frame(cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_COLOR), frame_time)
+        writer.close_segment()
+        if not writer.filename:
+            return
+
+        entry = {
+            "filename": Path(writer.filename).name,
+            "start": str(datetime.fromtimestamp(clip.frames[0][0])),
+            "end": str(datetime.fromtimestamp(clip.frames[-1][0])),
+            "crossings": [
+                crossing | {"time": str(datetime.fromtimestamp(crossing["time"]))}
+                for crossing in clip.crossings
+            ],
+        }
+        try:
+            with self.index_lock, open(self.index_path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            logger.error(f"Failed to index the clip {writer.filename}: {e}")
+
+        self.clip_count += 1
+        self.last_clip_filename = writer.filename
+        logger.info(f"Clip wrote to {writer.filename}: "
+                    f"tracks {[crossing['track_id'] for crossing in clip.crossings]}")
+
+        self.delete_old_clips()
+
+    def read_index(self) -> list[dict[str, Any]]:
+        """
+        Entries of the index, from the oldest to the newest.
+        """
+        try:
+            with self.index_lock, open(self.index_path) as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except (OSError, ValueError):
+            return []
+
+    def delete_old_clips(self, now: Optional[float] = None) -> int:
+        """
+        Delete the clips older than [max_age] or over [max_size] in total (the oldest first)
+        and their index lines (in the thread).
+        :return: The number of deleted clips
+        """
+        now = now if now is not None else time.time()
+        entries = self.read_index()
+        sizes = []
+        for entry in entries:
+            try:
+                sizes.append((self.directory / entry["filename"]).stat().st_size)
+            except OSError:
+                sizes.append(0)
+
+        # Index of the first clip kept
+        first = 0
+        if self.max_age:
+            while first < len(entries) and (
+                datetime.fromisoformat(entries[first]["end"]).timestamp() < now - self.max_age):
+                first += 1
+        if self.max_size:
+            total_size = sum(sizes[first:])
+            while first < len(entries) and total_size > self.max_size:
+                total_size -= sizes[first]
+                first += 1
+        if not first:
+            return 0
+
+        for entry in entries[:first]:
+            with suppress(OSError):
+                (self.directory / entry["filename"]).unlink()
+
+        # Replace the index at once, the web server never reads a partial index
+        temporary_path = self.index_path.with_suffix(".tmp")
+        try:
+            with self.index_lock:
+                with open(temporary_path, "w") as f:
+                    f.writelines(json.dumps(entry) + "\n" for entry in entries[first:])
+                os.replace(temporary_path, self.index_path)
+        except OSError as e:
+            logger.error(f"Failed to rewrite the clip index: {e}")
+        logger.info(f"{first} old clips deleted")
+        return first
+
+    def find(self, track_id: Optional[int] = None) -> list[dict[str, Any]]:
+        """
+        Clips of the index, only those of the track if [track_id] is given.
+        Reads the index file: called in an executor by the web server.
+        """
+        entries = self.read_index()
+        if track_id is None:
+            return entries
+        return [
+            entry for entry in entries
+            if any(crossing["track_id"] == track_id for crossing in entry["crossings"])
+        ]
+
+    def record_loop(
+        self,
+        frames: queue.Queue[Optional[tuple[cv2.typing.MatLike, int, float, list[dict[str, Any]]]]],
+        previous_thread: Optional[threading.Thread] = None,
+    ) -> None:
+        # The ring and the clip are shared with the previous thread
+        if previous_thread is not None:
+            previous_thread.join()
+        while (item := frames.get()) is not None:
+            try:
+                self.process_frame(*item)
+            except cv2.error as e:
+                logger.error(f"Failed to record the clip frame: {e}")
+        self.write_clip()
+        self.ring.clear()
+        self.ring_bytes = 0
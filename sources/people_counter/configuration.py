@@ -17,14 +17,24 @@ logger.setLevel(logging.DEBUG)
 class ConfMap:
     database_url = "database_url"
     database_key = "database_key"
-    database_buffer_size = "database_buffer_size"
+    database_buffer_size = "database_buffer_size"  # Legacy in-memory buffer, ignored
+    database_spool_size = "database_spool_size"
     database_insert_delay = "database_insert_delay"
     database_error_delay = "database_error_delay"
+    database_chunk_size = "database_chunk_size"
+    database_chunk_bytes = "database_chunk_bytes"
+    database_concurrency = "database_concurrency"
+    database_verify_certificate = "database_verify_certificate"
+    database_rollup_durations = "database_rollup_durations"
     database_device_name = "database_device_name"
     database_location_name = "database_location_name"
     database_resolution_width = "database_resolution_width"
     database_resolution_height = "database_resolution_height"
 
+    camera_source = "camera_source"
+    camera_stream_quality = "camera_stream_quality"
+    camera_stream_width = "camera_stream_width"
+
     counting_confidence = "counting_confidence"
     counting_delay = "counting_delay"
     counting_aggregated_frames_number = "counting_aggregated_frames_number"
@@ -32,10 +42,35 @@ class ConfMap:
     counting_line_p1_y = "counting_line_first_point_y"
     counting_line_p2_x = "counting_line_second_point_x"
     counting_line_p2_y = "counting_line_second_point_y"
+    counting_regions = "counting_regions"
+    counting_roi = "counting_roi"
+    counting_roi_margin = "counting_roi_margin"
+    counting_motion_heartbeat = "counting_motion_heartbeat"
+    counting_model_name = "counting_model_name"
+    counting_model_format = "counting_model_format"
+    counting_model_imgsz = "counting_model_imgsz"
+
+    video_codec = "video_codec"
+    video_fps = "video_fps"
+    video_quality = "video_quality"
+    video_segment_duration = "video_segment_duration"
+    video_segment_size = "video_segment_size"
+    clip_pre_roll = "clip_pre_roll"
+    clip_post_roll = "clip_post_roll"
+    clip_max_age = "clip_max_age"
+    clip_max_size = "clip_max_size"
 
     activate_counting = "activate_counting"
     activate_database_insertion = "activate_database_insertion"
+    activate_foreign_key_insertion = "activate_foreign_key_insertion"
+    activate_raw_insertion = "activate_raw_insertion"
     activate_image_annotation = "activate_image_annotation"
+    activate_adaptive_pacing = "activate_adaptive_pacing"
+    activate_resolution_shedding = "activate_resolution_shedding"
+    activate_motion_gating = "activate_motion_gating"
+    activate_auto_roi = "activate_auto_roi"
+    activate_video_hardware_acceleration = "activate_video_hardware_acceleration"
+    activate_clip_recording = "activate_clip_recording"
     # Activate Video writer is not saved...
 
 
@@ -66,15 +101,24 @@ class Configuration:
         config: dict[str, str] = {
             confmap.database_url: self.pgclient.url,
             confmap.database_key: self.pgclient.key,
-            confmap.database_buffer_size:  str(self.pgclient.detection_buffer_size),
+            confmap.database_spool_size:   str(self.pgclient.detection_buffer_size),
             confmap.database_insert_delay: str(self.pgclient.insertion_delay),
             confmap.database_error_delay:  str(self.pgclient.error_delay),
+            confmap.database_chunk_size:   str(self.pgclient.insertion_chunk_size),
+            confmap.database_chunk_bytes:  str(self.pgclient.insertion_chunk_bytes),
+            confmap.database_concurrency:  str(self.pgclient.insertion_concurrency),
+            confmap.database_verify_certificate: str(self.pgclient.verify_certificate),
+            confmap.database_rollup_durations: ",".join(str(duration) for duration in self.pgclient.rollup_durations),
 
             confmap.database_device_name:       self.pgclient.device.name,
             confmap.database_location_name:     self.pgclient.location.name,
             confmap.database_resolution_width:  str(self.pgclient.resolution.width),
             confmap.database_resolution_height: str(self.pgclient.resolution.height),
 
+            confmap.camera_source: str(self.counter.camera_source),
+            confmap.camera_stream_quality: str(self.counter.streamer.quality),
+            confmap.camera_stream_width:   str(self.counter.streamer.width),
+
             confmap.counting_confidence:               str(self.counter.confidence),
             confmap.counting_delay:                    str(self.counter.delay),
             confmap.counting_aggregated_frames_number: str(self.counter.aggregated_frames_number),
@@ -82,10 +126,36 @@ class Configuration:
             confmap.counting_line_p1_y: str(self.counter.region[0][1]),
             confmap.counting_line_p2_x: str(self.counter.region[1][0]),
             confmap.counting_line_p2_y: str(self.counter.region[1][1]),
+            confmap.counting_regions: json.dumps(self.counter.regions.to_list()),
+            confmap.counting_motion_heartbeat: str(self.counter.motion_heartbeat),
+            # The running model: a model failing to load is never saved
+            confmap.counting_model_name:   self.counter.model_name,
+            confmap.counting_model_format: self.counter.model_format,
+            confmap.counting_model_imgsz:  str(self.counter.model_imgsz),
+            confmap.counting_roi: ",".join(str(value) for value in self.counter.roi) if self.counter.roi else "",
+            confmap.counting_roi_margin: str(self.counter.roi_margin),
+
+            confmap.video_codec:            self.counter.video_recorder.codec,
+            confmap.video_fps:              str(self.counter.video_recorder.fps),
+            confmap.video_quality:          str(self.counter.video_recorder.quality),
+            confmap.video_segment_duration: str(self.counter.video_recorder.segment_duration),
+            confmap.video_segment_size:     str(self.counter.video_recorder.segment_size),
+            confmap.clip_pre_roll:          str(self.counter.clip_recorder.pre_roll),
+            confmap.clip_post_roll:         str(self.counter.clip_recorder.post_roll),
+            confmap.clip_max_age:           str(self.counter.clip_recorder.max_age),
+            confmap.clip_max_size:          str(self.counter.clip_recorder.max_size),
 
             confmap.activate_counting:           str(self.counter.activate_counting),
             confmap.activate_image_annotation:   str(self.counter.activate_image_annotation),
             confmap.activate_database_insertion: str(self.pgclient.activate_insertion),
+            confmap.activate_foreign_key_insertion: str(self.pgclient.resolver.insert_missing),
+            confmap.activate_raw_insertion: str(self.pgclient.activate_raw_insertion),
+            confmap.activate_adaptive_pacing:     str(self.counter.activate_adaptive_pacing),
+            confmap.activate_resolution_shedding: str(self.counter.pacer.allow_resolution_shedding),
+            confmap.activate_motion_gating:       str(self.counter.activate_motion_gating),
+            confmap.activate_auto_roi:            str(self.counter.activate_auto_roi),
+            confmap.activate_video_hardware_acceleration: str(self.counter.video_recorder.activate_hardware_acceleration),
+            confmap.activate_clip_recording: str(self.counter.activate_clip_recording),
         }
 
         return config
@@ -134,6 +204,8 @@ class Configuration:
         """
         """
         # Set the database key or url
+        if verify_certificate := config.get(confmap.database_verify_certificate):
+            self.pgclient.toggle_verify_certificate(force=(verify_certificate=="True"))
         if (database_key := config.get(confmap.database_key)):
             self.pgclient.set_key(database_key)
         if (database_url := config.get(confmap.database_url)):
@@ -142,6 +214,8 @@ class Configuration:
             self.pgclient.init_pgclient()
 
         # Set the database ids
+        if activate_foreign_key_insertion := config.get(confmap.activate_foreign_key_insertion):
+            self.pgclient.toggle_foreign_key_insertion(force=(activate_foreign_key_insertion=="True"))
         if device_name := config.get(confmap.database_device_name):
             await self.pgclient.update_device(device_name)
         if location_name := config.get(confmap.database_location_name):
@@ -151,10 +225,33 @@ class Configuration:
             await self.pgclient.update_resolution(width, height)
 
         # Set the delays
+        # The size of the legacy in-memory buffer (one hour) would cap the spool on disk
+        if config.get(confmap.database_buffer_size):
+            logger.info(f"{confmap.database_buffer_size} ignored, replaced by {confmap.database_spool_size}")
+        if spool_size := config.get(confmap.database_spool_size):
+            self.pgclient.set_detection_buffer_size(spool_size)
         if insert_delay := config.get(confmap.database_insert_delay):
             self.pgclient.set_insertion_delay(insert_delay)
         if error_delay := config.get(confmap.database_error_delay):
             self.pgclient.set_error_delay(error_delay)
+        if chunk_size := config.get(confmap.database_chunk_size):
+            self.pgclient.set_insertion_chunk_size(chunk_size)
+        if chunk_bytes := config.get(confmap.database_chunk_bytes):
+            self.pgclient.set_insertion_chunk_bytes(chunk_bytes)
+        if concurrency := config.get(confmap.database_concurrency):
+            self.pgclient.set_insertion_concurrency(concurrency)
+        if (rollup_durations := config.get(confmap.database_rollup_durations)) is not None:
+            self.pgclient.set_rollup_durations(rollup_durations)
+        if activate_raw_insertion := config.get(confmap.activate_raw_insertion):
+            self.pgclient.toggle_raw_insertion(force=(activate_raw_insertion=="True"))
+
+        # Set the camera
+        if camera_source := config.get(confmap.camera_source):
+            self.counter.set_camera_source(camera_source)
+        if stream_quality := config.get(confmap.camera_stream_quality):
+            self.counter.streamer.set_quality(stream_quality)
+        if stream_width := config.get(confmap.camera_stream_width):
+            self.counter.streamer.set_width(stream_width)
 
         # Set the counting parameters
         if confidence := config.get(confmap.counting_confidence):
@@ -163,6 +260,38 @@ class Configuration:
             self.counter.set_delay(delay)
         if aggregated_frames_number := config.get(confmap.counting_aggregated_frames_number):
             self.counter.set_aggregated_frames_number(aggregated_frames_number)
+        if motion_heartbeat := config.get(confmap.counting_motion_heartbeat):
+            self.counter.set_motion_heartbeat(motion_heartbeat)
+        if roi := config.get(confmap.counting_roi):
+            self.counter.set_roi(tuple(roi.split(",")))
+        if roi_margin := config.get(confmap.counting_roi_margin):
+            self.counter.set_roi_margin(roi_margin)
+        model_name, model_format, model_imgsz = self.counter.requested_model
+        self.counter.set_model(
+            config.get(confmap.counting_model_name) or model_name,
+            config.get(confmap.counting_model_format) or model_format,
+            config.get(confmap.counting_model_imgsz) or model_imgsz,
+        )
+
+        # Set the video recording
+        if video_codec := config.get(confmap.video_codec):
+            self.counter.video_recorder.set_codec(video_codec)
+        if video_fps := config.get(confmap.video_fps):
+            self.counter.video_recorder.set_fps(video_fps)
+        if video_quality := config.get(confmap.video_quality):
+            self.counter.video_recorder.set_quality(video_quality)
+        if video_segment_duration := config.get(confmap.video_segment_duration):
+            self.counter.video_recorder.set_segment_duration(video_segment_duration)
+        if video_segment_size := config.get(confmap.video_segment_size):
+            self.counter.video_recorder.set_segment_size(video_segment_size)
+        if clip_pre_roll := config.get(confmap.clip_pre_roll):
+            self.counter.clip_recorder.set_pre_roll(clip_pre_roll)
+        if clip_post_roll := config.get(confmap.clip_post_roll):
+            self.counter.clip_recorder.set_post_roll(clip_post_roll)
+        if clip_max_age := config.get(confmap.clip_max_age):
+            self.counter.clip_recorder.set_max_age(clip_max_age)
+        if clip_max_size := config.get(confmap.clip_max_size):
+            self.counter.clip_recorder.set_max_size(clip_max_size)
 
         # Set modes
         # TODO: Convertions errors are not in toggle functions
@@ -175,6 +304,19 @@ class Configuration:
         if activate_insertion := config.get(confmap.activate_database_insertion):
             with suppress(ValueError):
                 self.pgclient.toggle_insertion(force=(activate_insertion=="True"))
+        if activate_adaptive_pacing := config.get(confmap.activate_adaptive_pacing):
+            self.counter.toggle_adaptive_pacing(force=(activate_adaptive_pacing=="True"))
+        if activate_resolution_shedding := config.get(confmap.activate_resolution_shedding):
+            self.counter.toggle_resolution_shedding(force=(activate_resolution_shedding=="True"))
+        if activate_motion_gating := config.get(confmap.activate_motion_gating):
+            self.counter.toggle_motion_gating(force=(activate_motion_gating=="True"))
+        if activate_auto_roi := config.get(confmap.activate_auto_roi):
+            self.counter.toggle_auto_roi(force=(activate_auto_roi=="True"))
+        if activate_video_hardware_acceleration := config.get(confmap.activate_video_hardware_acceleration):
+            self.counter.video_recorder.toggle_hardware_acceleration(
+                force=(activate_video_hardware_acceleration=="True"))
+        if activate_clip_recording := config.get(confmap.activate_clip_recording):
+            self.counter.toggle_clip_recording(force=(activate_clip_recording=="True"))
 
         # Set the crossing line
         if ((line_p1_x := config.get(confmap.counting_line_p1_x)) and
@@ -185,4 +327,11 @@ class Configuration:
             (line_p2_y := config.get(confmap.counting_line_p2_y))):
             self.counter.set_region_point_index((line_p2_x, line_p2_y), 1)
 
+        # Set the additional regions
+        if regions := config.get(confmap.counting_regions):
+            try:
+                self.counter.regions.load_list(json.loads(regions))
+            except (ValueError, AttributeError) as e:
+                logger.error(f"Failed to deserialize the regions: {e}")
+
         logger.info("Configuration applied!")
@@ -3,16 +3,32 @@ import time
 import logging
 import asyncio
 import cv2
+import numpy as np
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from cachetools import LRUCache
-from typing import Optional, TypedDict
-from shapely.geometry import LineString
+from typing import TYPE_CHECKING, Optional, TypedDict
+
+from .capture import Capture
+from .clips import ClipRecorder
+from .crossing import LineCrossing
+from .metrics import Metrics
+from .models import BACKENDS, load_model, warm_up_model
+from .pacing import AdaptivePacer
+from .pgclient import PGClient
+from .tables.detection import Detection
+from .recorder import VideoRecorder
+from .regions import RegionSet
+from .encoding import EncodedFrameCache
+from .stream import FrameStreamer
 
-from ultralytics import YOLO # type: ignore
-from ultralytics.engine.results import Results # type: ignore
-from ultralytics.utils.plotting import Annotator, colors # type: ignore
+# ultralytics (and torch) are imported with the model (see models.load_model)
+if TYPE_CHECKING:
+    from ultralytics import YOLO # type: ignore
+    from ultralytics.engine.results import Results # type: ignore
+    from ultralytics.utils.plotting import Annotator # type: ignore
 
-from .pgclient import PGClient
+    from .batching import InferenceBatcher
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -43,19 +59,72 @@ class Counter:
         self.aggregated_frames_number: int = 1
 
         # Detection model
-        self.model: Optional[YOLO] = None
-
-        # Camera
-        self.cap: Optional[cv2.VideoCapture] = None
+        self.model: Optional["YOLO"] = None
+
+        # Model name, format (see models.BACKENDS) and inference size of the running model
+        self.model_name: str = "yolo11n"
+        self.model_format: str = "ncnn"
+        self.model_imgsz: int = 640  # Default image size of the NCNN export
+
+        # Model loaded and warmed up in the background, switched between two frames.
+        # Its name, format and size are committed to the running ones at the switch.
+        self.next_model: Optional["YOLO"] = None
+        self.next_model_settings: Optional[tuple[str, str, int]] = None
+        self.model_swap_task: Optional[asyncio.Task] = None
+        self.model_exception: Exception = Exception()
+
+        # Dedicated thread for the blocking camera reads and inferences.
+        # The event loop only awaits the results, so the web and the pgclient
+        # keep running while a frame is inferred.
+        # One worker: the tracker state of the model is not thread safe.
+        self.inference_executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="inference")
+
+        # Batched inference shared with the counters of other cameras.
+        # If None, the counter runs its own inferences.
+        self.batcher: Optional["InferenceBatcher"] = None
+
+        # The frame of the current tick is about to be submitted to the batcher
+        # (the batcher doesn't wait for the counters without a pending frame)
+        self.frame_pending: bool = False
+
+        # Camera index, video file or stream url
+        # The capture thread continuously reads the camera into a ring of frames.
+        # The last frame is held by the counter until the next one is processed.
+        self.camera_source: int | str = 0
+        self.capture: Optional[Capture] = None
         self.last_frame: Optional[cv2.typing.MatLike] = None
+        self.last_frame_sequence: int = 0
+        self.last_frame_time: float = 0
+
+        # Number of the processed frames, incremented once the last frame is final
+        # (annotated): key of the encoded frames cache. Unlike the capture sequence,
+        # it is not reset with the camera.
+        self.frame_sequence: int = 0
+        self.frame_complete: bool = False
 
         # Line crossing
         # TODO: Init to the middle vertical line of the image automatically
         self.region = [(320, 0), (320, 480)]  # Half of 480x640
         # self.region = [(640, 0), (640, 720)]  # Half of 720x1280
 
+        # Precomputed geometry of the region, updated when the region changes
+        self.line_crossing = LineCrossing(self.region[0], self.region[1])
+
+        # Region of interest (x1, y1, x2, y2): only this window of the frame is inferred.
+        # Either set manually, or derived from the regions plus a margin (auto),
+        # else the whole frame is inferred.
+        self.roi: Optional[tuple[int, int, int, int]] = None
+        self.activate_auto_roi: bool = False
+        self.roi_margin: int = 100
+
+        # Additional named lines and polygons, each with its own counters.
+        # The counts of these regions are displayed but not inserted to the database.
+        self.regions: RegionSet = RegionSet()
+
         # Last inference and counting results
-        self.last_result: Optional[Results] = None
+        self.last_result: Optional["Results"] = None
 
         class Track(TypedDict):
             """
@@ -97,46 +166,140 @@ class Counter:
         # The greatest box id of all time
         self.greatest_id: int = 0
 
+        # Aggregated results to insert a new detection to the database
+        # Increment of one for each frame
+        self.aggregated_frame_count: int = 0
+        self.aggregated_people_image_count: int = 0
+        self.aggregated_in_count: int = 0
+        self.aggregated_out_count: int = 0
+
         # Time to sleep before the next inference.
         self.remaining_time: float = 0
 
+        # Frames scheduled on a fixed grid of [delay] seconds.
+        # If activated, shed the load (annotation, inference size) to hold the rate.
+        self.pacer: AdaptivePacer = AdaptivePacer()
+        self.activate_adaptive_pacing: bool = False
+
+        # Skip the inference of the frames without motion.
+        # Resume as soon as a motion is detected by the capture thread,
+        # or after [motion_hold_time] seconds to refresh static people.
+        self.activate_motion_gating: bool = False
+        self.motion_hold_time: float = 2
+        self.motion_heartbeat: float = 30
+        self.last_inference_time: float = 0
+        self.skipped_inferences: int = 0
+
         # The last frame is an annotated image with the results
         # instead of the original captured frame.
         self.activate_image_annotation: bool = False
-        self.annotator: Optional[Annotator] = None
+        self.annotator: Optional["Annotator"] = None
+
+        # Tracks of the last result (id, confidence, box, centroids), drawn with the regions
+        self.annotated_tracks: list[tuple[int, float, list[float], deque[tuple[int, int]]]] = []
 
         # Activate inference tracking and add the results to the buffer
         self.activate_counting: bool = False # Tracking disable at startup
 
-        # Save the frames in a video if enabled
+        # Duration of each stage of the frame processing
+        self.metrics: Metrics = Metrics()
+
+        # Save the frames in a video if enabled (written by a background thread)
         self.activate_video_writer: bool = False
-        self.video_writer: Optional[cv2.VideoWriter] = None
+        self.video_recorder: VideoRecorder = VideoRecorder(metrics=self.metrics)
+        self.video_recorder.set_frame_delay(self.delay)
+
+        # Record a short clip around each crossing of the line, instead of the whole video
+        self.activate_clip_recording: bool = False
+
+        # Encoded frames (last_frame, stream), encoded once for all the web clients
+        self.frame_cache: EncodedFrameCache = EncodedFrameCache(metrics=self.metrics)
+        self.streamer: FrameStreamer = FrameStreamer(frame_cache=self.frame_cache)
+        self.clip_recorder: ClipRecorder = ClipRecorder(frame_cache=self.frame_cache)
+
+        # Processed frames per second (inverse of the average frame interval)
+        self.fps: float = 0
+        self.last_detection_perf_time: float = 0
 
         # Debugging
         # TODO: Change name of last_exception
         self.last_exception: Exception = Exception()
 
     def toggle_counting(self, force: Optional[bool] = None) -> None:
+        was_counting = self.activate_counting
         self.activate_counting = force if force is not None else not self.activate_counting
         logger.info(f"Set activate_counting={self.activate_counting}")
 
+        # The time buckets being filled are inserted, not lost if the counter is stopped
+        if was_counting and not self.activate_counting:
+            self.pgclient.flush_rollups()
+
     def toggle_image_annotation(self, force: Optional[bool] = None) -> None:
         self.activate_image_annotation = force if force is not None else not self.activate_image_annotation
         logger.info(f"Set activate_image_annotation={self.activate_image_annotation}")
 
+    def toggle_adaptive_pacing(self, force: Optional[bool] = None) -> None:
+        self.activate_adaptive_pacing = force if force is not None else not self.activate_adaptive_pacing
+        logger.info(f"Set activate_adaptive_pacing={self.activate_adaptive_pacing}")
+
+    def toggle_resolution_shedding(self, force: Optional[bool] = None) -> None:
+        self.pacer.allow_resolution_shedding = force if force is not None else not self.pacer.allow_resolution_shedding
+        logger.info(f"Set allow_resolution_shedding={self.pacer.allow_resolution_shedding}")
+
+    def toggle_motion_gating(self, force: Optional[bool] = None) -> None:
+        self.activate_motion_gating = force if force is not None else not self.activate_motion_gating
+        logger.info(f"Set activate_motion_gating={self.activate_motion_gating}")
+
+    def set_motion_heartbeat(self, motion_heartbeat: float | str) -> bool:
+        try:
+            motion_heartbeat = float(motion_heartbeat)
+        except ValueError:
+            logger.error(f"Motion heartbeat is not float: motion_heartbeat={motion_heartbeat}")
+            return False
+
+        if motion_heartbeat < 0:
+            logger.error(f"Motion heartbeat must be positive: motion_heartbeat={motion_heartbeat}")
+            return False
+
+        self.motion_heartbeat = motion_heartbeat
+        logger.info(f"Set motion_heartbeat={motion_heartbeat}")
+        return True
+
+    def is_motion_gated(self, frame_time: float) -> bool:
+        """
+        Check if the inference of the frame can be skipped:
+        no motion for [motion_hold_time] seconds and the last inference
+        is more recent than [motion_heartbeat] seconds.
+        The tracker doesn't see the skipped frames, so its tracks don't age.
+        """
+        if not self.activate_motion_gating or self.capture is None:
+            return False
+        if frame_time - self.capture.last_motion_time < self.motion_hold_time:
+            return False
+        return frame_time - self.last_inference_time < self.motion_heartbeat
+
     def toggle_video_writer(self, force: Optional[bool] = None) -> None:
         # New value of activate video writer
         self.activate_video_writer = force if force is not None else not self.activate_video_writer
         logger.info(f"Set activate_video_writer={self.activate_video_writer}")
 
-        # Create a new video
+        # Start a new video, the frame size is the size of the first frame
         if self.activate_video_writer:
-            self.init_video_writer()
+            self.video_recorder.start()
+
+        # Write the queued frames and close the video
+        else:
+            self.video_recorder.stop()
+
+    def toggle_clip_recording(self, force: Optional[bool] = None) -> None:
+        self.activate_clip_recording = force if force is not None else not self.activate_clip_recording
+        logger.info(f"Set activate_clip_recording={self.activate_clip_recording}")
 
-        # Stop the active running video
-        elif self.video_writer is not None:
-            self.video_writer.release()
-            self.video_writer = None
+        # The clip being recorded is written when stopped
+        if self.activate_clip_recording:
+            self.clip_recorder.start()
+        else:
+            self.clip_recorder.stop()
 
     def set_region_point_index(self, point: tuple[int | str, int | str], index: int) -> bool:
         try:
@@ -148,9 +311,119 @@ class Counter:
             logger.error(f"Coordinates must be positive: point={point}")
             return False
         self.region[index] = point
+        self.line_crossing.set_line(self.region[0], self.region[1])
         logger.info(f"Set region point: point={point} index={index}")
         return True
 
+    def set_camera_source(self, camera_source: int | str) -> bool:
+        """
+        Set the camera index (integer) or the video file or stream url.
+        The capture is restarted with the new source.
+        """
+        if isinstance(camera_source, str):
+            camera_source = camera_source.strip()
+            if not camera_source:
+                logger.error("Camera source is empty")
+                return False
+            if camera_source.isdigit():
+                camera_source = int(camera_source)
+
+        if camera_source == self.camera_source:
+            return True
+
+        self.camera_source = camera_source
+        logger.info(f"Set camera_source={camera_source}")
+
+        # Stop the capture, the counter reopens the camera with the new source
+        if self.capture is not None:
+            self.capture.stop()
+        return True
+
+    def set_roi(self, roi: Optional[tuple[int | str, int | str, int | str, int | str]]) -> bool:
+        """
+        Set the region of interest (x1, y1, x2, y2), or None for the whole frame.
+        """
+        if roi is None:
+            self.roi = None
+            logger.info("Set roi=None")
+            return True
+
+        try:
+            x1, y1, x2, y2 = (int(value) for value in roi)
+        except ValueError as e:
+            logger.error(f"Conversion to int failure: {e}")
+            return False
+
+        if x1 < 0 or y1 < 0 or x2 <= x1 or y2 <= y1:
+            logger.error(f"ROI must be positive and not empty: roi={roi}")
+            return False
+
+        self.roi = (x1, y1, x2, y2)
+        logger.info(f"Set roi={self.roi}")
+        return True
+
+    def set_roi_margin(self, roi_margin: int | str) -> bool:
+        try:
+            roi_margin = int(roi_margin)
+        except ValueError:
+            logger.error(f"ROI margin not int: roi_margin={roi_margin}")
+            return False
+
+        if roi_margin < 0:
+            logger.error(f"ROI margin must be positive: roi_margin={roi_margin}")
+            return False
+
+        self.roi_margin = roi_margin
+        logger.info(f"Set roi_margin={roi_margin}")
+        return True
+
+    def toggle_auto_roi(self, force: Optional[bool] = None) -> None:
+        self.activate_auto_roi = force if force is not None else not self.activate_auto_roi
+        logger.info(f"Set activate_auto_roi={self.activate_auto_roi}")
+
+    def inference_roi(self, width: int, height: int) -> Optional[tuple[int, int, int, int]]:
+        """
+        Window of the frame to infer, clamped to the frame size.
+        :return: (x1, y1, x2, y2), or None to infer the whole frame.
+        """
+        if self.roi is not None:
+            x1, y1, x2, y2 = self.roi
+        elif self.activate_auto_roi:
+            # Bounding box of the crossing line and the additional regions plus the margin
+            points = list(self.region) + [point for region in self.regions for point in region.points]
+            x1 = min(x for x, _ in points) - self.roi_margin
+            y1 = min(y for _, y in points) - self.roi_margin
+            x2 = max(x for x, _ in points) + self.roi_margin
+            y2 = max(y for _, y in points) + self.roi_margin
+        else:
+            return None
+
+        x1, y1 = max(x1, 0), max(y1, 0)
+        x2, y2 = min(x2, width), min(y2, height)
+        if x2 <= x1 or y2 <= y1 or (x1, y1, x2, y2) == (0, 0, width, height):
+            return None
+        return x1, y1, x2, y2
+
+    @property
+    def dynamic_inference_size(self) -> bool:
+        """
+        The model infers at other sizes than its export size:
+        PyTorch models, or exports allowed by activate_resolution_shedding.
+        """
+        backend = BACKENDS.get(self.model_format)
+        return (backend is not None and backend.dynamic_size) or self.pacer.allow_resolution_shedding
+
+    def crop_roi(self, frame: cv2.typing.MatLike) -> tuple[cv2.typing.MatLike, tuple[int, int]]:
+        """
+        Crop the frame to the region of interest (a view, without copy).
+        :return: The image to infer and the offset (x, y) of its boxes in the frame.
+        """
+        roi = self.inference_roi(frame.shape[1], frame.shape[0])
+        if roi is None:
+            return frame, (0, 0)
+        x1, y1, x2, y2 = roi
+        return frame[y1:y2, x1:x2], (x1, y1)
+
     def set_confidence(self, confidence: float | str) -> bool:
         try:
             confidence = float(confidence)
@@ -178,6 +451,7 @@ class Counter:
             return False
 
         self.delay = delay
+        self.video_recorder.set_frame_delay(delay)
         logger.info(f"Set delay={delay}")
         return True
 
@@ -198,102 +472,182 @@ class Counter:
 
     def init_model(self) -> bool:
         """
-        Load the YOLO11 model.
+        Load the YOLO11 model and warm it up at the inference size.
+        The model is set only once warmed up: counting starts with a fast first frame.
         """
         try:
-            self.model = YOLO(
-                task="detect",
-                model="yolo11n_ncnn_model",
-                verbose=True,
-            )
-            logger.info("Model loaded")
+            model = load_model(self.model_name, self.model_format, self.model_imgsz)
+            with self.metrics.time("model_warm_up", "Warm-up of the model"):
+                warm_up_model(model, self.model_imgsz)
+            self.model = model
             return True
 
-        except Exception:
+        except Exception as e:
             self.model = None
+            self.model_exception = e
             logger.exception("Failed to load the model")
             return False
 
-    def init_camera(self) -> bool:
+    def set_model(self, model_name: str, model_format: str, model_imgsz: int | str) -> bool:
         """
-        Open the camera
+        Set the model. If a model is already loaded, the new one is loaded and
+        warmed up in the background, then switched without stopping the counting.
         """
-        camera_index = 0
-        self.cap = cv2.VideoCapture(camera_index)
-        # Set the camera resolution
-        # cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
-        # cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-        if not self.cap.isOpened():
-            logger.error(f"Camera index {camera_index} not opened")
-            # Don't forget to reset the capture to None
-            self.cap = None
+        try:
+            model_imgsz = int(model_imgsz)
+        except ValueError:
+            logger.error(f"Model imgsz not int: model_imgsz={model_imgsz}")
+            return False
+
+        if model_imgsz <= 0 or model_imgsz % 32:
+            logger.error(f"Model imgsz must be a positive multiple of 32: model_imgsz={model_imgsz}")
+            return False
+
+        if model_format not in BACKENDS:
+            logger.error(f"Model format must be in {list(BACKENDS)}: model_format={model_format}")
+            return False
+
+        if not model_name:
+            logger.error("Model name is empty")
             return False
 
-        logger.info(f"Camera index {camera_index} opened")
+        settings = (model_name, model_format, model_imgsz)
+        if settings == self.requested_model:
+            return True
+
+        # Not loaded yet: loaded by init_model() (or by the batcher at startup)
+        if self.model is None:
+            self.model_name, self.model_format, self.model_imgsz = settings
+            logger.info(f"Set model_name={model_name} model_format={model_format} model_imgsz={model_imgsz}")
+            return True
+
+        # The model shared by the batcher is loaded once at startup
+        if self.batcher is not None:
+            logger.error("The model is shared by the cameras, change the configuration file and restart")
+            return False
+
+        # Forget the model being loaded, if any
+        if self.model_swap_task is not None and not self.model_swap_task.done():
+            self.model_swap_task.cancel()
+        self.next_model = None
+        self.next_model_settings = None
+        if settings == (self.model_name, self.model_format, self.model_imgsz):
+            logger.info(f"Keep the running model {model_name} ({model_format}, imgsz={model_imgsz})")
+            return True
+
+        # Hot swap the running model
+        self.next_model_settings = settings
+        logger.info(f"Load model_name={model_name} model_format={model_format} model_imgsz={model_imgsz}")
+        self.model_swap_task = asyncio.create_task(self.swap_model(settings))
         return True
 
-    def init_video_writer(self) -> None:
+    @property
+    def requested_model(self) -> tuple[str, str, int]:
+        """
+        Name, format and size of the model being loaded, else of the running model.
+        """
+        return self.next_model_settings or (self.model_name, self.model_format, self.model_imgsz)
+
+    async def swap_model(self, settings: tuple[str, str, int]) -> None:
         """
-        Creat a new video writer
+        Load and warm up the model in a background thread,
+        then let the counting loop switch to it between two frames.
+        The running model is kept if the new one fails to load.
         """
-        if self.video_writer is not None:
-            self.video_writer.release()
-            # TODO: Add the name of the filename released
-            logger.info("Existing video writer release")
+        model_name, model_format, model_imgsz = settings
 
-        # The filename must be valid on Windows and Linux (':' doesn't work on Windows)
-        date: str = datetime.now().strftime('%Y_%m_%d-%H_%M_%S')
-        filename = f"video_writer/trafficount-{date}.mp4"
+        def load() -> "YOLO":
+            model = load_model(model_name, model_format, model_imgsz)
+            warm_up_model(model, model_imgsz)
+            return model
 
-        # The fps is the inverse of the delay
-        # INFO: If the counting is lagging behind, the video will accelerate
-        # TODO: If the delay is changed, the fps is not changed
-        fps = 1 / self.delay
+        try:
+            next_model = await asyncio.get_running_loop().run_in_executor(None, load)
+        except Exception as e:
+            self.model_exception = e
+            if self.next_model_settings == settings:
+                self.next_model_settings = None
+            logger.exception(f"Failed to load the new model, keep the running model {self.model_name} "
+                             f"({self.model_format}, imgsz={self.model_imgsz})")
+            return
+
+        # Ignore the model if the configuration changed meanwhile
+        if settings != self.next_model_settings:
+            return
 
-        self.video_writer = cv2.VideoWriter(
-            filename=filename,
-            fourcc=cv2.VideoWriter.fourcc(*"mp4v"),  # "m", "p", "4", "v"
-            fps=fps,
-            frameSize=(640, 480))  # (width, height)
-        logger.info(f"New video writer: filename={filename}, fps={fps}")
+        self.next_model = next_model
+        # Without counting, the loop may not run: switch now
+        if not self.activate_counting or self.capture is None:
+            self.switch_model()
 
-    def count_track_intersects_region(
+    def switch_model(self) -> None:
+        """
+        Switch to the model loaded in the background.
+        The tracks of the previous model are forgotten.
+        """
+        if self.next_model is None or self.next_model_settings is None:
+            return
+        self.model = self.next_model
+        self.model_name, self.model_format, self.model_imgsz = self.next_model_settings
+        self.next_model = None
+        self.next_model_settings = None
+        self.track_history.clear()
+        logger.info(f"Model switched to {self.model_name} ({self.model_format}, imgsz={self.model_imgsz})")
+
+    def init_camera(self) -> bool:
+        """
+        Open the camera and start its capture thread
+        """
+        capture = Capture(self.camera_source, metrics=self.metrics)
+        # Set the camera resolution
+        # cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+        # cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
+        if not capture.open():
+            logger.error(f"Camera {self.camera_source} not opened")
+            # Don't forget to reset the capture to None
+            self.capture = None
+            return False
+
+        self.capture = capture
+        logger.info(f"Camera {self.camera_source} opened")
+        return True
+
+    def count_tracks_intersect_region(
         self,
-        current_centroid: tuple[int, int],
-        previous_centroid: tuple[int, int],
-        track_id: int
+        track_ids: list[int],
+        previous_centroids: list[tuple[int, int]],
+        current_centroids: list[tuple[int, int]],
     ) -> None:
         """
-        Count if the track is entering (IN) or leaving (OUT) the region
+        Count if the tracks are entering (IN) or leaving (OUT) the region.
+        All the track segments of the frame are checked in one vectorized pass.
         """
-        # Don't count the track intersection twice
-        if self.track_history[track_id]["counted"]:
+        if not track_ids:
             return
 
         # Region is a Line but could be implemented as a polygon
-        line = LineString(self.region)
-        if line.intersects(LineString([previous_centroid, current_centroid])):
-
-            # Determine orientation of the region (vertical or horizontal)
-            if abs(self.region[0][0] - self.region[1][0]) < abs(self.region[0][1] - self.region[1][1]):
-
-                # Vertical region: Compare x-coordinates to determine direction
-                if current_centroid[0] > previous_centroid[0]:  # Moving right
-                    self.in_count += 1
-                else:  # Moving left
-                    self.out_count += 1
+        crossings = self.line_crossing.crossings(
+            np.array(previous_centroids),
+            np.array(current_centroids))
 
-            # Horizontal region: Compare y-coordinates to determine direction
-            elif current_centroid[1] > previous_centroid[1]:  # Moving downward
-                self.in_count += 1
-            else:  # Moving upward
-                self.out_count += 1
+        self.in_count += int(np.count_nonzero(crossings == LineCrossing.IN))
+        self.out_count += int(np.count_nonzero(crossings == LineCrossing.OUT))
 
+        # Don't count the track intersection twice
+        for track_id in np.array(track_ids)[crossings != 0].tolist():
             self.track_history[track_id]["counted"] = True
 
+        # Record a clip around the crossings
+        if self.activate_clip_recording:
+            crossing_time = self.last_frame_time or time.time()
+            for track_id, crossing in zip(track_ids, crossings.tolist()):
+                if crossing:
+                    self.clip_recorder.trigger(
+                        track_id, "in" if crossing == LineCrossing.IN else "out", crossing_time)
+
     def count(
         self,
-        model: YOLO,
+        model: "YOLO",
         frame: cv2.typing.MatLike,
     ) -> None:
         """
@@ -303,17 +657,53 @@ class Counter:
         :param model: The model to use for counting.
         :param frame: The initial frame to track (non annotated).
         """
+        # Only infer the region of interest
+        image, offset = self.crop_roi(frame)
+
+        # Reduced inference size if the pacer sheds the load
+        # or if the region of interest is smaller than the model size.
+        # The region of interest is inferred at its size if the model accepts
+        # other sizes (see dynamic_inference_size).
+        inference_size: dict[str, int] = {}
+        # The shedding never infers larger than the model size.
+        imgsz = (
+            min(self.model_imgsz, self.pacer.inference_size)
+            if self.pacer.inference_size is not None else self.model_imgsz)
+        if image is not frame and self.dynamic_inference_size:
+            roi_size = -(-max(image.shape[:2]) // 32) * 32  # Multiple of 32 (model stride)
+            imgsz = min(imgsz, roi_size) if imgsz is not None else roi_size
+        if imgsz is not None:
+            inference_size["imgsz"] = imgsz
+
+        start = time.perf_counter()
         results = model.track(
-            source=frame,
-            persist=True, # Do tracking by comparing with the result of the last frame
-            classes=[0], # Detect only persons
-            conf=self.confidence, # Confidence threshold
-            verbose=False, # Suppress inference messages
+                source=image,
+                persist=True, # Do tracking by comparing with the result of the last frame
+                classes=[0], # Detect only persons
+                conf=self.confidence, # Confidence threshold
+                verbose=False, # Suppress inference messages
             # imgsz=(1280, 736),  # Image size for infererence. Greater increase detection, increase time and reduce confidence
             # imgsz=(640, 480),  # Default image size (YOLO11n.pt)
             # imgsz=(640, 640),  # Image size for NCNN format. No detections with other resolutions
+            **inference_size,
         )
-        self.last_result = results[0]
+        duration = time.perf_counter() - start
+
+        # The tracker runs in the ultralytics callbacks: its duration is the part of
+        # model.track() not measured by the predictor (preprocess, inference, postprocess)
+        inference_duration = min(sum(results[0].speed.values()) / 1000, duration)
+        self.metrics.observe("inference", inference_duration, "Inference of a frame")
+        self.metrics.observe("tracking", duration - inference_duration, "Tracking of the detections")
+        self.process_result(results[0], offset)
+
+    def process_result(self, result: "Results", offset: tuple[int, int] = (0, 0)) -> None:
+        """
+        Count the people of the tracking result of the last frame.
+        :param offset: Position (x, y) of the inferred region of interest in the frame.
+            The boxes of the result are relative to the region of interest.
+        """
+        self.last_result = result
+        self.annotated_tracks = []
 
         track_ids: list[int] = []
         track_confidences: list[int] = []
@@ -329,6 +719,12 @@ class Counter:
             track_confidences = boxes.conf.float().cpu().tolist()
             track_boxes = boxes.xyxy.cpu().tolist()
 
+            # Map the boxes back to the full frame coordinates
+            if offset != (0, 0):
+                track_boxes = [
+                    [box[0] + offset[0], box[1] + offset[1], box[2] + offset[0], box[3] + offset[1]]
+                    for box in track_boxes]
+
         # Count the number of people on the image
         self.people_image_count = len(track_ids)
 
@@ -337,6 +733,16 @@ class Counter:
             self.greatest_id,
             max(track_ids, default=0)) # Use the default argument to prevent exception with the empty list
 
+        # Segments of the tracks to check for crossing the region
+        crossing_track_ids: list[int] = []
+        previous_centroids: list[tuple[int, int]] = []
+        current_centroids: list[tuple[int, int]] = []
+
+        # Segments of all the tracks for the additional regions
+        # The previous centroid of a new track is its current centroid.
+        segment_previous_centroids: list[tuple[int, int]] = []
+        segment_current_centroids: list[tuple[int, int]] = []
+
         # Counting for each track
         for track_id, track_confidence, track_box in zip(track_ids, track_confidences, track_boxes):
 
@@ -346,11 +752,64 @@ class Counter:
                 int((track_box[1] + track_box[3]) / 2))
 
             # Append the position to the history
-            track_line = self.track_history[track_id]["line"]
+            track = self.track_history[track_id]
+            track_line = track["line"]
             track_line.append(current_centroid)
 
-            # Annotate the track
-            if self.annotator is not None:
+            # Annotate the track (see display_tracks)
+            self.annotated_tracks.append((track_id, track_confidence, track_box, track_line))
+
+            segment_previous_centroids.append(track_line[-2] if len(track_line) >= 2 else current_centroid)
+            segment_current_centroids.append(current_centroid)
+
+            # If the track has only one point or is already counted skip counting
+            if len(track_line) < 2 or track["counted"]:
+                continue
+
+            # Add the last segment of the track
+            crossing_track_ids.append(track_id)
+            previous_centroids.append(track_line[-2])
+            current_centroids.append(current_centroid)
+
+        with self.metrics.time("crossing", "Crossing of the regions by the tracks"):
+            # Count interesection of the tracks with the region
+            self.count_tracks_intersect_region(
+                crossing_track_ids, previous_centroids, current_centroids)
+
+            # Count the tracks in the additional lines and polygons
+            self.regions.update(
+                track_ids,
+                segment_previous_centroids,
+                segment_current_centroids,
+                self.last_frame_time or time.time())
+
+    def annotate_frame(self, frame: cv2.typing.MatLike) -> None:
+        """
+        Draw the tracks, the regions and the total counts on the frame
+        if the annotation is enabled, in one annotation span.
+        """
+        if not (self.activate_image_annotation and self.pacer.annotation_enabled):
+            self.annotator = None
+            return
+
+        # Imported with the model
+        from ultralytics.utils.plotting import Annotator # type: ignore
+
+        with self.metrics.time("annotation", "Annotation of the frame"):
+            self.annotator = Annotator(frame, line_width=2)
+            self.display_tracks()
+            self.display_region()
+            self.display_total_counts()
+
+    def display_tracks(self) -> None:
+        """
+        Display the boxes and the centroids of the tracks of the last result if the annotator is not None
+        """
+        # Imported with the model
+        from ultralytics.utils.plotting import colors # type: ignore
+
+        if self.annotator is not None:
+            for track_id, track_confidence, track_box, track_line in self.annotated_tracks:
                 track_color = colors(int(track_id), True)  # A different color for each id
                 self.annotator.box_label(
                     track_box,
@@ -358,27 +817,33 @@ class Counter:
                     color=track_color)
                 self.annotator.draw_centroid_and_tracks(track_line, color=track_color)
 
-            # If the track has only one point skip counting
-            if len(track_line) < 2:
-                continue
-
-            # Count interesection of the track with the region
-            previous_centroid = track_line[-2]
-            self.count_track_intersects_region(current_centroid, previous_centroid, track_id)
-
-            # TODO: Count if centroid is in region (instead of counting in all the image)
-            # count_track_in_region()
-
     def display_region(self) -> None:
         """
         Display the crossing region on the last frame if the annotator is not None
         """
         if self.annotator is not None:
+            # Draw the inferred region of interest
+            if self.last_frame is not None and (
+                roi := self.inference_roi(self.last_frame.shape[1], self.last_frame.shape[0])
+            ) is not None:
+                x1, y1, x2, y2 = roi
+                self.annotator.draw_region(
+                    reg_pts=[(x1, y1), (x2, y1), (x2, y2), (x1, y2)],
+                    color=(0, 255, 255),
+                    thickness=1)
+
             self.annotator.draw_region(
                 reg_pts=self.region,
                 color=(255, 0, 255),
                 thickness=4)  # Draw the region
 
+            # Draw the additional regions
+            for region in self.regions:
+                self.annotator.draw_region(
+                    reg_pts=region.points,
+                    color=(255, 255, 0),
+                    thickness=2)
+
     def display_total_counts(self) -> None:
         """
         Display total objects count on the last frame if the annotator is not None
@@ -394,113 +859,195 @@ class Counter:
                 bg_color=(255, 255, 255),
                 margin=10)
 
+    def aggregate_results(self, detection_time: Optional[datetime] = None) -> Optional[Detection]:
+        """
+        Aggregate the counting results of the last frame.
+        Insert a detection to the buffer each [aggregated_frames_number] frames.
+        :param detection_time: Time of the frame (now if None).
+        :return: The inserted detection, else None.
+        """
+        detection: Optional[Detection] = None
+
+        # If counting, aggregate the results and insert it to the database
+        if self.activate_counting:
+
+            # Aggregate the last counting results
+            self.aggregated_people_image_count = max(
+                self.aggregated_people_image_count, self.people_image_count)
+            self.aggregated_in_count += self.in_count
+            self.aggregated_out_count += self.out_count
+
+            # Insert only if the frame count is 0
+            if self.aggregated_frame_count == 0:
+                detection = self.pgclient.insert_detection(
+                    self.aggregated_people_image_count,
+                    self.aggregated_in_count,
+                    self.aggregated_out_count,
+                    detection_time)
+
+                # Duration between two detections
+                now = time.perf_counter()
+                if self.last_detection_perf_time:
+                    self.metrics.observe(
+                        "detection_interval", now - self.last_detection_perf_time,
+                        "Duration between two detections")
+                self.last_detection_perf_time = now
+
+        # Increment the frame count in each loop
+        self.aggregated_frame_count = (self.aggregated_frame_count + 1) % max(self.aggregated_frames_number, 1)
+        if self.aggregated_frame_count == 0:
+            # Reset the aggregates to 0 at each first frame
+            self.aggregated_people_image_count = 0
+            self.aggregated_in_count = 0
+            self.aggregated_out_count = 0
+
+        # Save the total in and out count locally.
+        self.total_in_count += self.in_count
+        self.total_out_count += self.out_count
+
+        # Reset the in and out count for each frame.
+        self.in_count = 0
+        self.out_count = 0
+
+        return detection
+
     async def do_tracking(self) -> None:
         """
         Do tracking until error
         """
         # TODO: Move the checkings inside the loop for dynamic camera or models?
-        if self.cap is None or self.model is None:
+        if self.capture is None or self.model is None:
             logger.error("Can't do tracking if the capture device or the model are None")
             return
 
         # Time of the last frame read
         start_time: float = time.time() # Initialization to now
+        loop_start_time: float = start_time
+        self.pacer.reset(start_time)
 
-        # Increment of one for each frame
-        frame_count: int = 0
-
-        # Aggregated results to insert a new detection to the database
-        aggregated_people_image_count: int = 0
-        aggregated_in_count: int = 0
-        aggregated_out_count: int = 0
+        # Executor threads are awaited from the running loop
+        loop = asyncio.get_running_loop()
 
         # Loop through the video frames
         # TODO: Add a condition to stop looping
-        while self.cap.isOpened():
+        while self.capture.is_running:
 
             # Sleep at least once for the other coroutines to execute.
             await asyncio.sleep(0.001)
 
             # Calculate the remaining_time:
-            # - Each loop should be executed in [delay] seconds.
+            # - Each loop starts on a grid of [delay] seconds.
             # - If it lasts less than [delay], we sleep [remaning_time] seconds.
-            # - If it lasts more than [delay], we print a warning.
-            self.remaining_time = (start_time + self.delay) - time.time()
-            if self.remaining_time > 0:
+            # - If it lasts more than [delay], we print a warning and skip the missed ticks.
+            self.remaining_time, _ = self.pacer.wait_time(time.time(), self.delay)
+            if self.remaining_time >= 0:
                 await asyncio.sleep(self.remaining_time)
             else:
                 logger.warning(f"Image processing is lagging behind of {self.remaining_time} second")
 
+            # Duration between two processed frames
+            if start_time != loop_start_time:
+                frame_interval = self.metrics.histogram("frame_interval", "Duration between two processed frames")
+                frame_interval.observe(time.time() - start_time)
+                self.fps = 1 / frame_interval.average if frame_interval.average else 0
+
             start_time = time.time()
 
-            # Read a frame from the video
-            success, frame = self.cap.read()
-            if not success:
+            # Switch to the model loaded in the background, between two inferences
+            if self.next_model is not None:
+                self.switch_model()
+
+            # Until its frame is submitted or skipped, the batcher waits for this counter
+            self.frame_pending = self.activate_counting and self.batcher is not None
+
+            # Hold the latest captured frame (waiting if no new frame is available)
+            # Frames captured meanwhile are skipped: the latest frame wins.
+            sequence, frame_time, frame = await loop.run_in_executor(
+                None, self.capture.acquire, self.last_frame_sequence, 10)
+            if frame is None:
                 # Break the loop if the camera is disconnected
+                self.frame_pending = False
                 logger.error("Can't get next frame. Exit tracking...")
                 break
+
+            # Release the previous frame to the capture ring
+            self.capture.release_frame(self.last_frame_sequence)
             self.last_frame = frame
-            self.annotator = Annotator(frame, line_width=2) if self.activate_image_annotation else None
+            self.last_frame_sequence = sequence
+            self.last_frame_time = frame_time
+            self.frame_complete = False
 
-            # Count the number of people on the original frame
-            if self.activate_counting:
-                self.count(self.model, frame)
+            # Only the tracks of this frame are drawn
+            self.annotated_tracks = []
 
-            # Display the region after counting
-            self.display_region()
+            # Motion detection is done by the capture thread
+            self.capture.activate_motion_detection = self.activate_motion_gating
 
-            # If counting, aggregate the results and insert it to the database
-            if self.activate_counting:
-
-                # Aggregate the last counting results
-                aggregated_people_image_count = max(
-                    aggregated_people_image_count, self.people_image_count)
-                aggregated_in_count += self.in_count
-                aggregated_out_count += self.out_count
-
-                # Insert only if the frame count is 0
-                if frame_count == 0:
-                    self.pgclient.insert_detection(
-                        aggregated_people_image_count,
-                        aggregated_in_count,
-                        aggregated_out_count)
-
-            # Increment the frame count in each loop
-            frame_count = (frame_count + 1) % max(self.aggregated_frames_number, 1)
-            if frame_count == 0:
-                # Reset the aggregates to 0 at each first frame
-                aggregated_people_image_count = 0
-                aggregated_in_count = 0
-                aggregated_out_count = 0
-
-            # Save the total in and out count locally.
-            self.total_in_count += self.in_count
-            self.total_out_count += self.out_count
-
-            # Reset the in and out count for each frame.
-            self.in_count = 0
-            self.out_count = 0
-
-            # Display the total in and out counts on the frame
-            self.display_total_counts()
+            # Count the number of people on the original frame
+            # The inference runs in the executor thread, the event loop is free meanwhile.
+            # Without motion, the last people count is kept and nobody crosses the line.
+            if self.activate_counting and self.is_motion_gated(frame_time):
+                self.frame_pending = False
+                self.skipped_inferences += 1
+            elif self.activate_counting:
+                self.last_inference_time = frame_time
+                if self.batcher is not None:
+                    # Batched with the frames of the other cameras
+                    image, offset = self.crop_roi(frame)
+                    try:
+                        result = await self.batcher.track(self, image)
+                    except Exception:
+                        # Only this frame is not counted, the other cameras go on
+                        logger.exception("Batched inference failed, frame not counted")
+                        result = None
+                    finally:
+                        self.frame_pending = False
+                    if result is not None:
+                        await loop.run_in_executor(self.inference_executor, self.process_result, result, offset)
+                else:
+                    await loop.run_in_executor(self.inference_executor, self.count, self.model, frame)
+
+            # Aggregate the results and insert them to the database
+            # The detection time is the capture time of the frame
+            self.aggregate_results(datetime.fromtimestamp(frame_time))
+
+            # Display the tracks, the regions and the total in and out counts on the frame
+            self.annotate_frame(frame)
+
+            # The frame is final, stream it to the web clients, if any
+            self.frame_sequence += 1
+            self.frame_complete = True
+            if self.last_frame is not None:
+                self.streamer.publish(self.last_frame, self.frame_sequence)
+
+            # Keep the frame for the clips of the crossings
+            if self.activate_clip_recording and self.last_frame is not None:
+                self.clip_recorder.add_frame(self.last_frame, self.frame_sequence, frame_time)
 
             # Save the frame if frame saving is activated
-            if self.activate_video_writer:
-                if self.video_writer is not None:
-                    self.video_writer.write(self.last_frame)
+            # The recorder repeats the frame for the skipped ticks, from the capture times
+            if self.activate_video_writer and self.last_frame is not None:
+                self.video_recorder.write(self.last_frame, frame_time)
+
+            # Adapt the load to the processing time of the frame
+            self.pacer.update(time.time() - start_time, self.delay, self.activate_adaptive_pacing)
 
     def free_camera(self):
         # Release the video capture object and close the display window
-        self.cap.release()
-        self.cap = None
+        if self.capture is not None:
+            self.capture.release()
+        self.capture = None
+        self.last_frame_sequence = 0
         cv2.destroyAllWindows()
         logger.info("Video capture released")
 
     async def start_counter(self):
         """
         """
-        # Init the model at startup
-        self.init_model()
+        # Load and warm up the model at startup (unless shared by a batcher)
+        # in the executor: the web interface is available meanwhile.
+        if self.model is None and self.batcher is None:
+            await asyncio.get_running_loop().run_in_executor(self.inference_executor, self.init_model)
 
         logger.info("Counter daemon started")
         # Retry if a camera or tracking error occured
@@ -512,7 +1059,7 @@ class Counter:
                 continue
 
             # Init the camera
-            if self.cap is None and not self.init_camera():
+            if self.capture is None and not self.init_camera():
                 await asyncio.sleep(60)
                 continue
 
@@ -520,7 +1067,7 @@ class Counter:
             await self.do_tracking()
 
             # Free the camera
-            if self.cap is not None:
+            if self.capture is not None:
                 self.free_camera()
 
             # Retry in 10 seconds
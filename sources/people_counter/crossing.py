@@ -0,0 +1,79 @@
+import numpy as np
+import numpy.typing as npt
+
+
+class LineCrossing:
+    """
+    Vectorized crossing of a line by the segments of all the tracks of a frame.
+
+    The line geometry is precomputed once when the line changes.
+    The direction is given by the signed side of the track points
+    (cross product with the line direction). As before, it does not depend
+    on the order of the line points:
+    - IN: moving right across a vertical line (|dx| < |dy|),
+      moving downward across a horizontal line.
+    - OUT: the track moves in the opposite direction.
+    """
+
+    IN = 1
+    OUT = -1
+
+    def __init__(self, start: tuple[int, int], end: tuple[int, int]) -> None:
+        self.start: npt.NDArray[np.float64] = np.zeros(2)
+        self.end: npt.NDArray[np.float64] = np.zeros(2)
+        self.direction: npt.NDArray[np.float64] = np.zeros(2)
+        self.set_line(start, end)
+
+    def set_line(self, start: tuple[int, int], end: tuple[int, int]) -> None:
+        """
+        Precompute the line geometry.
+        The line is oriented so that its normal (dy, -dx) points to the IN side:
+        downward if vertical, from right to left if horizontal.
+        """
+        self.start = np.asarray(start, dtype=np.float64)
+        self.end = np.asarray(end, dtype=np.float64)
+        dx, dy = self.end - self.start
+        if (dy < 0) if abs(dx) < abs(dy) else (dx > 0):
+            self.start, self.end = self.end, self.start
+        self.direction = self.end - self.start
+
+    def side(self, points: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
+        """
+        Signed side of the points (N, 2) relatively to the line.
+        Negative on the IN side, positive on the OUT side, 0 on the line.
+        """
+        relative = points - self.start
+        return self.direction[0] * relative[:, 1] - self.direction[1] * relative[:, 0]
+
+    def crossings(
+        self,
+        previous: npt.NDArray[np.float64],
+        current: npt.NDArray[np.float64],
+    ) -> npt.NDArray[np.int8]:
+        """
+        Compute the crossings of the line by the track segments in one pass.
+        :param previous: Previous centroids of the tracks (N, 2).
+        :param current: Current centroids of the tracks (N, 2).
+        :return: For each track, IN (1), OUT (-1) or 0 if the line is not crossed.
+        """
+        previous = np.asarray(previous, dtype=np.float64).reshape(-1, 2)
+        current = np.asarray(current, dtype=np.float64).reshape(-1, 2)
+
+        # The track points are on both sides of the line (or on it)
+        previous_side = self.side(previous)
+        current_side = self.side(current)
+        straddle_line = previous_side * current_side <= 0
+
+        # The line points are on both sides of the track segments (or on them)
+        motion = current - previous
+        start_relative = self.start - previous
+        end_relative = self.end - previous
+        start_side = motion[:, 0] * start_relative[:, 1] - motion[:, 1] * start_relative[:, 0]
+        end_side = motion[:, 0] * end_relative[:, 1] - motion[:, 1] * end_relative[:, 0]
+        straddle_track = start_side * end_side <= 0
+
+        # A track moving along the line or not moving doesn't cross it
+        delta = current_side - previous_side
+        crossed = straddle_line & straddle_track & (delta != 0)
+
+        return np.where(crossed, np.where(delta < 0, self.IN, self.OUT), 0).astype(np.int8)
@@ -0,0 +1,84 @@
+import threading
+import time
+from typing import Optional
+
+import cv2
+from cachetools import LRUCache
+
+from .metrics import Metrics
+
+
+# Encoding parameters of the image formats
+IMAGE_FORMATS: dict[str, tuple[str, int]] = {
+    "jpg": (".jpg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY),
+}
+
+# Key of an encoded frame: (frame sequence, format, quality, width)
+FrameKey = tuple[int, str, int, int]
+
+
+def encode_frame(frame: cv2.typing.MatLike, image_format: str = "jpg", quality: int = 95, width: int = 0) -> Optional[bytes]:
+    """
+    Downscale the frame to [width] pixels if wider (0 for the original size)
+    and encode it.
+    :return: The encoded bytes, None if the encoding failed
+    """
+    extension, quality_flag = IMAGE_FORMATS[image_format]
+    if width and frame.shape[1] > width:
+        height = max(int(frame.shape[0] * width / frame.shape[1]), 1)
+        frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+    success, image = cv2.imencode(extension, frame, [quality_flag, quality])
+    return image.tobytes() if success else None
+
+
+class EncodedFrameCache:
+    """
+    Encoded frames of the last processed frames, keyed by
+    (frame sequence, format, quality, width).
+
+    The same frame requested again with the same parameters (last_frame,
+    stream, snapshots) is served without encoding it again. The sequence
+    number of the frame must change whenever the frame changes.
+    Shared by the event loop and the stream thread.
+    """
+
+    def __init__(self, maxsize: int = 16, metrics: Optional[Metrics] = None) -> None:
+        self.frames: LRUCache[FrameKey, bytes] = LRUCache(maxsize=maxsize)
+        self.lock = threading.Lock()
+
+        # Duration of the encodes (cache misses)
+        self.metrics: Metrics = metrics if metrics is not None else Metrics()
+        self.hit_count: int = 0
+        self.miss_count: int = 0
+
+        # Distinguish the ETags of two runs, the sequence numbers restart at 0
+        self.instance: str = f"{time.time_ns():x}"
+
+    def etag(self, key: FrameKey) -> str:
+        sequence, image_format, quality, width = key
+        return f'"{self.instance}-{sequence}-{quality}-{width}.{image_format}"'
+
+    def get(self, key: FrameKey) -> Optional[bytes]:
+        with self.lock:
+            image = self.frames.get(key)
+            if image is not None:
+                self.hit_count += 1
+            return image
+
+    def encode(self, frame: cv2.typing.MatLike, key: FrameKey, store: bool = True) -> Optional[bytes]:
+        """
+        Return the encoded frame from the cache, or encode it.
+        :param store: Keep the encoded frame (False if the frame is not final yet).
+        """
+        if (image := self.get(key)) is not None:
+            return image
+
+        _, image_format, quality, width = key
+        with self.metrics.time("encode", "Encode of a frame (cache miss)"):
+            image = encode_frame(frame, image_format, quality, width)
+        with self.lock:
+            self.miss_count += 1
+            if image is not None and store:
+                self.frames[key] = image
+        return image
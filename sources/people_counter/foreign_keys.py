@@ -0,0 +1,107 @@
+import asyncio
+import json
+import logging
+from pathlib import Path
+from typing import Optional
+
+from postgrest import AsyncPostgrestClient
+
+from .tables.foreign_key import ForeignKey
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+class ForeignKeyResolver:
+    """
+    Resolve the foreign ids of the detections (device, location, resolution).
+
+    The ids are retrieved concurrently, kept [ttl] seconds, and saved in a
+    local JSON file: after a restart without network, the detections are
+    inserted with the saved ids once the database is reachable.
+    The missing rows are inserted only if [insert_missing] is set (opt-in:
+    the reference tables are shared by all the devices).
+    """
+
+    def __init__(
+        self,
+        cache_path: Optional[str | Path] = None,
+        ttl: float = 3600,
+        insert_missing: bool = False,
+    ) -> None:
+        # Local JSON file of the ids: {table name: {row label: id}}
+        self.cache_path: Optional[Path] = Path(cache_path) if cache_path is not None else None
+        self.ids: dict[str, dict[str, int]] = self.load()
+
+        # Duration before retrieving an id again (the row may be changed in the database)
+        self.ttl: float = ttl
+
+        # Insert the device, location or resolution if not found
+        self.insert_missing: bool = insert_missing
+
+    def load(self) -> dict[str, dict[str, int]]:
+        if self.cache_path is None or not self.cache_path.exists():
+            return {}
+        try:
+            with open(self.cache_path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to read the ids from {self.cache_path}: {e}")
+            return {}
+
+    def save(self) -> None:
+        if self.cache_path is None:
+            return
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            temporary_path = self.cache_path.with_suffix(".tmp")
+            with open(temporary_path, "w") as f:
+                json.dump(self.ids, f, indent=2)
+            temporary_path.replace(self.cache_path)
+        except OSError as e:
+            logger.error(f"Failed to save the ids to {self.cache_path}: {e}")
+
+    def restore(self, foreign_key: ForeignKey) -> None:
+        """
+        Set the saved id of the row, if any. The id is expired:
+        it is retrieved again at the first insertion, and used if the database is unreachable.
+        """
+        if saved_id := self.ids.get(foreign_key.table_name, {}).get(foreign_key.label):
+            foreign_key.id = saved_id
+            foreign_key.retrieval_time = None
+
+    def invalidate(self, foreign_keys: list[ForeignKey]) -> None:
+        """
+        Forget the ids (refused by the database): they are retrieved at the next insertion.
+        """
+        for foreign_key in foreign_keys:
+            foreign_key.invalidate()
+            self.ids.get(foreign_key.table_name, {}).pop(foreign_key.label, None)
+        self.save()
+        logger.info("Foreign ids invalidated")
+
+    async def resolve(self, postgrest_client: AsyncPostgrestClient, foreign_keys: list[ForeignKey]) -> bool:
+        """
+        Retrieve the expired or missing ids concurrently.
+        :return: True if all the ids are known, else False
+        """
+        expired = [foreign_key for foreign_key in foreign_keys if foreign_key.is_expired(self.ttl)]
+        if not expired:
+            return True
+
+        await asyncio.gather(*(
+            foreign_key.retrieve_id(postgrest_client, self.ttl, self.insert_missing)
+            for foreign_key in expired))
+
+        # Save the new ids
+        changed = False
+        for foreign_key in expired:
+            table_ids = self.ids.setdefault(foreign_key.table_name, {})
+            if foreign_key.id and table_ids.get(foreign_key.label) != foreign_key.id:
+                table_ids[foreign_key.label] = foreign_key.id
+                changed = True
+        if changed:
+            self.save()
+
+        return all(foreign_key.id for foreign_key in foreign_keys)
@@ -0,0 +1,122 @@
+import bisect
+import threading
+import time
+from contextlib import AbstractContextManager, contextmanager
+from typing import Iterator
+
+
+# Buckets of the durations in seconds, from 1 ms to 10 s
+DURATION_BUCKETS: tuple[float, ...] = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram:
+    """
+    Lightweight histogram of durations with fixed buckets (Prometheus like).
+    Observing a value is one bisection and a few additions.
+    """
+
+    def __init__(self, name: str, description: str, buckets: tuple[float, ...] = DURATION_BUCKETS) -> None:
+        self.name: str = name
+        self.description: str = description
+        self.buckets: tuple[float, ...] = buckets
+
+        # Non cumulative counts, the last one is for +Inf
+        self.counts: list[int] = [0] * (len(buckets) + 1)
+        self.sum: float = 0
+        self.count: int = 0
+
+        # Last observed value and its exponential moving average
+        self.last: float = 0
+        self.average: float = 0
+
+        self.lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self.lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+            self.last = value
+            self.average = 0.9 * self.average + 0.1 * value if self.count > 1 else value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        """
+        Observe the duration of the block.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def quantile(self, q: float) -> float:
+        """
+        Approximate quantile: upper bound of the bucket containing it.
+        """
+        with self.lock:
+            if not self.count:
+                return 0
+            rank = q * self.count
+            cumulative = 0
+            for bound, count in zip(self.buckets, self.counts):
+                cumulative += count
+                if cumulative >= rank:
+                    return bound
+            return float("inf")
+
+    def to_prometheus(self, prefix: str) -> list[str]:
+        name = f"{prefix}_{self.name}_seconds"
+        lines = [
+            f"# HELP {name} {self.description}",
+            f"# TYPE {name} histogram",
+        ]
+        with self.lock:
+            cumulative = 0
+            for bound, count in zip(self.buckets, self.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{le="+Inf"}} {self.count}')
+            lines.append(f"{name}_sum {self.sum}")
+            lines.append(f"{name}_count {self.count}")
+        return lines
+
+
+class Metrics:
+    """
+    Registry of the histograms of the hot path stages.
+    """
+
+    def __init__(self) -> None:
+        self.histograms: dict[str, Histogram] = {}
+
+    def histogram(self, name: str, description: str = "") -> Histogram:
+        """
+        Return the histogram, created at the first call.
+        """
+        if (histogram := self.histograms.get(name)) is None:
+            histogram = self.histograms[name] = Histogram(name, description or name)
+        return histogram
+
+    def time(self, name: str, description: str = "") -> AbstractContextManager[None]:
+        return self.histogram(name, description).time()
+
+    def observe(self, name: str, value: float, description: str = "") -> None:
+        self.histogram(name, description).observe(value)
+
+    def to_prometheus(self, prefix: str = "trafficount") -> list[str]:
+        return [line for histogram in self.histograms.values() for line in histogram.to_prometheus(prefix)]
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        """
+        Average and approximate p50/p99 of each stage in milliseconds.
+        """
+        return {
+            name: {
+                "average_ms": round(histogram.average * 1000, 3),
+                "p50_ms": round(histogram.quantile(0.5) * 1000, 3),
+                "p99_ms": round(histogram.quantile(0.99) * 1000, 3),
+                "count": histogram.count,
+            } for name, histogram in self.histograms.items()
+        }
@@ -0,0 +1,148 @@
+import logging
+import os
+import shutil
+from importlib import metadata
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+# ultralytics (and torch) are imported when the model is loaded,
+# the web interface starts without waiting for these heavy imports.
+if TYPE_CHECKING:
+    from ultralytics import YOLO # type: ignore
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+class ModelBackend:
+    """
+    Model format of ultralytics: the suffix of the exported model
+    and the arguments of the export.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        suffix: str,
+        export_format: str = "",
+        dynamic_size: bool = False,
+        batched: bool = False,
+    ) -> None:
+        self.name: str = name
+
+        # Path of the model: model name + suffix (ex: yolo11n_ncnn_model)
+        self.suffix: str = suffix
+
+        # Format given to model.export(), empty if the model is not exported
+        self.export_format: str = export_format
+
+        # The model infers at other sizes than its export size
+        self.dynamic_size: bool = dynamic_size
+
+        # The model infers a batch of several images at once
+        # (the NCNN backend only infers the first image, the exports have a static batch size of 1)
+        self.batched: bool = batched
+
+    def model_path(self, model_name: str) -> str:
+        return f"{model_name}{self.suffix}"
+
+
+# Registry of the supported backends (CPU exports)
+BACKENDS: dict[str, ModelBackend] = {}
+
+
+def register_backend(backend: ModelBackend) -> None:
+    BACKENDS[backend.name] = backend
+
+
+register_backend(ModelBackend("pytorch", ".pt", dynamic_size=True, batched=True))
+register_backend(ModelBackend("ncnn", "_ncnn_model", "ncnn"))
+register_backend(ModelBackend("onnx", ".onnx", "onnx"))
+register_backend(ModelBackend("openvino", "_openvino_model", "openvino"))
+
+
+# Directory of the exported models
+MODEL_CACHE_DIR = Path(os.environ.get("MODEL_CACHE_DIR", "model_cache"))
+
+
+def ultralytics_version() -> str:
+    """
+    Version of the installed ultralytics package, without importing it.
+    """
+    try:
+        return metadata.version("ultralytics")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def cached_model_path(model_name: str, model_format: str, imgsz: int) -> Path:
+    """
+    Path of the export in the cache, keyed by model name, format, imgsz and ultralytics version.
+    The exports don't depend on the CPU: an export of the Docker build is used on the device.
+    """
+    backend = BACKENDS[model_format]
+    key = f"{model_name}-{model_format}-{imgsz}-ultralytics{ultralytics_version()}"
+    return MODEL_CACHE_DIR / key / backend.model_path(model_name)
+
+
+def export_model(model_name: str, model_format: str, imgsz: int) -> Path:
+    """
+    Export the PyTorch model (downloaded if needed) to the backend format in the cache.
+    """
+    from ultralytics import YOLO # type: ignore
+
+    backend = BACKENDS[model_format]
+    model_path = cached_model_path(model_name, model_format, imgsz)
+    logger.info(f"Export {model_name} to {model_format} with imgsz={imgsz}")
+
+    # The export is written next to the weights: export a copy in a temporary
+    # directory, then move it to the cache (a crash never leaves a partial export).
+    build_dir = model_path.parent.with_name(model_path.parent.name + ".tmp")
+    shutil.rmtree(build_dir, ignore_errors=True)
+    build_dir.mkdir(parents=True)
+    try:
+        weights = Path(YOLO(f"{model_name}.pt").ckpt_path)
+        shutil.copy(weights, build_dir / weights.name)
+        YOLO(build_dir / weights.name).export(format=backend.export_format, imgsz=imgsz)
+        (build_dir / weights.name).unlink()
+        shutil.rmtree(model_path.parent, ignore_errors=True)
+        build_dir.rename(model_path.parent)
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
+    return model_path
+
+
+def load_model(model_name: str, model_format: str, imgsz: int) -> "YOLO":
+    """
+    Load the model in the given format, exported from the PyTorch model if not cached.
+    :param model_name: Name of the model (ex: yolo11n, yolo11s).
+    :param model_format: Name of a registered backend (ex: ncnn).
+    :param imgsz: Inference size of the export.
+    :raise KeyError: If the backend is not registered.
+    """
+    from ultralytics import YOLO # type: ignore
+
+    backend = BACKENDS[model_format]
+    if backend.export_format:
+        model_path = cached_model_path(model_name, model_format, imgsz)
+        if not model_path.exists():
+            model_path = export_model(model_name, model_format, imgsz)
+    else:
+        model_path = Path(backend.model_path(model_name))
+
+    model = YOLO(task="detect", model=str(model_path), verbose=True)
+    logger.info(f"Model loaded: {model_path}")
+    return model
+
+
+def warm_up_model(model: "YOLO", imgsz: int, iterations: int = 2) -> None:
+    """
+    Run dummy inferences to pay the graph build and allocation costs
+    before the first real frame.
+    """
+    dummy = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+    for _ in range(iterations):
+        model.predict(source=dummy, imgsz=imgsz, classes=[0], verbose=False)
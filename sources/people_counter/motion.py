@@ -0,0 +1,61 @@
+from typing import Optional
+
+import cv2
+import numpy as np
+
+
+class MotionDetector:
+    """
+    Cheap motion detection by differencing downscaled grayscale frames.
+
+    The frame is downscaled to [width] pixels, blurred, and compared with a
+    running average of the previous frames (the background). There is motion
+    if the ratio of changed pixels is greater than [min_area].
+    """
+
+    def __init__(
+        self,
+        width: int = 160,
+        threshold: int = 25,
+        min_area: float = 0.002,
+        learning_rate: float = 0.2,
+    ) -> None:
+        # Width of the downscaled frame
+        self.width: int = width
+
+        # Minimum difference of a pixel with the background (0-255)
+        self.threshold: int = threshold
+
+        # Minimum ratio of changed pixels
+        self.min_area: float = min_area
+
+        # Weight of the new frame in the background
+        self.learning_rate: float = learning_rate
+
+        self.background: Optional[cv2.typing.MatLike] = None
+
+        # Ratio of changed pixels of the last frame
+        self.motion_ratio: float = 0
+
+    def reset(self) -> None:
+        self.background = None
+
+    def update(self, frame: cv2.typing.MatLike) -> bool:
+        """
+        Update the background with the frame.
+        :return: True if there is motion in the frame, else False
+        """
+        height = max(int(frame.shape[0] * self.width / frame.shape[1]), 1)
+        small = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0).astype(np.float32)
+
+        # First frame or new frame size: no motion
+        if self.background is None or self.background.shape != gray.shape:
+            self.background = gray
+            return False
+
+        difference = cv2.absdiff(gray, self.background)
+        cv2.accumulateWeighted(gray, self.background, self.learning_rate)
+
+        self.motion_ratio = float(np.count_nonzero(difference > self.threshold)) / difference.size
+        return self.motion_ratio >= self.min_area
@@ -0,0 +1,135 @@
+import logging
+from typing import Optional
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+class AdaptivePacer:
+    """
+    Schedule the frames on a fixed grid of [delay] seconds and shed load
+    to hold the target rate.
+
+    Scheduling: the frames start at start + k * delay. If the processing
+    is lagging behind, the missed ticks are skipped instead of drifting.
+
+    Load shedding (if activated): the average processing time is compared
+    to the delay. When it is over the delay, the pacer sheds the load one
+    level at a time, and restores it when the processing is fast again:
+    - Level 1: no image annotation.
+    - Level 2+: smaller inference size (if resolution shedding is allowed,
+      NCNN models exported with a fixed input size don't support it).
+    """
+
+    def __init__(
+        self,
+        inference_sizes: tuple[int, ...] = (640, 480, 320),
+        patience: int = 5,
+    ) -> None:
+        # Shed or restore the load when the processing time is over the delay
+        # (or under the low watermark) for [patience] consecutive frames
+        self.patience: int = patience
+        self.low_watermark: float = 0.6
+
+        # Inference sizes from the largest to the smallest
+        self.inference_sizes: tuple[int, ...] = inference_sizes
+        self.allow_resolution_shedding: bool = False
+
+        # Current load shedding level
+        self.level: int = 0
+        self.overloaded_frames: int = 0
+        self.underloaded_frames: int = 0
+
+        # Exponential moving average of the processing time of a frame
+        self.average_duration: float = 0
+
+        # Time of the next tick and the number of ticks skipped since the beginning
+        self.next_tick: float = 0
+        self.skipped_ticks: int = 0
+
+        # The first tick after a reset is never late (see wait_time)
+        self.first_tick: bool = True
+
+    @property
+    def max_level(self) -> int:
+        return 1 + (len(self.inference_sizes) - 1 if self.allow_resolution_shedding else 0)
+
+    @property
+    def annotation_enabled(self) -> bool:
+        return self.level < 1
+
+    @property
+    def inference_size(self) -> Optional[int]:
+        """
+        Inference size of the current level, None for the model default size.
+        """
+        if self.level < 2 or not self.allow_resolution_shedding:
+            return None
+        return self.inference_sizes[min(self.level - 1, len(self.inference_sizes) - 1)]
+
+    def reset(self, now: float) -> None:
+        self.next_tick = now
+        self.first_tick = True
+        self.level = 0
+        self.overloaded_frames = 0
+        self.underloaded_frames = 0
+        self.average_duration = 0
+
+    def wait_time(self, now: float, delay: float) -> tuple[float, int]:
+        """
+        Time to wait for the next tick of the grid.
+        :return: The time to wait (negative if lagging behind)
+            and the number of ticks skipped because of the lag.
+        """
+        # The grid starts at the first tick: the time since the reset is not a lag
+        if self.first_tick:
+            self.first_tick = False
+            self.next_tick = max(self.next_tick, now)
+
+        remaining_time = self.next_tick - now
+        skipped = 0
+        if remaining_time < 0 and delay > 0:
+            # Align to the next tick of the grid
+            skipped = int(-remaining_time // delay)
+            self.next_tick += skipped * delay
+            self.skipped_ticks += skipped
+
+        self.next_tick += delay
+        return remaining_time, skipped
+
+    def update(self, duration: float, delay: float, shedding: bool) -> None:
+        """
+        Update the average processing time and the load shedding level.
+        :param duration: Processing time of the last frame.
+        :param shedding: If False, the load shedding level is reset to 0.
+        """
+        self.average_duration = (
+            0.8 * self.average_duration + 0.2 * duration if self.average_duration else duration)
+
+        if not shedding or delay <= 0:
+            self.level = 0
+            return
+
+        # The maximum level changes with allow_resolution_shedding
+        self.level = min(self.level, self.max_level)
+
+        if self.average_duration > delay:
+            self.overloaded_frames += 1
+            self.underloaded_frames = 0
+        elif self.average_duration < delay * self.low_watermark:
+            self.underloaded_frames += 1
+            self.overloaded_frames = 0
+        else:
+            self.overloaded_frames = 0
+            self.underloaded_frames = 0
+
+        if self.overloaded_frames >= self.patience and self.level < self.max_level:
+            self.level += 1
+            self.overloaded_frames = 0
+            logger.warning(f"Processing too slow ({self.average_duration:.3f}s > {delay}s): shedding level={self.level}")
+
+        elif self.underloaded_frames >= self.patience and self.level > 0:
+            self.level -= 1
+            self.underloaded_frames = 0
+            logger.info(f"Processing fast enough: shedding level={self.level}")
@@ -1,14 +1,24 @@
-from collections import deque
 from datetime import datetime
-from typing import Optional
+from pathlib import Path
+from typing import Any, Optional
 from postgrest import AsyncPostgrestClient
-import supabase
+from postgrest.types import ReturnMethod
 import asyncio
+import httpx
+import importlib.util
+import json
 import logging
+import random
+import time
 
 
-from .tables.detection import Detection
+from .foreign_keys import ForeignKeyResolver
+from .metrics import Metrics
+from .rollup import TimeBucketAggregator
+from .spool import DetectionSpool, SpoolRow
+from .tables.detection import Detection, ns_to_str
 from .tables.device import Device
+from .tables.foreign_key import ForeignKey
 from .tables.location import Location
 from .tables.resolution import Resolution
 
@@ -19,7 +29,7 @@ logger.setLevel(logging.DEBUG)
 
 class PGClient:
 
-    def __init__(self) -> None:
+    def __init__(self, spool_path: Optional[str | Path] = None) -> None:
         # Identification credentials
         self.url = ""
         self.key = ""
@@ -28,15 +38,47 @@ class PGClient:
         self.postgrest_client: Optional[AsyncPostgrestClient] = None
         self.postgrest_client_exception: Exception = Exception()
 
+        # HTTP session shared by the inserts and the id lookups:
+        # keep-alive connections, HTTP/2 if the h2 package is installed.
+        self.http_client: Optional[httpx.AsyncClient] = None
+        self.http_timeout: float = 30
+        self.http_max_connections: int = 4
+        self.verify_certificate: bool = True
+
+        # HTTP version of the last response (HTTP/1.1 or HTTP/2)
+        self.http_version: str = "-"
+
         # Connection test
-        # self.connection_status: bool = False
-        # self.connection_message: str = "Uninitialized"
-        # self.connection_last_date: datetime = datetime.date()
+        self.connection_status: bool = False
+        self.connection_message: str = "Uninitialized"
+        self.connection_last_date: str = "-"
+        self.health_check_delay: int = 60
+        self.health_check_task: Optional[asyncio.Task] = None
+
+        # Buffer of detections, on disk to survive restarts and network outages
+        # (in memory without spool path).
+        # If size=604800, one week buffer for one insertion per second.
+        self.detection_buffer_size: int = 7 * 24 * 3600
+        self.detection_buffer: DetectionSpool = DetectionSpool(spool_path, self.detection_buffer_size)
+
+        # Tables of the database for the rows of the spool tables
+        self.database_tables: dict[str, str] = {
+            "detections": "detections_suivi",
+            "rollups": "detections_agregees",
+        }
 
-        # Buffer of detections
-        # If size=3600, one hour buffer for one insertion per second.
-        self.detection_buffer_size: int = 3600
-        self.detection_buffer: deque[Detection] = deque([], self.detection_buffer_size)
+        # Time buckets of the rollups (durations in seconds), none by default
+        self.rollup_aggregators: list[TimeBucketAggregator] = []
+
+        # Insert the raw detections (else the rollups only)
+        self.activate_raw_insertion: bool = True
+
+        # Maximum number of detections and bytes inserted in one request
+        self.insertion_chunk_size: int = 1000
+        self.insertion_chunk_bytes: int = 256 * 1024
+
+        # Maximum number of requests in parallel
+        self.insertion_concurrency: int = 2
 
         # Insertion results
         # TODO: last_insertion_date is not of type datetime
@@ -49,14 +91,25 @@ class PGClient:
         self.location: Location = Location("")
         self.resolution: Resolution = Resolution(640, 480)
 
+        # Resolution of the foreign ids, saved next to the spool
+        self.resolver: ForeignKeyResolver = ForeignKeyResolver(
+            f"{spool_path}.ids.json" if spool_path is not None else None)
+        self.resolver.restore(self.resolution)
+
         # Interval for inserting to the database
         # What is the good default value for insertion delay?
         self.insertion_delay: int = 10
+
+        # Maximum delay before retrying after an error (exponential backoff)
         self.error_delay: int = 60
+        self.insertion_failures: int = 0
 
         # Activate the insertion of the detections values to the Database
         self.activate_insertion: bool = False
 
+        # Duration of the database requests
+        self.metrics: Metrics = Metrics()
+
     def toggle_insertion(self, force: Optional[bool] = None) -> None:
         self.activate_insertion = force if force is not None else not self.activate_insertion
         logger.info(f"Set activate_insertion={self.activate_insertion}")
@@ -78,6 +131,75 @@ class PGClient:
         logger.info(f"Set insertion_delay={insertion_delay}")
         return True
 
+    def set_detection_buffer_size(self, detection_buffer_size: int | str) -> bool:
+        """
+        """
+        try:
+            detection_buffer_size = int(detection_buffer_size)
+        except ValueError:
+            logger.error(f"Buffer size not integer: detection_buffer_size={detection_buffer_size}")
+            return False
+
+        if detection_buffer_size <= 0:
+            logger.error(f"Buffer size must be positive: detection_buffer_size={detection_buffer_size}")
+            return False
+
+        self.detection_buffer_size = detection_buffer_size
+        self.detection_buffer.max_size = detection_buffer_size
+        logger.info(f"Set detection_buffer_size={detection_buffer_size}")
+        return True
+
+    def set_insertion_chunk_size(self, insertion_chunk_size: int | str) -> bool:
+        """
+        """
+        try:
+            insertion_chunk_size = int(insertion_chunk_size)
+        except ValueError:
+            logger.error(f"Chunk size not integer: insertion_chunk_size={insertion_chunk_size}")
+            return False
+
+        if insertion_chunk_size <= 0:
+            logger.error(f"Chunk size must be positive: insertion_chunk_size={insertion_chunk_size}")
+            return False
+
+        self.insertion_chunk_size = insertion_chunk_size
+        logger.info(f"Set insertion_chunk_size={insertion_chunk_size}")
+        return True
+
+    def set_insertion_chunk_bytes(self, insertion_chunk_bytes: int | str) -> bool:
+        """
+        """
+        try:
+            insertion_chunk_bytes = int(insertion_chunk_bytes)
+        except ValueError:
+            logger.error(f"Chunk bytes not integer: insertion_chunk_bytes={insertion_chunk_bytes}")
+            return False
+
+        if insertion_chunk_bytes <= 0:
+            logger.error(f"Chunk bytes must be positive: insertion_chunk_bytes={insertion_chunk_bytes}")
+            return False
+
+        self.insertion_chunk_bytes = insertion_chunk_bytes
+        logger.info(f"Set insertion_chunk_bytes={insertion_chunk_bytes}")
+        return True
+
+    def set_insertion_concurrency(self, insertion_concurrency: int | str) -> bool:
+        """
+        """
+        try:
+            insertion_concurrency = int(insertion_concurrency)
+        except ValueError:
+            logger.error(f"Concurrency not integer: insertion_concurrency={insertion_concurrency}")
+            return False
+
+        if insertion_concurrency < 1 or insertion_concurrency > 16:
+            logger.error(f"Concurrency not between 1 and 16: insertion_concurrency={insertion_concurrency}")
+            return False
+
+        self.insertion_concurrency = insertion_concurrency
+        logger.info(f"Set insertion_concurrency={insertion_concurrency}")
+        return True
+
     def set_error_delay(self, error_delay: int | str) -> bool:
         """
         """
@@ -101,11 +223,12 @@ class PGClient:
         """
         # Create a new device
         self.device = Device(device_name)
+        self.resolver.restore(self.device)
         logger.info(f"Set device_name={device_name}")
 
         # Retrive its id
         if self.postgrest_client is not None:
-            await self.device.retrieve_device_id(self.postgrest_client)
+            await self.resolver.resolve(self.postgrest_client, [self.device])
 
     async def update_location(self, location_name: str) -> None:
         """
@@ -113,11 +236,12 @@ class PGClient:
         """
         # Create a new device
         self.location = Location(location_name)
+        self.resolver.restore(self.location)
         logger.info(f"Set location_name={location_name}")
 
         # Retrive its id
         if self.postgrest_client is not None:
-            await self.location.retrieve_location_id(self.postgrest_client)
+            await self.resolver.resolve(self.postgrest_client, [self.location])
 
     async def update_resolution(self, width: int | str, height: int | str) -> bool:
         """
@@ -136,29 +260,205 @@ class PGClient:
 
         # Create a new device
         self.resolution = Resolution(width, height)
+        self.resolver.restore(self.resolution)
         logger.info(f"Set width={width} height={height}")
 
         # Retrive its id
         if self.postgrest_client is not None:
-            await self.resolution.retrieve_resolution_id(self.postgrest_client)
+            await self.resolver.resolve(self.postgrest_client, [self.resolution])
         return True
 
+    def foreign_keys(self) -> list[ForeignKey]:
+        return [self.device, self.location, self.resolution]
+
+    def toggle_foreign_key_insertion(self, force: Optional[bool] = None) -> None:
+        """
+        Insert the device, location or resolution if not found in the database.
+        """
+        self.resolver.insert_missing = force if force is not None else not self.resolver.insert_missing
+        logger.info(f"Set insert_missing={self.resolver.insert_missing}")
+
     def insert_detection(
         self,
         people_image_count: int,
         people_line_in_count: int,
         people_line_out_count: int,
-    ) -> None:
+        detection_time: Optional[datetime] = None,
+    ) -> Detection:
         """
         Insert a detection to the buffer before being inserted to the database.
+        :return: The inserted detection.
         """
         # No logging, too verbose
-        detection = Detection(people_image_count, people_line_in_count, people_line_out_count)
-        self.detection_buffer.append(detection)
+        detection = Detection(
+            people_image_count, people_line_in_count, people_line_out_count, detection_time)
+        if self.activate_raw_insertion:
+            self.detection_buffer.append(detection)
+
+        # Roll the detection into the time buckets, the closed buckets are inserted
+        for aggregator in self.rollup_aggregators:
+            if (rollup := aggregator.add(detection)) is not None:
+                self.detection_buffer.append_rollup(rollup)
+        return detection
+
+    def set_rollup_durations(self, rollup_durations: str | list[int]) -> bool:
+        """
+        Set the durations of the time buckets of the rollups (ex: "10,60"), empty or 0 for none.
+        """
+        try:
+            if isinstance(rollup_durations, str):
+                rollup_durations = [int(duration) for duration in rollup_durations.split(",") if duration.strip()]
+        except ValueError:
+            logger.error(f"Rollup durations not integers: rollup_durations={rollup_durations}")
+            return False
+        rollup_durations = [duration for duration in rollup_durations if duration != 0]
+
+        if any(duration < 0 or duration > 86400 for duration in rollup_durations):
+            logger.error(f"Rollup durations not between 1 and 86400: rollup_durations={rollup_durations}")
+            return False
+
+        if not rollup_durations and not self.activate_raw_insertion:
+            logger.error("Rollup durations can't be empty without raw insertion, the detections would be dropped")
+            return False
+
+        # Keep the buckets being filled, the buckets of the removed durations are flushed
+        aggregators = {aggregator.duration: aggregator for aggregator in self.rollup_aggregators}
+        self.rollup_aggregators = [
+            aggregators.pop(duration, None) or TimeBucketAggregator(duration)
+            for duration in sorted(set(rollup_durations))]
+        for aggregator in aggregators.values():
+            if (rollup := aggregator.flush()) is not None:
+                self.detection_buffer.append_rollup(rollup)
+        logger.info(f"Set rollup_durations={self.rollup_durations}")
+        return True
+
+    @property
+    def rollup_durations(self) -> list[int]:
+        return [aggregator.duration for aggregator in self.rollup_aggregators]
+
+    def flush_rollups(self, now_ns: Optional[int] = None) -> int:
+        """
+        Insert the time buckets being filled to the buffer, so they are not lost
+        when the counting stops or at shutdown.
+        :param now_ns: If given, only the buckets ended for a bucket duration
+            (no detection closed them), see TimeBucketAggregator.flush().
+        :return: The number of flushed buckets
+        """
+        flushed_count = 0
+        for aggregator in self.rollup_aggregators:
+            if (rollup := aggregator.flush(now_ns)) is not None:
+                self.detection_buffer.append_rollup(rollup)
+                flushed_count += 1
+        if flushed_count:
+            logger.info(f"{flushed_count} open time buckets flushed to the buffer")
+        return flushed_count
+
+    def toggle_raw_insertion(self, force: Optional[bool] = None) -> bool:
+        activate_raw_insertion = force if force is not None else not self.activate_raw_insertion
+        if not activate_raw_insertion and not self.rollup_aggregators:
+            logger.error("Raw insertion can't be deactivated without rollup durations, the detections would be dropped")
+            return False
+
+        self.activate_raw_insertion = activate_raw_insertion
+        logger.info(f"Set activate_raw_insertion={self.activate_raw_insertion}")
+        return True
+
+    def split_chunks(self, rows: list[tuple[int, dict[str, Any]]]) -> list[list[tuple[int, dict[str, Any]]]]:
+        """
+        Split the rows in chunks of at most insertion_chunk_size rows
+        and insertion_chunk_bytes bytes (JSON size, at least one row per chunk).
+        """
+        chunks: list[list[tuple[int, dict[str, Any]]]] = []
+        chunk: list[tuple[int, dict[str, Any]]] = []
+        chunk_bytes = 0
+        # The rows have the same columns: the JSON size of the first one
+        # (with some digits more for the counts) is used for all of them.
+        row_bytes = len(json.dumps(rows[0][1])) + 8 if rows else 0
+        for row in rows:
+            if chunk and (len(chunk) >= self.insertion_chunk_size
+                          or chunk_bytes + row_bytes > self.insertion_chunk_bytes):
+                chunks.append(chunk)
+                chunk, chunk_bytes = [], 0
+            chunk.append(row)
+            chunk_bytes += row_bytes
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    def detection_payload(self, row: SpoolRow) -> dict[str, Any]:
+        """
+        Row of the detections table from a row of the spool.
+        """
+        _, people_image_count, people_line_in_count, people_line_out_count, time_ns = row
+        return {
+            "nombre_personnes_image": people_image_count,
+            "nombre_personnes_ligne_in": people_line_in_count,
+            "nombre_personnes_ligne_out": people_line_out_count,
+            "temps": ns_to_str(time_ns),
+            "id_lieu": self.location.id,
+            "id_appareil": self.device.id,
+            "id_resolution": self.resolution.id
+        }
+
+    def rollup_payload(self, row: SpoolRow) -> dict[str, Any]:
+        """
+        Row of the rollups table from a row of the spool.
+        """
+        (_, start_ns, duration, people_image_max, people_image_mean,
+         people_line_in_count, people_line_out_count, sample_count) = row
+        return {
+            "debut": ns_to_str(start_ns),
+            "duree": duration,
+            "nombre_personnes_image_max": people_image_max,
+            "nombre_personnes_image_moyenne": round(people_image_mean, 3),
+            "nombre_personnes_ligne_in": people_line_in_count,
+            "nombre_personnes_ligne_out": people_line_out_count,
+            "nombre_detections": sample_count,
+            "id_lieu": self.location.id,
+            "id_appareil": self.device.id,
+            "id_resolution": self.resolution.id
+        }
+
+    async def insert_chunk(
+        self,
+        chunk: list[tuple[int, dict[str, Any]]],
+        semaphore: asyncio.Semaphore,
+        spool_table: str = "detections",
+    ) -> bool:
+        """
+        Insert one chunk, then remove it from the buffer.
+        :return: True if inserted, else False
+        """
+        assert self.postgrest_client is not None
+        async with semaphore:
+            try:
+                with self.metrics.time("database_insert", "Insertion of a chunk of the buffer to the database"):
+                    _ = (
+                        await self.postgrest_client
+                        .table(self.database_tables[spool_table])
+                        .insert([row for _, row in chunk], returning=ReturnMethod.minimal)
+                        .execute()
+                    )
+            except Exception as e:
+                self.last_insertion_exception = e
+                logger.error(f"Failed to insert a chunk of {len(chunk)} {spool_table} to the database: {e}")
+                # Foreign key violation: an id is outdated
+                if getattr(e, "code", None) == "23503":
+                    self.resolver.invalidate(self.foreign_keys())
+                return False
+
+        # If it succeeded (no exception raised), remove the chunk from the buffer
+        self.detection_buffer.acknowledge(chunk[0][0], chunk[-1][0], spool_table)
+        self.last_insertion_date = str(datetime.now())  # Keep microsend for exact insertion time
+        self.last_insertion_count += len(chunk)
+        return True
 
     async def insert_detection_buffer(self) -> bool:
         """
-        Insert the buffer to the database, then clear it if inserted
+        Insert the buffer to the database, oldest detections first, in chunks
+        of bounded size sent in parallel. Each chunk is removed from the buffer
+        once inserted: only the failed chunks are sent again.
+        :return: True if the whole buffer is inserted, else False
         """
         # Check if the buffer is non empty
         if not self.detection_buffer:
@@ -172,59 +472,80 @@ class PGClient:
 
         # TODO: Check if the postgrest client can access the database before retrieving the ID
 
-        if not await self.device.retrieve_device_id(self.postgrest_client):
-            logger.info(f"Missing the device id")
+        # Device, location and resolution ids, retrieved concurrently when expired
+        if not await self.resolver.resolve(self.postgrest_client, self.foreign_keys()):
+            logger.info(f"Missing the device, location or resolution id")
             return False
 
-        if not await self.location.retrieve_location_id(self.postgrest_client):
-            logger.info(f"Missing the location id")
-            return False
+        self.last_insertion_count = 0
+        semaphore = asyncio.Semaphore(self.insertion_concurrency)
 
-        if not await self.resolution.retrieve_resolution_id(self.postgrest_client):
-            logger.info(f"Missing the resolution id")
-            return False
+        # Raw detections, then the rollups
+        for spool_table, payload in (("detections", self.detection_payload), ("rollups", self.rollup_payload)):
 
-        try:
-            # TODO: Move the table name and columns names in fields
-            _ = (
-                await self.postgrest_client
-                .table("detections_suivi")
-                .insert([
-                    {
-                        "nombre_personnes_image": detection.people_image_count,
-                        "nombre_personnes_ligne_in": detection.people_line_in_count,
-                        "nombre_personnes_ligne_out": detection.people_line_out_count,
-                        "temps": detection.time,
-                        "id_lieu": self.location.id,
-                        "id_appareil": self.device.id,
-                        "id_resolution": self.resolution.id
-                    } for detection in self.detection_buffer
-                ])
-                .execute()
-            )
+            # Read a window of chunks for the parallel requests at a time
+            window_size = self.insertion_chunk_size * self.insertion_concurrency
+            while window := self.detection_buffer.peek(window_size, spool_table):
+                # Rows of the spool converted to the payload, without Detection objects
+                rows = [(row[0], payload(row)) for row in window]
+                inserted = await asyncio.gather(*(
+                    self.insert_chunk(chunk, semaphore, spool_table)
+                    for chunk in self.split_chunks(rows)))
 
-            # If it succeeded (no exception raised)
-            self.last_insertion_date = str(datetime.now())  # Keep microsend for exact insertion time
-            self.last_insertion_count = len(self.detection_buffer)
-            self.detection_buffer.clear()
+                # Stop at the first failure, the remaining chunks are retried later
+                if not all(inserted):
+                    return False
 
-            return True
-        except Exception as e:
-            self.last_insertion_exception = e
-            logger.error(f"Failed to insert the buffer to the database: {e}")
+        return True
+
+    def retry_delay(self) -> float:
+        """
+        Exponential backoff with jitter after consecutive insertion failures,
+        up to error_delay seconds.
+        """
+        delay = min(float(self.error_delay), 2.0 ** self.insertion_failures)
+        return random.uniform(delay / 2, delay)
+
+    async def connection_test(self) -> bool:
+        """
+        Connection test to the database (one row of the device table).
+        Keep the connections of the HTTP session alive between the insertions.
+        :return: True if the client can query the database, else False
+        """
+        if self.postgrest_client is None:
+            self.connection_status = False
+            self.connection_message = "No postgrest client"
             return False
 
-    # async def connection_test(self) -> bool:
-    #     """
-    #     Connection test to the database.
-    #     :return: True if the client can query the database, else False
-    #     """
-    #     return True
+        try:
+            with self.metrics.time("database_health_check", "Connection test to the database"):
+                _ = (
+                    await self.postgrest_client
+                    .table(self.device.table_name)
+                    .select(self.device.id_column_name).limit(1)
+                    .execute()
+                )
+            self.connection_status = True
+            self.connection_message = "OK"
+        except Exception as e:
+            self.connection_status = False
+            self.connection_message = str(e)
+            logger.error(f"Connection test failed: {e}")
+
+        self.connection_last_date = str(datetime.now())
+        return self.connection_status
 
     def set_url(self, url: str) -> None:
         self.url = url
         logger.info(f"Set database url={url}")
 
+    def toggle_verify_certificate(self, force: Optional[bool] = None) -> None:
+        """
+        Verify the TLS certificate of the database (applied at the next init_pgclient).
+        """
+        self.verify_certificate = force if force is not None else not self.verify_certificate
+        logger.info(f"Set verify_certificate={self.verify_certificate}")
+
     def set_key(self, key: str) -> None:
         self.key = key
         logger.info(f"Set database key={key}")
@@ -236,11 +557,13 @@ class PGClient:
         :return: True if the client is created, else False
         """
         if not self.url:
+            self.close_http_client()
             self.postgrest_client = None
             logger.info("Missing the url")
             return False
 
         if not self.key:
+            self.close_http_client()
             self.postgrest_client = None
             logger.info("Missing the key")
             return False
@@ -249,30 +572,75 @@ class PGClient:
             logger.info(f"New pgclient with url={self.url} and key={self.key[0:10]}...")
 
             # Create the pgclient (no connection tests)
-            supabase_client: supabase.Client = supabase.create_client(self.url, self.key)
-            self.postgrest_client = supabase.AsyncClient._init_postgrest_client(
-                rest_url=supabase_client.rest_url,
-                headers=supabase_client.options.headers,
-                schema=supabase_client.options.schema,
-                verify=False
+            # Same url and headers as the supabase client, without creating it.
+            self.close_http_client()
+            self.http_client = httpx.AsyncClient(
+                http2=importlib.util.find_spec("h2") is not None,
+                limits=httpx.Limits(
+                    max_connections=self.http_max_connections,
+                    max_keepalive_connections=self.http_max_connections,
+                    keepalive_expiry=2 * self.health_check_delay,
+                ),
+                timeout=httpx.Timeout(self.http_timeout, connect=10),
+                verify=self.verify_certificate,
+                follow_redirects=True,
+                event_hooks={"response": [self.record_http_version]},
+            )
+            self.postgrest_client = AsyncPostgrestClient(
+                f"{self.url.rstrip('/')}/rest/v1",
+                schema="public",
+                headers={
+                    "apiKey": self.key,
+                    "Authorization": f"Bearer {self.key}",
+                },
+                http_client=self.http_client,
             )
 
             logger.info("PostgreSQL client initiated")
             return True
 
         except Exception as e:
+            self.close_http_client()
             self.postgrest_client = None
             self.postgrest_client_exception = e
             logger.error(f"PostgreSQL client not initiated: {e}")
             return False
 
+    async def record_http_version(self, response: httpx.Response) -> None:
+        self.http_version = response.http_version
+
+    def close_http_client(self) -> None:
+        """
+        Close the connections of the previous HTTP session (in the background).
+        """
+        if self.http_client is None:
+            return
+        http_client, self.http_client = self.http_client, None
+        try:
+            asyncio.get_running_loop().create_task(http_client.aclose())
+        except RuntimeError:
+            pass  # No event loop, the connections are closed with the process
+
+    async def start_health_check(self) -> None:
+        """
+        Test the connection periodically, between the insertions.
+        """
+        while True:
+            await asyncio.sleep(self.health_check_delay)
+            if self.postgrest_client is not None:
+                await self.connection_test()
+
     async def start_pgclient(self) -> None:
         """
         Insert the buffer periodically to the database
         """
         logger.info("PostgreSQL daemon started")
+        self.health_check_task = asyncio.create_task(self.start_health_check())
         while True:
 
+            # Close the time buckets left open (no detection since their end)
+            self.flush_rollups(time.time_ns())
+
             # Wait the postgrest client is initiated (either at startup or in the web)
             if self.postgrest_client is None:
                 await asyncio.sleep(10)
@@ -285,7 +653,15 @@ class PGClient:
             if not self.activate_insertion:
                 continue
 
+            # Nothing to insert
+            if not self.detection_buffer:
+                continue
+
             # Insert the buffer to the databse
-            if not await self.insert_detection_buffer():
-                logger.info(f"{self.error_delay} seconds sleep before retrying insertion")
-                await asyncio.sleep(self.error_delay)
+            if await self.insert_detection_buffer():
+                self.insertion_failures = 0
+            else:
+                self.insertion_failures += 1
+                retry_delay = self.retry_delay()
+                logger.info(f"{retry_delay:.1f} seconds sleep before retrying insertion")
+                await asyncio.sleep(retry_delay)
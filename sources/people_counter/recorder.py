@@ -0,0 +1,332 @@
+import logging
+import queue
+import threading
+from contextlib import suppress
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import cv2
+
+from .metrics import Metrics
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+# Container of the video files for each codec (fourcc)
+VIDEO_CODECS: dict[str, str] = {
+    "mp4v": ".mp4",
+    "avc1": ".mp4",
+    "hev1": ".mp4",
+    "MJPG": ".avi",
+    "XVID": ".avi",
+}
+
+
+class VideoRecorder:
+    """
+    Write the processed frames to video files in a background thread.
+
+    The counting loop only copies the frame into a bounded queue: if the
+    writer thread lags, the new frames are dropped instead of slowing the
+    counting. The video has a constant frame rate [fps]: each frame is
+    repeated until the capture time of the next one, so the video time
+    follows the real time whatever the delay or the lag of the counting.
+
+    The frame size is the size of the first frame of each segment. A new
+    segment (file) is started after [segment_duration] seconds, past
+    [segment_size] bytes, when the frame size changes or after a gap of more
+    than [max_gap] seconds between two frames.
+    """
+
+    def __init__(
+        self,
+        directory: str | Path = "video_writer",
+        codec: str = "mp4v",
+        fps: float = 5,
+        queue_size: int = 30,
+        metrics: Optional[Metrics] = None,
+        prefix: str = "trafficount",
+    ) -> None:
+        # Files named [prefix]-[date of the first frame]
+        self.directory: Path = Path(directory)
+        self.prefix: str = prefix
+
+        # Codec (fourcc, see VIDEO_CODECS) and constant frame rate of the video
+        self.codec: str = codec
+        self.fps: float = fps
+
+        # Encoding quality (0-100) if supported by the codec, 0 for the default one
+        self.quality: int = 0
+
+        # Use the hardware encoder, if any
+        self.activate_hardware_acceleration: bool = False
+
+        # Rotation of the files (seconds, bytes, 0 for no limit)
+        self.segment_duration: float = 3600
+        self.segment_size: int = 512 * 1024**2
+        self.max_gap: float = 10  # See set_frame_delay
+
+        # Frames waiting for the writer thread, with their capture time.
+        # None stops the thread.
+        self.queue_size: int = queue_size
+        self.frames: queue.Queue[Optional[tuple[cv2.typing.MatLike, float]]] = queue.Queue(maxsize=queue_size)
+        self.dropped_count: int = 0
+
+        # Duration of the frame writes, measured by the writer thread
+        self.metrics: Metrics = metrics if metrics is not None else Metrics()
+
+        self.thread: Optional[threading.Thread] = None
+        self.running: bool = False
+
+        # Current segment, used by the writer thread only
+        self.video_writer: Optional[cv2.VideoWriter] = None
+        self.filename: str = ""
+        self.frame_size: tuple[int, int] = (0, 0)  # (width, height)
+        self.segment_start_time: float = 0
+        self.last_frame_time: float = 0
+        self.written_count: int = 0
+        self.size_check_count: int = 0
+        self.previous_frame: Optional[cv2.typing.MatLike] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self.running
+
+    def set_codec(self, codec: str) -> bool:
+        if codec not in VIDEO_CODECS:
+            logger.error(f"Video codec not in {list(VIDEO_CODECS)}: codec={codec}")
+            return False
+
+        self.codec = codec
+        logger.info(f"Set video codec={codec}")
+        return True
+
+    def set_fps(self, fps: float | str) -> bool:
+        try:
+            fps = float(fps)
+        except ValueError:
+            logger.error(f"Video fps is not float: fps={fps}")
+            return False
+
+        if fps <= 0 or fps > 60:
+            logger.error(f"Video fps not between 0 (excluded) and 60: fps={fps}")
+            return False
+
+        self.fps = fps
+        logger.info(f"Set video fps={fps}")
+        return True
+
+    def set_quality(self, quality: int | str) -> bool:
+        try:
+            quality = int(quality)
+        except ValueError:
+            logger.error(f"Video quality is not integer: quality={quality}")
+            return False
+
+        if quality < 0 or quality > 100:
+            logger.error(f"Video quality not between 0 and 100: quality={quality}")
+            return False
+
+        self.quality = quality
+        logger.info(f"Set video quality={quality}")
+        return True
+
+    def set_segment_duration(self, segment_duration: float | str) -> bool:
+        try:
+            segment_duration = float(segment_duration)
+        except ValueError:
+            logger.error(f"Segment duration is not float: segment_duration={segment_duration}")
+            return False
+
+        if segment_duration < 0:
+            logger.error(f"Segment duration must be positive: segment_duration={segment_duration}")
+            return False
+
+        self.segment_duration = segment_duration
+        logger.info(f"Set video segment_duration={segment_duration}")
+        return True
+
+    def set_segment_size(self, segment_size: int | str) -> bool:
+        try:
+            segment_size = int(segment_size)
+        except ValueError:
+            logger.error(f"Segment size is not integer: segment_size={segment_size}")
+            return False
+
+        if segment_size < 0:
+            logger.error(f"Segment size must be positive: segment_size={segment_size}")
+            return False
+
+        self.segment_size = segment_size
+        logger.info(f"Set video segment_size={segment_size}")
+        return True
+
+    def set_frame_delay(self, delay: float) -> None:
+        """
+        Allow a gap of 3 delays between two frames before starting a new segment,
+        so a long counting delay doesn't start a file at every frame.
+        """
+        self.max_gap = max(10, 3 * delay)
+
+    def toggle_hardware_acceleration(self, force: Optional[bool] = None) -> None:
+        """
+        Use the hardware encoder (VAAPI, MFX...) if available, applied at the next segment.
+        """
+        self.activate_hardware_acceleration = (
+            force if force is not None else not self.activate_hardware_acceleration)
+        logger.info(f"Set video activate_hardware_acceleration={self.activate_hardware_acceleration}")
+
+    def start(self) -> None:
+        if self.running:
+            return
+
+        # The new thread waits for the previous one to write its last frames,
+        # the new frames are queued meanwhile
+        self.frames = queue.Queue(maxsize=self.queue_size)
+        self.running = True
+        self.thread = threading.Thread(
+            target=self.write_loop, args=(self.frames, self.thread), name="video-recorder", daemon=True)
+        self.thread.start()
+        logger.info("Video recorder started")
+
+    def stop(self) -> None:
+        """
+        Write the queued frames, close the video and stop the thread (in the background).
+        """
+        if not self.running:
+            return
+        self.running = False
+        # Never block: the oldest frame is dropped if the queue is full
+        while True:
+            try:
+                self.frames.put_nowait(None)
+                break
+            except queue.Full:
+                with suppress(queue.Empty):
+                    self.frames.get_nowait()
+                    self.dropped_count += 1
+        logger.info("Video recorder stopped")
+
+    def write(self, frame: cv2.typing.MatLike, frame_time: float) -> bool:
+        """
+        Queue a copy of the frame (the frame buffer is reused by the capture).
+        :param frame_time: Capture time of the frame (time.time()).
+        :return: True if queued, False if dropped (queue full or recorder stopped)
+        """
+        if not self.running:
+            return False
+        try:
+            self.frames.put_nowait((frame.copy(), frame_time))
+            return True
+        except queue.Full:
+            self.dropped_count += 1
+            if self.dropped_count % 100 == 1:
+                logger.warning(f"Video recorder lagging: {self.dropped_count} frames dropped")
+            return False
+
+    def open_segment(self, frame: cv2.typing.MatLike, frame_time: float) -> None:
+        self.close_segment()
+
+        # The filename must be valid on Windows and Linux (':' doesn't work on Windows)
+        date: str = datetime.fromtimestamp(frame_time).strftime('%Y_%m_%d-%H_%M_%S')
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{self.prefix}-{date}{VIDEO_CODECS[self.codec]}"
+        # Two segments in the same second (frame size change)
+        index = 1
+        while path.exists():
+            path = self.directory / f"{self.prefix}-{date}-{index}{VIDEO_CODECS[self.codec]}"
+            index += 1
+        self.filename = str(path)
+        self.frame_size = (frame.shape[1], frame.shape[0])
+
+        params: list[int] = []
+        if self.quality:
+            params += [cv2.VIDEOWRITER_PROP_QUALITY, self.quality]
+        if self.activate_hardware_acceleration:
+            params += [cv2.VIDEOWRITER_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+
+        self.video_writer = cv2.VideoWriter(
+            self.filename,
+            cv2.CAP_ANY,
+            cv2.VideoWriter.fourcc(*self.codec),
+            self.fps,
+            self.frame_size,  # (width, height)
+            params)
+        if not self.video_writer.isOpened():
+            logger.error(f"Video writer not opened: filename={self.filename}, codec={self.codec}")
+            self.video_writer = None
+            return
+
+        self.segment_start_time = frame_time
+        self.written_count = 0
+        self.size_check_count = 0
+        self.previous_frame = None
+        logger.info(f"New video segment: filename={self.filename}, codec={self.codec}, "
+                    f"fps={self.fps}, frame_size={self.frame_size}")
+
+    def close_segment(self) -> None:
+        if self.video_writer is None:
+            return
+        self.video_writer.release()
+        self.video_writer = None
+        logger.info(f"Video segment closed: filename={self.filename}, frames={self.written_count}")
+
+    def is_segment_over(self, frame: cv2.typing.MatLike, frame_time: float) -> bool:
+        if self.video_writer is None:
+            return True
+        if (frame.shape[1], frame.shape[0]) != self.frame_size:
+            return True
+        if frame_time - self.last_frame_time > self.max_gap:
+            return True
+        if self.segment_duration and frame_time - self.segment_start_time >= self.segment_duration:
+            return True
+        # The file size is checked every 100 written frames
+        if self.segment_size and self.written_count - self.size_check_count >= 100:
+            self.size_check_count = self.written_count
+            try:
+                return Path(self.filename).stat().st_size >= self.segment_size
+            except OSError:
+                return False
+        return False
+
+    def write_frame(self, frame: cv2.typing.MatLike, frame_time: float) -> None:
+        """
+        Write the frame at its capture time (in the writer thread): the previous
+        frame is repeated until then. A frame captured before the time of the
+        next video frame is skipped.
+        """
+        if self.is_segment_over(frame, frame_time):
+            self.open_segment(frame, frame_time)
+        if self.video_writer is None:
+            return
+        previous_frame = self.previous_frame if self.previous_frame is not None else frame
+        self.previous_frame = frame
+        self.last_frame_time = frame_time
+
+        # Index of the video frame at the capture time of this frame
+        index = int((frame_time - self.segment_start_time) * self.fps)
+        with self.metrics.time("video_write", "Write of a frame to the video"):
+            while self.written_count < index:
+                self.video_writer.write(previous_frame)
+                self.written_count += 1
+            if self.written_count == index:
+                self.video_writer.write(frame)
+                self.written_count += 1
+
+    def write_loop(
+        self,
+        frames: queue.Queue[Optional[tuple[cv2.typing.MatLike, float]]],
+        previous_thread: Optional[threading.Thread] = None,
+    ) -> None:
+        # The segment is shared with the previous thread
+        if previous_thread is not None:
+            previous_thread.join()
+        while (item := frames.get()) is not None:
+            try:
+                self.write_frame(*item)
+            except cv2.error as e:
+                logger.error(f"Failed to write the frame to {self.filename}: {e}")
+        self.close_segment()
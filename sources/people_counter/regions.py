@@ -0,0 +1,287 @@
+import logging
+from typing import Any, Optional
+
+from cachetools import LRUCache
+import numpy as np
+import numpy.typing as npt
+import shapely
+
+from .crossing import LineCrossing
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+class Region:
+    """
+    A named counting region: a line or a polygon.
+    - Line: count the tracks crossing it (in/out).
+    - Polygon: count the tracks entering and leaving it (in/out),
+      the tracks inside (occupancy) and the tracks staying inside
+      more than [dwell_time] seconds (dwell).
+    """
+
+    LINE = "line"
+    POLYGON = "polygon"
+
+    def __init__(
+        self,
+        name: str,
+        kind: str,
+        points: list[tuple[int, int]],
+        dwell_time: float = 0,
+    ) -> None:
+        self.name: str = name
+        self.kind: str = kind
+        self.points: list[tuple[int, int]] = points
+
+        # Minimum time inside a polygon to count a dwell (0 to disable)
+        self.dwell_time: float = dwell_time
+
+        # Geometry used by the spatial index
+        self.geometry = (
+            shapely.LineString(points) if kind == self.LINE else shapely.Polygon(points))
+        shapely.prepare(self.geometry)
+        self.line_crossing: Optional[LineCrossing] = (
+            LineCrossing(points[0], points[1]) if kind == self.LINE else None)
+
+        # Counts of the last frame
+        self.in_count: int = 0
+        self.out_count: int = 0
+
+        # Counts since the beginning (or the last reset)
+        self.total_in_count: int = 0
+        self.total_out_count: int = 0
+        self.dwell_count: int = 0
+
+        # Number of tracks inside the polygon on the last frame
+        self.occupancy: int = 0
+
+        # Tracks already counted by the line
+        self.counted: LRUCache[int, bool] = LRUCache(maxsize=500)
+
+        # Tracks inside the polygon: track id -> entry time
+        self.inside: dict[int, float] = {}
+        self.dwelled: set[int] = set()
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "type": self.kind,
+            "points": [list(point) for point in self.points],
+            "dwell_time": self.dwell_time,
+        }
+
+    def reset(self) -> None:
+        self.total_in_count = 0
+        self.total_out_count = 0
+        self.dwell_count = 0
+
+    def update_line(
+        self,
+        track_ids: npt.NDArray[np.int64],
+        previous: npt.NDArray[np.float64],
+        current: npt.NDArray[np.float64],
+    ) -> None:
+        """
+        Count the tracks crossing the line.
+        """
+        assert self.line_crossing is not None
+        crossings = self.line_crossing.crossings(previous, current)
+        for track_id, crossing in zip(track_ids.tolist(), crossings.tolist()):
+            # Don't count the track intersection twice
+            if not crossing or track_id in self.counted:
+                continue
+            self.counted[track_id] = True
+            if crossing == LineCrossing.IN:
+                self.in_count += 1
+            else:
+                self.out_count += 1
+
+    def update_polygon(
+        self,
+        track_ids: npt.NDArray[np.int64],
+        current: npt.NDArray[np.float64],
+        all_track_ids: set[int],
+        timestamp: float,
+    ) -> None:
+        """
+        Count the tracks entering, leaving and dwelling in the polygon.
+        :param track_ids: Tracks near the polygon.
+        :param current: Current centroids of the tracks near the polygon.
+        :param all_track_ids: All the tracks of the frame.
+        """
+        inside_ids: set[int] = set()
+        if len(track_ids):
+            is_inside = shapely.contains_xy(self.geometry, current[:, 0], current[:, 1])
+            inside_ids = set(track_ids[is_inside].tolist())
+
+        # Tracks leaving the polygon. The lost tracks are forgotten without counting.
+        for track_id in list(self.inside):
+            if track_id in inside_ids:
+                continue
+            if track_id in all_track_ids:
+                self.out_count += 1
+            del self.inside[track_id]
+            self.dwelled.discard(track_id)
+
+        # Tracks entering the polygon
+        for track_id in inside_ids:
+            if track_id not in self.inside:
+                self.inside[track_id] = timestamp
+                self.in_count += 1
+
+            # Tracks staying inside the polygon
+            elif (self.dwell_time > 0 and track_id not in self.dwelled
+                  and timestamp - self.inside[track_id] >= self.dwell_time):
+                self.dwelled.add(track_id)
+                self.dwell_count += 1
+
+        self.occupancy = len(self.inside)
+
+
+class RegionSet:
+    """
+    Set of named regions evaluated against all the tracks of a frame.
+
+    A spatial index (STRtree) of the regions is built when the regions change.
+    Each frame, the bounding boxes of the track segments are queried in one
+    call, so only the tracks near a region are evaluated against it.
+    """
+
+    def __init__(self) -> None:
+        self.regions: dict[str, Region] = {}
+        self.region_list: list[Region] = []
+        self.tree: Optional[shapely.STRtree] = None
+        self.index: tuple[list[Region], Optional[shapely.STRtree]] = ([], None)
+
+    def __len__(self) -> int:
+        return len(self.regions)
+
+    def __iter__(self):
+        return iter(self.region_list)
+
+    def build_index(self) -> None:
+        region_list = list(self.regions.values())
+        tree = shapely.STRtree([region.geometry for region in region_list]) if region_list else None
+        # Swap both at once, the regions are evaluated in the inference thread
+        self.index = (region_list, tree)
+        self.region_list = region_list
+        self.tree = tree
+
+    def add_region(
+        self,
+        name: str,
+        kind: str,
+        points: list[tuple[int | str, int | str]],
+        dwell_time: float | str = 0,
+    ) -> bool:
+        """
+        Add or replace a region.
+        :return: True if the region is valid and added, else False
+        """
+        if not name:
+            logger.error("Region name is empty")
+            return False
+
+        if kind not in (Region.LINE, Region.POLYGON):
+            logger.error(f"Region type must be {Region.LINE} or {Region.POLYGON}: type={kind}")
+            return False
+
+        try:
+            int_points = [(int(point[0]), int(point[1])) for point in points]
+            dwell_time = float(dwell_time)
+        except (ValueError, IndexError, TypeError) as e:
+            logger.error(f"Region conversion failure: {e}")
+            return False
+
+        if any(x < 0 or y < 0 for x, y in int_points):
+            logger.error(f"Coordinates must be positive: points={int_points}")
+            return False
+
+        if kind == Region.LINE and len(int_points) != 2:
+            logger.error(f"A line must have two points: points={int_points}")
+            return False
+
+        if kind == Region.POLYGON and len(int_points) < 3:
+            logger.error(f"A polygon must have at least three points: points={int_points}")
+            return False
+
+        self.regions[name] = Region(name, kind, int_points, dwell_time)
+        self.build_index()
+        logger.info(f"Set region: name={name} type={kind} points={int_points}")
+        return True
+
+    def remove_region(self, name: str) -> bool:
+        if self.regions.pop(name, None) is None:
+            logger.error(f"Region not found: name={name}")
+            return False
+        self.build_index()
+        logger.info(f"Remove region: name={name}")
+        return True
+
+    def to_list(self) -> list[dict[str, Any]]:
+        return [region.to_dict() for region in self.region_list]
+
+    def load_list(self, regions: list[dict[str, Any]]) -> None:
+        """
+        Replace the regions by the serialized regions (see to_list()).
+        """
+        self.regions.clear()
+        for region in regions:
+            self.add_region(
+                region.get("name", ""),
+                region.get("type", ""),
+                region.get("points", []),
+                region.get("dwell_time", 0))
+        self.build_index()
+
+    def reset(self) -> None:
+        for region in self.region_list:
+            region.reset()
+
+    def update(
+        self,
+        track_ids: list[int],
+        previous_centroids: list[tuple[int, int]],
+        current_centroids: list[tuple[int, int]],
+        timestamp: float,
+    ) -> None:
+        """
+        Evaluate all the regions against the track segments of the frame.
+        The previous centroid of a new track is its current centroid.
+        """
+        region_list, tree = self.index
+        if tree is None:
+            return
+
+        # Reset the counts of the last frame
+        for region in region_list:
+            region.in_count = 0
+            region.out_count = 0
+
+        ids = np.asarray(track_ids, dtype=np.int64)
+        previous = np.asarray(previous_centroids, dtype=np.float64).reshape(-1, 2)
+        current = np.asarray(current_centroids, dtype=np.float64).reshape(-1, 2)
+
+        # Pairs (segment, region) whose bounding boxes intersect
+        if len(ids):
+            minimum = np.minimum(previous, current)
+            maximum = np.maximum(previous, current)
+            boxes = shapely.box(minimum[:, 0], minimum[:, 1], maximum[:, 0], maximum[:, 1])
+            track_indexes, region_indexes = tree.query(boxes)
+        else:
+            track_indexes = region_indexes = np.empty(0, dtype=np.int64)
+
+        all_track_ids = set(ids.tolist())
+        for region_index, region in enumerate(region_list):
+            near = track_indexes[region_indexes == region_index]
+            if region.kind == Region.LINE:
+                if len(near):
+                    region.update_line(ids[near], previous[near], current[near])
+            else:
+                region.update_polygon(ids[near], current[near], all_track_ids, timestamp)
+
+            region.total_in_count += region.in_count
+            region.total_out_count += region.out_count
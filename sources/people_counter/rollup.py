@@ -0,0 +1,86 @@
+from typing import Optional
+
+from .tables.detection import Detection, ns_to_str
+
+
+class Rollup:
+    """
+    Detections of a wall-clock time bucket: sum of the in/out counts,
+    max/mean people count and number of detections.
+    """
+
+    __slots__ = (
+        "start_ns", "duration", "people_image_max", "people_image_sum",
+        "people_line_in_count", "people_line_out_count", "sample_count")
+
+    def __init__(self, start_ns: int, duration: int) -> None:
+        # Start of the bucket (epoch time in nanoseconds) and its duration in seconds
+        self.start_ns: int = start_ns
+        self.duration: int = duration
+
+        self.people_image_max: int = 0
+        self.people_image_sum: int = 0
+        self.people_line_in_count: int = 0
+        self.people_line_out_count: int = 0
+        self.sample_count: int = 0
+
+    @property
+    def people_image_mean(self) -> float:
+        return self.people_image_sum / self.sample_count if self.sample_count else 0
+
+    @property
+    def start(self) -> str:
+        return ns_to_str(self.start_ns)
+
+    def add(self, detection: Detection) -> None:
+        self.people_image_max = max(self.people_image_max, detection.people_image_count)
+        self.people_image_sum += detection.people_image_count
+        self.people_line_in_count += detection.people_line_in_count
+        self.people_line_out_count += detection.people_line_out_count
+        self.sample_count += 1
+
+
+class TimeBucketAggregator:
+    """
+    Roll the detections into buckets aligned on the wall clock
+    (ex: each minute at hh:mm:00 for duration=60).
+    A bucket is closed by the first detection of a following bucket,
+    or flushed (counting stopped, shutdown, no detection for a while).
+    """
+
+    def __init__(self, duration: int) -> None:
+        # Duration of the buckets in seconds
+        self.duration: int = duration
+        self.duration_ns: int = duration * 1_000_000_000
+
+        # Bucket being filled
+        self.current: Optional[Rollup] = None
+
+    def add(self, detection: Detection) -> Optional[Rollup]:
+        """
+        Add the detection to its bucket.
+        :return: The previous bucket if the detection closed it, else None
+        """
+        start_ns = detection.time_ns - detection.time_ns % self.duration_ns
+
+        closed: Optional[Rollup] = None
+        if self.current is None or self.current.start_ns != start_ns:
+            closed = self.current
+            self.current = Rollup(start_ns, self.duration)
+
+        self.current.add(detection)
+        return closed
+
+    def flush(self, now_ns: Optional[int] = None) -> Optional[Rollup]:
+        """
+        Close the bucket being filled, if any.
+        :param now_ns: If given, close it only once ended for a bucket duration:
+            the late detections of the bucket are still added meanwhile.
+        :return: The closed bucket, else None
+        """
+        if self.current is None:
+            return None
+        if now_ns is not None and now_ns < self.current.start_ns + 2 * self.duration_ns:
+            return None
+        closed, self.current = self.current, None
+        return closed
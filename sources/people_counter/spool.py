@@ -0,0 +1,154 @@
+import logging
+import sqlite3
+from pathlib import Path
+from typing import Optional
+
+from .rollup import Rollup
+from .tables.detection import Detection
+
+# Row of a spool table, the first column is the id:
+# - detections: (id, people_image_count, people_line_in_count, people_line_out_count, time_ns)
+# - rollups: (id, start_ns, duration, people_image_max, people_image_mean,
+#             people_line_in_count, people_line_out_count, sample_count)
+SpoolRow = tuple
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+# Columns of the spool tables (without the id)
+SPOOL_TABLES: dict[str, tuple[str, ...]] = {
+    "detections": (
+        "people_image_count INTEGER NOT NULL",
+        "people_line_in_count INTEGER NOT NULL",
+        "people_line_out_count INTEGER NOT NULL",
+        "time_ns INTEGER NOT NULL",
+    ),
+    "rollups": (
+        "start_ns INTEGER NOT NULL",
+        "duration INTEGER NOT NULL",
+        "people_image_max INTEGER NOT NULL",
+        "people_image_mean REAL NOT NULL",
+        "people_line_in_count INTEGER NOT NULL",
+        "people_line_out_count INTEGER NOT NULL",
+        "sample_count INTEGER NOT NULL",
+    ),
+}
+
+
+class DetectionSpool:
+    """
+    Durable queue of the detections waiting for insertion (SQLite in WAL mode).
+
+    The detections (and their time bucket rollups) are appended by the counter,
+    then read in order by the insertion and deleted only once acknowledged by
+    the database. The spool survives restarts and network outages. Its size is
+    bounded: past [max_size] rows in a table, the oldest ones are dropped.
+
+    With path=None, the spool is in memory (replay, benchmark).
+    """
+
+    def __init__(self, path: Optional[str | Path] = None, max_size: int = 7 * 24 * 3600) -> None:
+        self.path: str = str(path) if path is not None else ":memory:"
+
+        # Maximum number of rows of a table (a week of one detection per second)
+        self.max_size: int = max_size
+
+        # Number of rows dropped because the spool was full
+        self.dropped_count: int = 0
+
+        if path is not None:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        self.connection = sqlite3.connect(self.path)
+        # Incremental vacuum must be set before the table creation
+        self.connection.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        # WAL: an append is a sequential write, synced at the checkpoints only
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        for table, columns in SPOOL_TABLES.items():
+            self.connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} "
+                f"(id INTEGER PRIMARY KEY AUTOINCREMENT, {', '.join(columns)})")
+        self.connection.commit()
+
+        # Number of rows of each table, kept to avoid a COUNT at each len()
+        self.sizes: dict[str, int] = {
+            table: self.connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in SPOOL_TABLES
+        }
+        if len(self):
+            logger.info(f"Rows recovered from the spool {self.path}: {self.sizes}")
+
+    def __len__(self) -> int:
+        return sum(self.sizes.values())
+
+    def append_row(self, table: str, values: tuple) -> None:
+        """
+        Append the row to the table, dropping the oldest ones if it is full.
+        """
+        with self.connection:
+            self.connection.execute(
+                f"INSERT INTO {table} VALUES (NULL{', ?' * len(values)})", values)
+        self.sizes[table] += 1
+
+        # Drop at least 1% at a time, not one row at each append
+        if self.sizes[table] > self.max_size:
+            self.drop_oldest(table, max(self.sizes[table] - self.max_size, self.max_size // 100))
+
+    def append(self, detection: Detection) -> None:
+        self.append_row("detections", (
+            detection.people_image_count, detection.people_line_in_count,
+            detection.people_line_out_count, detection.time_ns))
+
+    def append_rollup(self, rollup: Rollup) -> None:
+        self.append_row("rollups", (
+            rollup.start_ns, rollup.duration, rollup.people_image_max, rollup.people_image_mean,
+            rollup.people_line_in_count, rollup.people_line_out_count, rollup.sample_count))
+
+    def drop_oldest(self, table: str, count: int) -> None:
+        with self.connection:
+            self.connection.execute(
+                f"DELETE FROM {table} WHERE id IN (SELECT id FROM {table} ORDER BY id LIMIT ?)", (count,))
+        self.sizes[table] -= count
+        self.dropped_count += count
+        logger.warning(f"Spool full: {count} oldest {table} dropped ({self.dropped_count} in total)")
+
+    def peek(self, limit: int, table: str = "detections") -> list[SpoolRow]:
+        """
+        Oldest rows of the table (not removed), as tuples: no Detection object
+        is created. The first column is the id, used for the acknowledgement.
+        """
+        return self.connection.execute(
+            f"SELECT * FROM {table} ORDER BY id LIMIT ?", (limit,)).fetchall()
+
+    def acknowledge(self, first_id: int, last_id: int, table: str = "detections") -> None:
+        """
+        Remove the rows from [first_id] to [last_id] (included), inserted to the database.
+        """
+        with self.connection:
+            deleted = self.connection.execute(
+                f"DELETE FROM {table} WHERE id BETWEEN ? AND ?", (first_id, last_id)).rowcount
+        self.sizes[table] -= deleted
+
+        # Give back the disk space once drained
+        if not len(self):
+            self.compact()
+
+    def clear(self) -> None:
+        with self.connection:
+            for table in SPOOL_TABLES:
+                self.connection.execute(f"DELETE FROM {table}")
+                self.sizes[table] = 0
+        self.compact()
+
+    def compact(self) -> None:
+        """
+        Truncate the write-ahead log and free the unused pages of the database.
+        """
+        self.connection.execute("PRAGMA incremental_vacuum")
+        self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self) -> None:
+        self.connection.close()
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+import cv2
+
+from .encoding import EncodedFrameCache, FrameKey
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+class FrameStreamer:
+    """
+    Live stream of the processed frames to the web clients (MJPEG, WebSocket).
+
+    Each new frame is encoded once in a worker thread, only if a client is
+    subscribed, and the encoded bytes are shared by all the clients (and kept
+    in the frame cache for /last_frame). A client always gets the latest
+    encoded frame: the frames published while it is sending (slow link) are
+    dropped for this client only.
+    """
+
+    def __init__(
+        self,
+        quality: int = 70,
+        width: int = 640,
+        frame_cache: Optional[EncodedFrameCache] = None,
+    ) -> None:
+        # JPEG quality (1-100)
+        self.quality: int = quality
+
+        # Maximum width of the streamed frames, downscaled if wider (0 for the original size)
+        self.width: int = width
+
+        # Encoded frames, shared with /last_frame
+        self.frame_cache: EncodedFrameCache = frame_cache if frame_cache is not None else EncodedFrameCache()
+
+        # One worker: a frame is encoded at a time, the frames published meanwhile are skipped
+        self.encode_executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="stream")
+        self.encode_task: Optional[asyncio.Task] = None
+
+        # Last encoded frame and its sequence number (0 if none)
+        self.sequence: int = 0
+        self.image: bytes = b""
+
+        # Number of connected clients, nothing is encoded without clients
+        self.subscriber_count: int = 0
+
+        # Notify the clients waiting for a new frame
+        self.condition = asyncio.Condition()
+
+    def set_quality(self, quality: int | str) -> bool:
+        try:
+            quality = int(quality)
+        except ValueError:
+            logger.error(f"Stream quality is not integer: quality={quality}")
+            return False
+
+        if quality < 1 or quality > 100:
+            logger.error(f"Stream quality not between 1 and 100: quality={quality}")
+            return False
+
+        self.quality = quality
+        logger.info(f"Set stream quality={quality}")
+        return True
+
+    def set_width(self, width: int | str) -> bool:
+        try:
+            width = int(width)
+        except ValueError:
+            logger.error(f"Stream width is not integer: width={width}")
+            return False
+
+        if width < 0 or width > 9999:
+            logger.error(f"Stream width not between 0 and 9999: width={width}")
+            return False
+
+        self.width = width
+        logger.info(f"Set stream width={width}")
+        return True
+
+    @contextmanager
+    def subscribe(self) -> Iterator[None]:
+        """
+        Count the client as subscribed during the block.
+        """
+        self.subscriber_count += 1
+        try:
+            yield
+        finally:
+            self.subscriber_count -= 1
+
+    def publish(self, frame: cv2.typing.MatLike, sequence: int) -> None:
+        """
+        Encode the frame for the subscribed clients, in the background.
+        Skipped without clients or if the previous frame is still being encoded.
+        """
+        if not self.subscriber_count:
+            return
+        if self.encode_task is not None and not self.encode_task.done():
+            return
+
+        # The frame buffer returns to the capture ring at the next frame: encode a copy
+        self.encode_task = asyncio.get_running_loop().create_task(self.encode(frame.copy(), sequence))
+
+    async def encode(self, frame: cv2.typing.MatLike, sequence: int) -> None:
+        image = await asyncio.get_running_loop().run_in_executor(
+            self.encode_executor, self.frame_cache.encode, frame, (sequence, "jpg", self.quality, self.width))
+        if image is None:
+            logger.error(f"Failed to encode the frame {sequence}")
+            return
+
+        async with self.condition:
+            self.sequence = sequence
+            self.image = image
+            self.condition.notify_all()
+
+    async def encode_frame(self, frame: cv2.typing.MatLike, key: FrameKey) -> Optional[bytes]:
+        """
+        Encode a copy of the frame with the parameters of the key (see EncodedFrameCache),
+        in the encoding thread of the stream. The encoded frame is cached.
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            self.encode_executor, self.frame_cache.encode, frame.copy(), key)
+
+    async def next_frame(self, after_sequence: int, timeout: float = 10) -> Optional[tuple[int, bytes]]:
+        """
+        Wait for an encoded frame newer than [after_sequence].
+        :return: The sequence number and the JPEG bytes, None if the timeout expired
+        """
+        async with self.condition:
+            try:
+                await asyncio.wait_for(
+                    self.condition.wait_for(lambda: self.sequence != after_sequence and self.image),
+                    timeout)
+            except asyncio.TimeoutError:
+                return None
+            return self.sequence, self.image
@@ -1,19 +1,54 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import Optional
+import time
+
+
+def datetime_to_ns(detection_time: datetime) -> int:
+    """
+    Epoch time in nanoseconds (microsecond precision) of a datetime (naive is local time).
+    """
+    return round(detection_time.timestamp() * 1_000_000) * 1000
+
+
+def ns_to_str(time_ns: int) -> str:
+    """
+    Local time of an epoch time in nanoseconds, as str(datetime) with microseconds.
+    """
+    seconds, nanoseconds = divmod(time_ns, 1_000_000_000)
+    return str(datetime.fromtimestamp(seconds) + timedelta(microseconds=nanoseconds // 1000))
 
 
 class Detection:
 
+    # No __dict__: one small object for each detection
+    __slots__ = ("people_image_count", "people_line_in_count", "people_line_out_count", "time_ns")
+
     def __init__(
         self,
         people_image_count: int,
         people_line_in_count: int,
         people_line_out_count: int,
+        detection_time: Optional[datetime | int] = None,
     ) -> None:
         self.people_image_count: int = people_image_count
         self.people_line_in_count: int = people_line_in_count
         self.people_line_out_count: int = people_line_out_count
 
-        self.time: str = str(datetime.now())  # Keep microsend for exact detection time
+        # Epoch time in nanoseconds, formatted only for the insertion
+        # The time is given when replaying a video or reading the spool, else it is now.
+        if detection_time is None:
+            self.time_ns: int = time.time_ns()
+        elif isinstance(detection_time, datetime):
+            self.time_ns = datetime_to_ns(detection_time)
+        else:
+            self.time_ns = detection_time
+
+    @property
+    def time(self) -> str:
+        """
+        Local time with microseconds (column temps of the database).
+        """
+        return ns_to_str(self.time_ns)
 
     # TODO: Add the insertion to the Detection class?
     # - The foreign device/location/resolution key fields.
@@ -0,0 +1,108 @@
+from abc import ABC, abstractmethod
+from typing import Any, Optional
+from postgrest import AsyncPostgrestClient
+from postgrest.types import ReturnMethod
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+class ForeignKey(ABC):
+    """
+    Row referenced by the detections (device, location or resolution)
+    whose id is retrieved from the database.
+    The subclasses define the row: label and row().
+    """
+
+    def __init__(self, table_name: str, id_column_name: str) -> None:
+        self.table_name: str = table_name
+        self.id_column_name: str = id_column_name
+
+        self.id: int = 0 # Uninitialised
+
+        # Time of the last id retrieval (time.monotonic), None if not retrieved
+        # from the database (unknown or restored id, always expired)
+        self.retrieval_time: Optional[float] = None
+
+        self.last_exception: Exception = Exception() # Empty exception
+
+    @property
+    @abstractmethod
+    def label(self) -> str:
+        """
+        Name of the row in the logs and the local cache of the ids.
+        """
+
+    @abstractmethod
+    def row(self) -> dict[str, Any]:
+        """
+        Columns identifying the row, to find or insert it.
+        """
+
+    def invalidate(self) -> None:
+        self.id = 0
+        self.retrieval_time = None
+
+    def is_expired(self, ttl: float) -> bool:
+        return not self.id or self.retrieval_time is None or time.monotonic() - self.retrieval_time > ttl
+
+    async def retrieve_id(
+        self,
+        postgrest_client: AsyncPostgrestClient,
+        ttl: float = float("inf"),
+        insert_missing: bool = False,
+    ) -> bool:
+        """
+        Retrieve the id from the database given the row columns.
+        The id is kept [ttl] seconds, then retrieved again (the previous one
+        is kept if the database is unreachable).
+        :param insert_missing: Insert the row if it is not found.
+        :return: True if the id is known, else False
+        """
+        # If the id exists and is fresh
+        if not self.is_expired(ttl):
+            return True
+
+        # Check if the row is identified
+        if not self.label:
+            self.last_exception = Exception(f"No {self.table_name} name")
+            logger.error(f"No {self.table_name} name")
+            return False
+
+        # Fetch the id from the table
+        try:
+            query = postgrest_client.table(self.table_name).select(self.id_column_name).limit(1)
+            for column, value in self.row().items():
+                query = query.like(column, value) if isinstance(value, str) else query.eq(column, value)
+            response = await query.execute()
+
+            # If it is not found (empty list), insert it
+            if not response.data and insert_missing:
+                logger.info(f"Insert the missing {self.table_name} row: {self.label}")
+                response = await (
+                    postgrest_client.table(self.table_name)
+                    .insert(self.row(), returning=ReturnMethod.representation)
+                    .execute()
+                )
+        except Exception as e:
+            self.last_exception = e
+            logger.error(f"Failed to get the {self.table_name} id of {self.label}: {e}")
+            # Keep the expired id, if any: the database may be unreachable
+            return bool(self.id)
+
+        # If it is not found (empty list)
+        if not response.data:
+            self.invalidate()
+            self.last_exception = Exception(f"{self.table_name} id not found")
+            logger.info(f"{self.table_name} id not found: {self.label}")
+            return False
+
+        # Id is the first selected value in the list
+        self.id = response.data[0][self.id_column_name]
+        self.retrieval_time = time.monotonic()
+        self.last_exception = Exception()
+        logger.info(f"Fetch the {self.table_name} id of {self.label}: {self.id}")
+        return True
@@ -1,19 +1,39 @@
+import asyncio
+import json
+import time
 from pathlib import Path
-from aiohttp import web
+from typing import Any, Optional
+from aiohttp import web, WSMsgType
 import aiohttp_jinja2
-import cv2
 import jinja2
 import logging
 
 from .configuration import Configuration
 from .counter import Counter
 from .pgclient import PGClient
+from .encoding import IMAGE_FORMATS
+from .models import BACKENDS
+from .recorder import VIDEO_CODECS
 
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
 
+def results_delta(previous: dict[str, Any], current: dict[str, Any]) -> dict[str, Any]:
+    """
+    Values of [current] different from [previous], recursively for the nested dicts.
+    """
+    delta: dict[str, Any] = {}
+    for key, value in current.items():
+        if isinstance(value, dict) and isinstance(previous.get(key), dict):
+            if nested_delta := results_delta(previous[key], value):
+                delta[key] = nested_delta
+        elif key not in previous or previous[key] != value:
+            delta[key] = value
+    return delta
+
+
 class Web:
 
     def __init__(
@@ -21,18 +41,29 @@ class Web:
         counter: Counter,
         pgclient: PGClient,
         configurator: Configuration,
+        port: int = 8080,
     ) -> None:
         self.counter = counter
         self.pgclient = pgclient
         self.configurator = configurator
 
+        # One port for each counter in multi-camera mode
+        self.port = port
+
         self.update_interval = 1
 
+        # Maximum wait for the frame being processed (/last_frame)
+        self.frame_timeout = 5
+
     async def handle_last_frame(self, request: web.Request) -> web.Response:
         """
         Display the last camera frame.
         It is annotated if counting is activated.
-        The numpy array is encode to jpg before sending.
+        The numpy array is encode to jpg (or webp) before sending, once for each
+        frame and parameters: the encoded frames are cached, and the browsers
+        revalidate with the ETag (304 if the frame is unchanged).
+
+        Query parameters: format (jpg or webp), quality (1-100), width (0 for the original size).
         """
         # encoding speed sort (timeit): bmp, jpg, png
         # 0.012, 0.497, 1.2771 secondes/(100xframes)
@@ -40,9 +71,98 @@ class Web:
         # 50784, 296532, 921654 bytes
         if self.counter.last_frame is None:
             return web.Response(text="No camera image")
-        else:
-            _, image = cv2.imencode(".jpg", self.counter.last_frame)
-            return web.Response(body=image.tobytes(), content_type="image/jpg")
+
+        image_format = request.query.get("format", "jpg")
+        try:
+            quality = int(request.query.get("quality", 95))
+            width = int(request.query.get("width", 0))
+        except ValueError:
+            raise web.HTTPBadRequest(text="quality and width must be integers")
+        if image_format not in IMAGE_FORMATS or not 1 <= quality <= 100 or width < 0:
+            raise web.HTTPBadRequest(text=f"format in {list(IMAGE_FORMATS)}, quality in 1-100, width positive")
+
+        frame_cache = self.counter.frame_cache
+        key = (self.counter.frame_sequence, image_format, quality, width)
+        content_type = "image/jpeg" if image_format == "jpg" else f"image/{image_format}"
+        headers = {"Cache-Control": "no-cache"}
+
+        # While the next frame is processed (not final yet), serve the cached previous frame.
+        # Else wait for the frame being processed and encode it in the thread of the stream.
+        if (image := frame_cache.get(key)) is None:
+            deadline = time.time() + self.frame_timeout
+            while not self.counter.frame_complete and time.time() < deadline:
+                await asyncio.sleep(0.01)
+            if not self.counter.frame_complete or self.counter.last_frame is None:
+                raise web.HTTPServiceUnavailable(text="No complete frame")
+
+            key = (self.counter.frame_sequence, image_format, quality, width)
+            if (image := await self.counter.streamer.encode_frame(self.counter.last_frame, key)) is None:
+                raise web.HTTPInternalServerError(text="Failed to encode the frame")
+
+        headers["ETag"] = frame_cache.etag(key)
+        if request.headers.get("If-None-Match") == headers["ETag"]:
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=image, content_type=content_type, headers=headers)
+
+    def is_disconnected(self, request: web.Request) -> bool:
+        return request.transport is None or request.transport.is_closing()
+
+    async def handle_stream(self, request: web.Request) -> web.StreamResponse:
+        """
+        Live MJPEG stream of the processed frames (multipart/x-mixed-replace),
+        displayed by an <img> tag without refreshing the page.
+        Each frame is encoded once for all the clients (see FrameStreamer).
+        """
+        response = web.StreamResponse(headers={
+            "Content-Type": "multipart/x-mixed-replace; boundary=frame",
+            "Cache-Control": "no-cache",
+        })
+        await response.prepare(request)
+
+        sequence = 0
+        with self.counter.streamer.subscribe():
+            while not self.is_disconnected(request):
+                # None if no frame was processed meanwhile (counter stopped)
+                if (frame := await self.counter.streamer.next_frame(sequence)) is None:
+                    continue
+                sequence, image = frame
+                try:
+                    await response.write(
+                        b"--frame\r\nContent-Type: image/jpeg\r\n"
+                        + f"Content-Length: {len(image)}\r\n\r\n".encode()
+                        + image + b"\r\n")
+                except ConnectionError:
+                    break
+        return response
+
+    async def handle_stream_websocket(self, request: web.Request) -> web.WebSocketResponse:
+        """
+        Live stream of the processed frames over a WebSocket: one binary JPEG message per frame.
+        """
+        websocket = web.WebSocketResponse(heartbeat=30)
+        await websocket.prepare(request)
+
+        async def send_frames() -> None:
+            sequence = 0
+            while not websocket.closed:
+                if (frame := await self.counter.streamer.next_frame(sequence)) is None:
+                    continue
+                sequence, image = frame
+                try:
+                    await websocket.send_bytes(image)
+                except ConnectionError:
+                    break
+
+        with self.counter.streamer.subscribe():
+            sender = asyncio.create_task(send_frames())
+            try:
+                # Wait for the client to close (the received messages are ignored)
+                async for message in websocket:
+                    if message.type == WSMsgType.ERROR:
+                        break
+            finally:
+                sender.cancel()
+        return websocket
 
     async def handle_last_result(self, request: web.Request) -> web.Response:
         """
@@ -62,6 +182,59 @@ class Web:
         else:
             return web.Response(text=str(self.counter.last_result.boxes))
 
+    async def handle_clips(self, request: web.Request) -> web.Response:
+        """
+        Index of the crossing clips as JSON, only those of a track with ?track_id=.
+        """
+        track_id: Optional[int] = None
+        if "track_id" in request.query:
+            try:
+                track_id = int(request.query["track_id"])
+            except ValueError:
+                raise web.HTTPBadRequest(text="track_id must be an integer")
+        # The index file is read in a thread
+        clips = await asyncio.get_running_loop().run_in_executor(None, self.counter.clip_recorder.find, track_id)
+        return web.json_response(clips)
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        """
+        Prometheus metrics: duration histograms of each stage, gauges and cumulative counters.
+        """
+        gauges = {
+            "fps": (self.counter.fps, "Processed frames per second"),
+            "capture_fps": (
+                self.counter.capture.fps if self.counter.capture is not None else 0,
+                "Captured frames per second"),
+            "remaining_time_seconds": (self.counter.remaining_time, "Time to sleep before the next frame"),
+            "people_image_count": (self.counter.people_image_count, "People on the last frame"),
+            "people_total_in_count": (self.counter.total_in_count, "People entering since the last reset"),
+            "people_total_out_count": (self.counter.total_out_count, "People leaving since the last reset"),
+            "buffer_length": (len(self.pgclient.detection_buffer), "Detections waiting for insertion"),
+        }
+        # Cumulative values since the start
+        counters = {
+            "buffer_dropped_total": (self.pgclient.detection_buffer.dropped_count, "Detections dropped, buffer full"),
+            "frame_cache_hit_total": (self.counter.frame_cache.hit_count, "Frames served without encoding"),
+            "frame_cache_miss_total": (self.counter.frame_cache.miss_count, "Frames encoded"),
+            "skipped_ticks_total": (self.counter.pacer.skipped_ticks, "Frames skipped, processing lagging"),
+            "skipped_inferences_total": (self.counter.skipped_inferences, "Inferences skipped without motion"),
+            "video_dropped_frames_total": (
+                self.counter.video_recorder.dropped_count, "Frames not written to the video, recorder lagging"),
+            "clip_dropped_frames_total": (
+                self.counter.clip_recorder.dropped_count, "Frames not kept for the clips, recorder lagging"),
+        }
+        lines: list[str] = []
+        for metric_type, metrics in (("gauge", gauges), ("counter", counters)):
+            for name, (value, description) in metrics.items():
+                lines += [
+                    f"# HELP trafficount_{name} {description}",
+                    f"# TYPE trafficount_{name} {metric_type}",
+                    f"trafficount_{name} {value}",
+                ]
+        lines += self.counter.metrics.to_prometheus()
+        lines += self.pgclient.metrics.to_prometheus()
+        return web.Response(text="\n".join(lines) + "\n", content_type="text/plain", charset="utf-8")
+
     async def handle_index(self, request: web.Request) -> web.Response:
         """
         Handle the index page and toggle mode if requested
@@ -86,6 +259,7 @@ class Web:
                     self.pgclient.detection_buffer.clear()
                     self.counter.total_in_count = 0
                     self.counter.total_out_count = 0
+                    self.counter.regions.reset()
 
             # Testing features (image annotation and video)
             if "toggle_image_annotation" in data:
@@ -94,13 +268,26 @@ class Web:
             if "toggle_video_writer" in data:
                 self.counter.toggle_video_writer()
 
+            if "toggle_clip_recording" in data:
+                self.counter.toggle_clip_recording()
+
+            # Performance
+            if "toggle_adaptive_pacing" in data:
+                self.counter.toggle_adaptive_pacing()
+
+            if "toggle_resolution_shedding" in data:
+                self.counter.toggle_resolution_shedding()
+
+            if "toggle_motion_gating" in data:
+                self.counter.toggle_motion_gating()
+
             # Redirect with the GET method
             raise web.HTTPSeeOther(request.rel_url.path)
 
         context = {
             # Status must be booleans
             'model_status': self.counter.model is not None,
-            'camera_status': self.counter.cap is not None,
+            'camera_status': self.counter.capture is not None,
             'postgrest_client_status': self.pgclient.postgrest_client is not None,
 
             # Modes must be booleans
@@ -110,15 +297,29 @@ class Web:
             # Testing features
             'activate_image_annotation': self.counter.activate_image_annotation,
             'activate_video_writer': self.counter.activate_video_writer,
+            'video_filename': self.counter.video_recorder.filename,
+            'video_dropped_count': self.counter.video_recorder.dropped_count,
+            'activate_clip_recording': self.counter.activate_clip_recording,
+            'clip_count': self.counter.clip_recorder.clip_count,
+            'last_clip_filename': self.counter.clip_recorder.last_clip_filename,
+
+            # Performance
+            'activate_adaptive_pacing': self.counter.activate_adaptive_pacing,
+            'activate_resolution_shedding': self.counter.pacer.allow_resolution_shedding,
+            'shedding_level': self.counter.pacer.level,
+            'skipped_ticks': self.counter.pacer.skipped_ticks,
+            'activate_motion_gating': self.counter.activate_motion_gating,
+            'skipped_inferences': self.counter.skipped_inferences,
         }
         response = await aiohttp_jinja2.render_template_async(
             'index.html', request, context)
         return response
 
-    async def handle_results(self, request: web.Request) -> web.Response:
+    def results_snapshot(self) -> dict[str, Any]:
         """
+        Counts, buffer and stage timings of the counter (JSON serializable).
         """
-        context = {
+        return {
             'people_image_count': self.counter.people_image_count,
             'people_increment': self.counter.greatest_id,
 
@@ -127,9 +328,67 @@ class Web:
             'people_total_in_count': self.counter.total_in_count,
             'people_total_out_count': self.counter.total_out_count,
 
-            'remaining_time': self.counter.remaining_time,
+            'remaining_time': round(self.counter.remaining_time, 3),
             'buffer_length': len(self.pgclient.detection_buffer),
+            'buffer_dropped_count': self.pgclient.detection_buffer.dropped_count,
+
+            'regions': {
+                region.name: {
+                    'in_count': region.in_count,
+                    'out_count': region.out_count,
+                    'total_in_count': region.total_in_count,
+                    'total_out_count': region.total_out_count,
+                    'occupancy': region.occupancy,
+                    'dwell_count': region.dwell_count,
+                } for region in self.counter.regions
+            },
+
+            'fps': round(self.counter.fps, 2),
+            'capture_fps': round(self.counter.capture.fps, 2) if self.counter.capture is not None else 0,
+            'timings': self.counter.metrics.summary() | self.pgclient.metrics.summary(),
+        }
+
+    async def handle_results_snapshot(self, request: web.Request) -> web.Response:
+        """
+        Results as JSON, for the machines (central dashboard).
+        """
+        return web.json_response(self.results_snapshot())
+
+    async def handle_results_events(self, request: web.Request) -> web.StreamResponse:
+        """
+        Server-Sent Events of the results: the whole snapshot at the connection
+        (event "snapshot"), then only the changed values every [update_interval]
+        seconds (default event). A comment keeps the connection alive meanwhile.
+        """
+        response = web.StreamResponse(headers={
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache",
+        })
+        await response.prepare(request)
+
+        previous = self.results_snapshot()
+        try:
+            await response.write(f"event: snapshot\ndata: {json.dumps(previous)}\n\n".encode())
+            while not self.is_disconnected(request):
+                await asyncio.sleep(self.update_interval)
+                current = self.results_snapshot()
+                if delta := results_delta(previous, current):
+                    await response.write(f"data: {json.dumps(delta)}\n\n".encode())
+                else:
+                    await response.write(b": keep-alive\n\n")
+                previous = current
+        except ConnectionError:
+            pass
+        return response
+
+    async def handle_results(self, request: web.Request) -> web.Response:
+        """
+        """
+        context = self.results_snapshot() | {
+            'regions': list(self.counter.regions),
             # 'boxes': self.counter.last_result.boxes,
+
+            'live': request.get('live', False),
         }
         response = await aiohttp_jinja2.render_template_async(
             'results.html', request, context)
@@ -137,10 +396,11 @@ class Web:
 
     async def handle_results_live(self, request: web.Request) -> web.Response:
         """
+        Results page updated by the Server-Sent Events (/results/events),
+        rendered once instead of refreshed every [update_interval] seconds.
         """
-        response = await self.handle_results(request)
-        response.headers['refresh'] = str(self.update_interval)
-        return response
+        request['live'] = True
+        return await self.handle_results(request)
 
     async def handle_configure_camera(self, request: web.Request) -> web.Response:
         """
@@ -148,6 +408,23 @@ class Web:
         data_post = await request.post()
         data: dict[str, str] = {k: v for k, v in data_post.items() if isinstance(v, str)}
         if data:
+            if camera_source := data.get('camera_source'):
+                self.counter.set_camera_source(camera_source)
+
+            # Region of interest: "x1,y1,x2,y2", "none" for the whole frame
+            if roi := data.get('roi'):
+                self.counter.set_roi(None if roi.lower() == "none" else tuple(roi.split(",")))
+            if roi_margin := data.get('roi_margin'):
+                self.counter.set_roi_margin(roi_margin)
+            if auto_roi := data.get('auto_roi'):
+                self.counter.toggle_auto_roi(force=(auto_roi == "True"))
+
+            # Live stream
+            if stream_quality := data.get('stream_quality'):
+                self.counter.streamer.set_quality(stream_quality)
+            if stream_width := data.get('stream_width'):
+                self.counter.streamer.set_width(stream_width)
+
             if ((p1_x := data.get('line_first_point_x')) and
                 (p1_y := data.get('line_first_point_y'))):
                 self.counter.set_region_point_index((p1_x, p1_y), 0)
@@ -155,12 +432,32 @@ class Web:
                 (p2_y := data.get('line_second_point_y'))):
                 self.counter.set_region_point_index((p2_x, p2_y), 1)
 
+            # Additional regions. Points are written "x1,y1 x2,y2 ..."
+            if ((region_name := data.get('region_name')) and
+                (region_points := data.get('region_points'))):
+                self.counter.regions.add_region(
+                    region_name,
+                    data.get('region_type', ''),
+                    [point.split(",") for point in region_points.split()],
+                    data.get('region_dwell_time') or 0)
+            if remove_region_name := data.get('remove_region_name'):
+                self.counter.regions.remove_region(remove_region_name)
+
             # Redirect with the GET method
             raise web.HTTPSeeOther(request.rel_url.path)
 
         context = {
+            'camera_source': self.counter.camera_source,
+            'roi': self.counter.roi,
+            'roi_margin': self.counter.roi_margin,
+            'auto_roi': self.counter.activate_auto_roi,
+            'model_format': self.counter.model_format,
+            'dynamic_inference_size': self.counter.dynamic_inference_size,
+            'stream_quality': self.counter.streamer.quality,
+            'stream_width': self.counter.streamer.width,
             'line_first_point': self.counter.region[0],
             'line_second_point': self.counter.region[1],
+            'regions': list(self.counter.regions),
         }
         response = await aiohttp_jinja2.render_template_async(
             'camera.html', request, context)
@@ -183,10 +480,14 @@ class Web:
                 self.pgclient.set_url(url)
             if key := data.get('key'):
                 self.pgclient.set_key(key)
-            if url or key:
+            if "toggle_verify_certificate" in data:
+                self.pgclient.toggle_verify_certificate()
+            if url or key or "toggle_verify_certificate" in data:
                 self.pgclient.init_pgclient()
 
             # Database tables foreign ids
+            if "toggle_foreign_key_insertion" in data:
+                self.pgclient.toggle_foreign_key_insertion()
             if device_name := data.get('device_name'):
                 await self.pgclient.update_device(device_name)
             if location_name := data.get('location_name'):
@@ -202,6 +503,21 @@ class Web:
             if error_delay := data.get('error_delay'):
                 self.pgclient.set_error_delay(error_delay)
 
+            # Insertion chunks
+            if insertion_chunk_size := data.get('insertion_chunk_size'):
+                self.pgclient.set_insertion_chunk_size(insertion_chunk_size)
+            if insertion_chunk_bytes := data.get('insertion_chunk_bytes'):
+                self.pgclient.set_insertion_chunk_bytes(insertion_chunk_bytes)
+            if insertion_concurrency := data.get('insertion_concurrency'):
+                self.pgclient.set_insertion_concurrency(insertion_concurrency)
+
+            # Rollups (the detections are never dropped: raw insertion can't be
+            # turned off without rollup durations, see the setters)
+            if rollup_durations := data.get('rollup_durations'):
+                self.pgclient.set_rollup_durations(rollup_durations)
+            if "toggle_raw_insertion" in data:
+                self.pgclient.toggle_raw_insertion()
+
             # Redirect with the GET method
             raise web.HTTPSeeOther(request.rel_url.path)
 
@@ -210,6 +526,18 @@ class Web:
             'key': "x" if self.pgclient.key else "",
             'insertion_delay': self.pgclient.insertion_delay,
             'error_delay': self.pgclient.error_delay,
+            'insertion_chunk_size': self.pgclient.insertion_chunk_size,
+            'insertion_chunk_bytes': self.pgclient.insertion_chunk_bytes,
+            'insertion_concurrency': self.pgclient.insertion_concurrency,
+            'insertion_failures': self.pgclient.insertion_failures,
+            'verify_certificate': self.pgclient.verify_certificate,
+            'rollup_durations': ",".join(str(duration) for duration in self.pgclient.rollup_durations),
+            'raw_insertion': self.pgclient.activate_raw_insertion,
+
+            'connection_status': self.pgclient.connection_status,
+            'connection_message': self.pgclient.connection_message,
+            'connection_last_date': self.pgclient.connection_last_date,
+            'http_version': self.pgclient.http_version,
 
             'device_name': self.pgclient.device.name,
             'location_name': self.pgclient.location.name,
@@ -223,6 +551,7 @@ class Web:
             'device_exception': str(self.pgclient.device.last_exception),
             'location_exception': str(self.pgclient.location.last_exception),
             'resolution_exception': str(self.pgclient.resolution.last_exception),
+            'foreign_key_insertion': self.pgclient.resolver.insert_missing,
 
             'last_insertion_date': self.pgclient.last_insertion_date,
             'last_insertion_count': self.pgclient.last_insertion_count,
@@ -245,14 +574,71 @@ class Web:
                 self.counter.set_confidence(confidence)
             if aggregated_frames_number := data.get('aggregated_frames_number'):
                 self.counter.set_aggregated_frames_number(aggregated_frames_number)
+            if motion_heartbeat := data.get('motion_heartbeat'):
+                self.counter.set_motion_heartbeat(motion_heartbeat)
+            if any(data.get(key) for key in ('model_name', 'model_format', 'model_imgsz')):
+                model_name, model_format, model_imgsz = self.counter.requested_model
+                self.counter.set_model(
+                    data.get('model_name') or model_name,
+                    data.get('model_format') or model_format,
+                    data.get('model_imgsz') or model_imgsz,
+                )
+
+            # Video recording, applied at the next video segment
+            video_recorder = self.counter.video_recorder
+            if video_codec := data.get('video_codec'):
+                video_recorder.set_codec(video_codec)
+            if video_fps := data.get('video_fps'):
+                video_recorder.set_fps(video_fps)
+            if video_quality := data.get('video_quality'):
+                video_recorder.set_quality(video_quality)
+            if video_hardware_acceleration := data.get('video_hardware_acceleration'):
+                video_recorder.toggle_hardware_acceleration(force=(video_hardware_acceleration == "True"))
+            if video_segment_duration := data.get('video_segment_duration'):
+                video_recorder.set_segment_duration(video_segment_duration)
+            if video_segment_size := data.get('video_segment_size'):
+                video_recorder.set_segment_size(video_segment_size)
+
+            # Crossing clips
+            if clip_pre_roll := data.get('clip_pre_roll'):
+                self.counter.clip_recorder.set_pre_roll(clip_pre_roll)
+            if clip_post_roll := data.get('clip_post_roll'):
+                self.counter.clip_recorder.set_post_roll(clip_post_roll)
+            if clip_max_age := data.get('clip_max_age'):
+                self.counter.clip_recorder.set_max_age(clip_max_age)
+            if clip_max_size := data.get('clip_max_size'):
+                self.counter.clip_recorder.set_max_size(clip_max_size)
 
             # Redirect with the GET method
             raise web.HTTPSeeOther(request.rel_url.path)
 
+        # The model being loaded, if any
+        model_name, model_format, model_imgsz = self.counter.requested_model
         context = {
             'delay': self.counter.delay,
             'confidence': self.counter.confidence,
-            'aggregated_frames_number': self.counter.aggregated_frames_number
+            'aggregated_frames_number': self.counter.aggregated_frames_number,
+            'motion_heartbeat': self.counter.motion_heartbeat,
+            'model_name': model_name,
+            'model_format': model_format,
+            'model_formats': list(BACKENDS),
+            'model_imgsz': model_imgsz,
+            'model_loaded': self.counter.model is not None,
+            'running_model': f"{self.counter.model_name} ({self.counter.model_format}, imgsz={self.counter.model_imgsz})",
+            'model_loading': self.counter.model_swap_task is not None and not self.counter.model_swap_task.done(),
+            'model_exception': str(self.counter.model_exception),
+
+            'video_codec': self.counter.video_recorder.codec,
+            'video_codecs': list(VIDEO_CODECS),
+            'video_fps': self.counter.video_recorder.fps,
+            'video_quality': self.counter.video_recorder.quality,
+            'video_hardware_acceleration': self.counter.video_recorder.activate_hardware_acceleration,
+            'video_segment_duration': self.counter.video_recorder.segment_duration,
+            'video_segment_size': self.counter.video_recorder.segment_size,
+            'clip_pre_roll': self.counter.clip_recorder.pre_roll,
+            'clip_post_roll': self.counter.clip_recorder.post_roll,
+            'clip_max_age': self.counter.clip_recorder.max_age,
+            'clip_max_size': self.counter.clip_recorder.max_size,
         }
 
         response = await aiohttp_jinja2.render_template_async(
@@ -266,8 +652,12 @@ class Web:
         app.add_routes([
             # Non templated
             web.get('/last_frame', self.handle_last_frame),
+            web.get('/stream', self.handle_stream),
+            web.get('/stream/ws', self.handle_stream_websocket),
             web.get('/last_result', self.handle_last_result),
             web.get('/last_boxes', self.handle_last_boxes),
+            web.get('/metrics', self.handle_metrics),
+            web.get('/clips', self.handle_clips),
 
             # Templated
             web.get("/", self.handle_index),
@@ -280,6 +670,8 @@ class Web:
             # Inference results
             web.get('/results', self.handle_results),
             web.get('/results/live', self.handle_results_live),
+            web.get('/results/events', self.handle_results_events),
+            web.get('/results.json', self.handle_results_snapshot),
 
             # Database form
             web.get('/database', self.handle_configure_database),
@@ -304,6 +696,6 @@ class Web:
         # Launch the website
         runner = web.AppRunner(app)
         await runner.setup()
-        site = web.TCPSite(runner, "0.0.0.0", 8080)
+        site = web.TCPSite(runner, "0.0.0.0", self.port)
         await site.start()
-        logger.info("Web daemon started")
+        logger.info(f"Web daemon started on port {self.port}")
@@ -0,0 +1,243 @@
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Optional
+
+import cv2
+
+from people_counter.counter import Counter
+from people_counter.pgclient import PGClient
+from people_counter.configuration import Configuration, confmap
+
+
+logging.basicConfig(
+    format='%(asctime)s:%(levelname)s:%(funcName)s:%(message)s',
+    datefmt='%m/%d/%Y %H:%M:%S',
+)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+def video_start_time(video_path: str) -> datetime:
+    """
+    Start time of a video recorded by the video writer (trafficount-%Y_%m_%d-%H_%M_%S.mp4),
+    else the modification time of the file.
+    """
+    if match := re.search(r"(\d{4}_\d{2}_\d{2}-\d{2}_\d{2}_\d{2})", Path(video_path).name):
+        return datetime.strptime(match.group(1), "%Y_%m_%d-%H_%M_%S")
+    return datetime.fromtimestamp(os.path.getmtime(video_path))
+
+
+def counting_configuration(config: dict[str, str]) -> dict[str, str]:
+    """
+    Configuration without the database url and key: the counters of the
+    replay never connect to the database (no id lookups or insertions).
+    """
+    return {
+        key: value for key, value in config.items()
+        if key not in (confmap.database_url, confmap.database_key)
+    }
+
+
+def replay_segment(
+    video_path: str,
+    config: dict[str, str],
+    start_time: datetime,
+    start_frame: int,
+    end_frame: int,
+    warmup_frames: int,
+    stride: int,
+) -> list[dict[str, Any]]:
+    """
+    Count the frames [start_frame, end_frame[ of the video as fast as possible.
+    The [warmup_frames] frames before the start frame are only tracked to warm up
+    the tracker, their crossings are counted by the previous segment.
+    :return: The detections of the segment.
+    """
+    # The detections are returned by the counter, nothing is buffered
+    pgclient = PGClient()
+    counter = Counter(pgclient)
+    asyncio.run(Configuration(pgclient, counter).apply_configuration(counting_configuration(config)))
+    # Set directly: the setters refuse to drop the detections of a live counter
+    pgclient.rollup_aggregators = []
+    pgclient.activate_raw_insertion = False
+    counter.toggle_counting(force=True)
+    counter.toggle_image_annotation(force=False)
+    if not counter.init_model():
+        return []
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        logger.error(f"Video {video_path} not opened")
+        return []
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25
+
+    first_frame = max(start_frame - warmup_frames, 0)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, first_frame)
+
+    detections: list[dict[str, Any]] = []
+    for frame_index in range(first_frame, end_frame):
+
+        # Skip the frames without decoding them
+        if (frame_index - first_frame) % stride:
+            if not cap.grab():
+                break
+            continue
+
+        success, frame = cap.read()
+        if not success:
+            break
+
+        frame_time = start_time + timedelta(seconds=frame_index / fps)
+        counter.last_frame = frame
+        counter.last_frame_time = frame_time.timestamp()
+        counter.count(counter.model, frame)
+
+        # Warm-up: only track, don't count
+        if frame_index < start_frame:
+            counter.in_count = 0
+            counter.out_count = 0
+            continue
+
+        if (detection := counter.aggregate_results(frame_time)) is not None:
+            detections.append({
+                "people_image_count": detection.people_image_count,
+                "people_line_in_count": detection.people_line_in_count,
+                "people_line_out_count": detection.people_line_out_count,
+                "time": detection.time,
+            })
+
+    cap.release()
+    logger.info(f"Segment [{start_frame}, {end_frame}[ replayed: {len(detections)} detections")
+    return detections
+
+
+def replay(
+    video_path: str,
+    config: dict[str, str],
+    start_time: datetime,
+    workers: int,
+    stride: int,
+    warmup: float,
+) -> list[dict[str, Any]]:
+    """
+    Replay the video, split in [workers] time segments counted in parallel.
+    """
+    cap = cv2.VideoCapture(video_path)
+    frame_number = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25
+    cap.release()
+
+    warmup_frames = int(warmup * fps)
+    segment_length = -(-frame_number // max(workers, 1))  # Ceil division
+    segments = [
+        (start, min(start + segment_length, frame_number))
+        for start in range(0, frame_number, segment_length)
+    ] if frame_number else [(0, 2**31)]  # Unknown length: one segment until the end
+
+    logger.info(f"Replay {video_path}: frames={frame_number} fps={fps} segments={len(segments)}")
+    if len(segments) == 1:
+        return replay_segment(video_path, config, start_time, *segments[0], 0, stride)
+
+    # Spawn the workers: each one loads its own model
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+    ) as executor:
+        futures = [
+            executor.submit(
+                replay_segment, video_path, config, start_time, start, end,
+                warmup_frames if start else 0, stride)
+            for start, end in segments
+        ]
+        return [detection for future in futures for detection in future.result()]
+
+
+async def insert_detections(
+    config: dict[str, str],
+    detections: list[dict[str, Any]],
+    max_retries: int = 10,
+) -> bool:
+    """
+    Insert the detections to the database, in chunks (see PGClient.insert_detection_buffer).
+    The device, location and resolution ids are resolved here only, with the full configuration.
+    :return: True if all the detections are inserted, False after [max_retries] failed attempts
+    """
+    pgclient = PGClient()
+    await Configuration(pgclient, Counter(pgclient)).apply_configuration(config)
+    if pgclient.postgrest_client is None:
+        logger.error("No postgrest client, check the database url and key of the configuration")
+        return False
+
+    pgclient.set_detection_buffer_size(max(len(detections), 1))
+    for detection in detections:
+        pgclient.insert_detection(
+            detection["people_image_count"],
+            detection["people_line_in_count"],
+            detection["people_line_out_count"],
+            datetime.fromisoformat(detection["time"]))
+    # The last time buckets are not closed by a following detection
+    pgclient.flush_rollups()
+
+    # Only the chunks not inserted are retried
+    while pgclient.detection_buffer:
+        if await pgclient.insert_detection_buffer():
+            break
+        pgclient.insertion_failures += 1
+        if pgclient.insertion_failures >= max_retries:
+            logger.error(f"{len(pgclient.detection_buffer)} detections not inserted after {max_retries} attempts")
+            return False
+        retry_delay = pgclient.retry_delay()
+        logger.info(f"{retry_delay:.1f} seconds sleep before retrying insertion")
+        await asyncio.sleep(retry_delay)
+    return True
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Count the people of a recorded video as fast as possible.")
+    parser.add_argument("video", help="Video file, for example from video_writer/")
+    parser.add_argument("--config", default=os.environ.get("CONFIG_PATH"),
+                        help="Configuration file (confidence, line, aggregation, database)")
+    parser.add_argument("--start-time", type=datetime.fromisoformat,
+                        help="Start time of the video (default: from the file name or date)")
+    parser.add_argument("--stride", type=int, default=1, help="Count one frame every [stride] frames")
+    parser.add_argument("--workers", type=int, default=1, help="Number of processes (time segments)")
+    parser.add_argument("--warmup", type=float, default=5, help="Tracker warm-up before each segment (seconds)")
+    parser.add_argument("--output", help="Write the detections to this JSON lines file")
+    parser.add_argument("--insert", action="store_true", help="Insert the detections to the database")
+    parser.add_argument("--max-retries", type=int, default=10, help="Insertion attempts before giving up")
+    args = parser.parse_args()
+
+    # Same configuration as the live counter
+    config: Optional[dict[str, str]] = asyncio.run(
+        Configuration(PGClient(), Counter(PGClient()), args.config).read_configuration_from_file())
+
+    detections = replay(
+        args.video,
+        config or {},
+        args.start_time or video_start_time(args.video),
+        args.workers,
+        max(args.stride, 1),
+        args.warmup)
+    logger.info(f"{len(detections)} detections")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            for detection in detections:
+                f.write(json.dumps(detection) + "\n")
+        logger.info(f"Detections wrote to {args.output}")
+
+    if args.insert:
+        if not asyncio.run(insert_detections(config or {}, detections, max(args.max_retries, 1))):
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
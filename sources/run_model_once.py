@@ -1,6 +1,7 @@
 from pathlib import Path
-from ultralytics import YOLO  # type: ignore
+
+from people_counter.models import load_model
 
 # TODO: Run a single inference to download libraries
-model = YOLO(model="yolo11n_ncnn_model", verbose=True)
+model = load_model(model_name="yolo11n", model_format="ncnn", imgsz=640)
 model.track(source=Path(__file__).with_name("sonnyrollins.jpg"), show=True)
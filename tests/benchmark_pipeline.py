@@ -0,0 +1,253 @@
+"""
+End-to-end benchmark of the counting pipeline.
+
+Measure each stage with synthetic or recorded frames:
+- count: Counter.count() (inference, tracking and counting)
+- crossing: Counter.count_tracks_intersect_region() with synthetic tracks
+- insert_detection: PGClient.insert_detection() to the buffer
+- insert_detection_buffer: PGClient.insert_detection_buffer() to the local fake PostgREST (fake_postgrest.py)
+- encode: EncodedFrameCache.encode() of a new frame, as /last_frame (JPEG, quality 95, original size)
+- encode_stream: EncodedFrameCache.encode() of a new frame, as /stream (stream quality and width)
+- encode_cached: EncodedFrameCache.encode() of the same frame again (cache hit)
+
+The results (latency percentiles, FPS, memory and CPU) are saved in JSON
+to compare two commits:
+
+    python tests/benchmark_pipeline.py --output bench-before.json
+    python tests/benchmark_pipeline.py --output bench-after.json --compare bench-before.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+import cv2
+import numpy as np
+sys.path.insert(0, str(Path(__file__).parents[1] / "sources"))
+
+from people_counter.counter import Counter  # noqa: E402
+from people_counter.encoding import EncodedFrameCache  # noqa: E402
+from people_counter.pgclient import PGClient  # noqa: E402
+from fake_postgrest import FakePostgrest, start_fake_postgrest  # noqa: E402
+
+
+def summarize(durations: list[float], wall_time: float, cpu_time: float) -> dict[str, Any]:
+    """
+    Latency percentiles in milliseconds, FPS and CPU usage of a stage.
+    """
+    values = np.array(durations) * 1000
+    return {
+        "iterations": len(durations),
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p90_ms": float(np.percentile(values, 90)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "max_ms": float(values.max()),
+        "fps": float(len(durations) / wall_time) if wall_time else 0,
+        "cpu_percent": float(100 * cpu_time / wall_time) if wall_time else 0,
+    }
+
+
+def measure(function: Callable[[], Any], iterations: int, warmup: int = 3) -> dict[str, Any]:
+    """
+    Measure a synchronous stage.
+    """
+    for _ in range(warmup):
+        function()
+
+    durations: list[float] = []
+    tracemalloc.start()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    wall_time, cpu_time = time.perf_counter() - wall_start, time.process_time() - cpu_start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return summarize(durations, wall_time, cpu_time) | {"peak_python_memory_kb": peak // 1024}
+
+
+async def measure_async(function: Callable[[], Any], iterations: int) -> dict[str, Any]:
+    """
+    Measure an asynchronous stage.
+    """
+    durations: list[float] = []
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await function()
+        durations.append(time.perf_counter() - start)
+    wall_time, cpu_time = time.perf_counter() - wall_start, time.process_time() - cpu_start
+    return summarize(durations, wall_time, cpu_time)
+
+
+def load_frames(video: Optional[str], number: int) -> list[cv2.typing.MatLike]:
+    """
+    Read frames of a recorded video, else a reproducible synthetic frame.
+    """
+    frames: list[cv2.typing.MatLike] = []
+    if video:
+        cap = cv2.VideoCapture(video)
+        while len(frames) < number:
+            success, frame = cap.read()
+            if not success:
+                break
+            frames.append(frame)
+        cap.release()
+
+    if not frames:
+        image = cv2.imread(str(Path(__file__).parents[1] / "sources" / "sonnyrollins.jpg"))
+        if image is None:
+            image = np.random.default_rng(0).integers(0, 255, (480, 640, 3), dtype=np.uint8)
+        frames = [cv2.resize(image, (640, 480))]
+    return frames
+
+
+def bench_count(counter: Counter, frames: list[cv2.typing.MatLike], iterations: int) -> dict[str, Any]:
+    index = 0
+
+    def count() -> None:
+        nonlocal index
+        frame = frames[index % len(frames)]
+        index += 1
+        counter.count(counter.model, frame)
+        counter.aggregate_results()
+
+    return measure(count, iterations)
+
+
+def bench_crossing(counter: Counter, tracks: int, iterations: int) -> dict[str, Any]:
+    rng = np.random.default_rng(0)
+    track_ids = list(range(tracks))
+
+    def crossing() -> None:
+        previous = rng.integers(0, 640, (tracks, 2))
+        current = previous + rng.integers(-20, 20, (tracks, 2))
+        counter.track_history.clear()
+        counter.count_tracks_intersect_region(
+            track_ids, [tuple(p) for p in previous.tolist()], [tuple(c) for c in current.tolist()])
+
+    return measure(crossing, iterations)
+
+
+def bench_encode(counter: Counter, frame: cv2.typing.MatLike, iterations: int) -> dict[str, Any]:
+    """
+    Encode through the frame cache, as the web server: a new sequence number
+    for each iteration is a cache miss (new frame), the same one is a hit.
+    """
+    frame_cache = EncodedFrameCache()
+    sequences = itertools.count(1)
+    quality, width = counter.streamer.quality, counter.streamer.width
+
+    results: dict[str, Any] = {}
+    results["encode"] = measure(
+        lambda: frame_cache.encode(frame, (next(sequences), "jpg", 95, 0)), iterations)
+    results["encode_stream"] = measure(
+        lambda: frame_cache.encode(frame, (next(sequences), "jpg", quality, width)), iterations)
+    results["encode_cached"] = measure(
+        lambda: frame_cache.encode(frame, (0, "jpg", 95, 0)), iterations)
+    return results
+
+
+async def bench_database(buffer_length: int, iterations: int, port: int) -> dict[str, Any]:
+    runner = await start_fake_postgrest(FakePostgrest(), port)
+    try:
+        pgclient = PGClient()
+        pgclient.set_url(f"http://127.0.0.1:{port}")
+        pgclient.set_key("benchmark.benchmark.benchmark")
+        pgclient.toggle_foreign_key_insertion(force=True)
+        pgclient.init_pgclient()
+        await pgclient.update_device("benchmark")
+        await pgclient.update_location("benchmark")
+
+        results: dict[str, Any] = {}
+        results["insert_detection"] = measure(
+            lambda: pgclient.insert_detection(1, 0, 0), buffer_length)
+
+        async def insert_buffer() -> None:
+            for _ in range(buffer_length - len(pgclient.detection_buffer)):
+                pgclient.insert_detection(1, 0, 0)
+            await pgclient.insert_detection_buffer()
+
+        results["insert_detection_buffer"] = await measure_async(insert_buffer, iterations)
+        return results
+    finally:
+        await runner.cleanup()
+
+
+def environment() -> dict[str, Any]:
+    commit = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    return {
+        "commit": commit,
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": platform.machine(),
+        "python": platform.python_version(),
+    }
+
+
+def compare(results: dict[str, Any], previous: dict[str, Any]) -> None:
+    """
+    Print the p50 latency ratio of each stage with the previous results.
+    """
+    print(f"Comparison with {previous['environment']['commit']}:")
+    for stage, values in results["stages"].items():
+        if stage in previous["stages"] and previous["stages"][stage]["p50_ms"]:
+            ratio = values["p50_ms"] / previous["stages"][stage]["p50_ms"]
+            print(f"  {stage:<25} p50 x{ratio:.2f} ({previous['stages'][stage]['p50_ms']:.3f} -> {values['p50_ms']:.3f} ms)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", help="Recorded video to use instead of synthetic frames")
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--tracks", type=int, default=50, help="Number of synthetic tracks for crossing")
+    parser.add_argument("--buffer-length", type=int, default=3600, help="Detections per buffer insertion")
+    parser.add_argument("--port", type=int, default=3999, help="Port of the fake PostgREST")
+    parser.add_argument("--no-model", action="store_true", help="Skip the inference stage")
+    parser.add_argument("--output", default="bench_output.json")
+    parser.add_argument("--compare", help="Previous JSON results to compare with")
+    args = parser.parse_args()
+
+    frames = load_frames(args.video, args.iterations)
+    counter = Counter(PGClient())
+    counter.toggle_counting(force=True)
+
+    stages: dict[str, Any] = {}
+    if not args.no_model and counter.init_model():
+        stages["count"] = bench_count(counter, frames, args.iterations)
+    stages["crossing"] = bench_crossing(counter, args.tracks, args.iterations * 10)
+    stages |= bench_encode(counter, frames[0], args.iterations)
+    stages |= asyncio.run(bench_database(args.buffer_length, max(args.iterations // 10, 1), args.port))
+
+    results = {
+        "environment": environment(),
+        "parameters": vars(args),
+        "stages": stages,
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+    for stage, values in stages.items():
+        print(f"{stage:<25} p50={values['p50_ms']:.3f}ms p99={values['p99_ms']:.3f}ms fps={values['fps']:.1f}")
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results wrote to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Local stand-in PostgREST to exercise the insertion path without Supabase.
+
+Serves the tables of the counter (appareils, lieux, resolutions,
+detections_suivi, detections_agregees) in memory, with injectable latency,
+failures and throttling:
+
+    python tests/fake_postgrest.py --port 3999 --latency 0.05 --failure-rate 0.1 --max-requests-per-second 20
+
+Then use http://127.0.0.1:3999 as the database url (any key).
+The counters of the requests are served at /_stats.
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import defaultdict, deque
+from typing import Any
+
+from aiohttp import web
+
+
+# Foreign keys of the detections tables
+FOREIGN_KEYS: dict[str, str] = {
+    "id_appareil": "appareils",
+    "id_lieu": "lieux",
+    "id_resolution": "resolutions",
+}
+
+# Id column of each table
+ID_COLUMNS: dict[str, str] = {
+    "appareils": "id_appareil",
+    "lieux": "id_lieu",
+    "resolutions": "id_resolution",
+    "detections_suivi": "id_detection",
+    "detections_agregees": "id_detection_agregee",
+}
+
+
+def postgrest_error(status: int, code: str, message: str) -> web.Response:
+    """
+    Error in the PostgREST format (parsed by postgrest-py into an APIError).
+    """
+    return web.json_response(
+        {"code": code, "details": None, "hint": None, "message": message}, status=status)
+
+
+class FakePostgrest:
+    """
+    In-memory PostgREST.
+    :param latency: Seconds added to each request.
+    :param latency_jitter: Random seconds added to the latency (uniform).
+    :param failure_rate: Ratio of the requests answered with a 503 error.
+    :param max_requests_per_second: Requests over this rate are answered with a 429 error (0 for no limit).
+    """
+
+    def __init__(
+        self,
+        latency: float = 0,
+        latency_jitter: float = 0,
+        failure_rate: float = 0,
+        max_requests_per_second: float = 0,
+        seed: int = 0,
+    ) -> None:
+        self.latency: float = latency
+        self.latency_jitter: float = latency_jitter
+        self.failure_rate: float = failure_rate
+        self.max_requests_per_second: float = max_requests_per_second
+        self.random = random.Random(seed)
+
+        # Rows of each table, the foreign tables have one row of id 1 by default
+        self.tables: dict[str, list[dict[str, Any]]] = {
+            "appareils": [{"id_appareil": 1, "nom_appareil": "benchmark"}],
+            "lieux": [{"id_lieu": 1, "nom_lieu": "benchmark"}],
+            "resolutions": [{"id_resolution": 1, "largeur": 640, "hauteur": 480}],
+            "detections_suivi": [],
+            "detections_agregees": [],
+        }
+
+        # Keep the inserted detections or only count them (load tests)
+        self.keep_detections: bool = False
+
+        # Times of the last requests for the throttling
+        self.request_times: deque[float] = deque()
+
+        # Counters of the requests
+        self.stats: dict[str, int] = defaultdict(int)
+
+    def application(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024**2)
+        app.add_routes([
+            web.get("/_stats", self.handle_stats),
+            web.get("/rest/v1/{table}", self.handle_select),
+            web.post("/rest/v1/{table}", self.handle_insert),
+        ])
+        return app
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(dict(self.stats))
+
+    async def inject(self) -> web.Response | None:
+        """
+        Latency, throttling and failures of a request.
+        :return: The error response if the request fails, else None
+        """
+        self.stats["requests"] += 1
+
+        if self.latency or self.latency_jitter:
+            await asyncio.sleep(self.latency + self.random.uniform(0, self.latency_jitter))
+
+        if self.max_requests_per_second:
+            now = time.monotonic()
+            while self.request_times and now - self.request_times[0] > 1:
+                self.request_times.popleft()
+            if len(self.request_times) >= self.max_requests_per_second:
+                self.stats["throttled"] += 1
+                return postgrest_error(429, "429", "Too many requests")
+            self.request_times.append(now)
+
+        if self.failure_rate and self.random.random() < self.failure_rate:
+            self.stats["failures"] += 1
+            return postgrest_error(503, "503", "Injected failure")
+        return None
+
+    def matches(self, row: dict[str, Any], query: dict[str, str]) -> bool:
+        """
+        Filters of the query string (column=eq.value or column=like.value).
+        """
+        for column, condition in query.items():
+            if column in ("select", "limit", "order", "offset", "columns"):
+                continue
+            operator, _, value = condition.partition(".")
+            if operator not in ("eq", "like") or str(row.get(column)) != value:
+                return False
+        return True
+
+    async def handle_select(self, request: web.Request) -> web.Response:
+        if (error := await self.inject()) is not None:
+            return error
+
+        table = request.match_info["table"]
+        if table not in self.tables:
+            return postgrest_error(404, "42P01", f'relation "{table}" does not exist')
+
+        rows = [row for row in self.tables[table] if self.matches(row, dict(request.query))]
+        if limit := request.query.get("limit"):
+            rows = rows[:int(limit)]
+        if select := request.query.get("select"):
+            columns = select.split(",")
+            rows = [{column: row.get(column) for column in columns} for row in rows]
+
+        self.stats["selects"] += 1
+        return web.json_response(rows)
+
+    async def handle_insert(self, request: web.Request) -> web.Response:
+        if (error := await self.inject()) is not None:
+            return error
+
+        table = request.match_info["table"]
+        if table not in self.tables:
+            return postgrest_error(404, "42P01", f'relation "{table}" does not exist')
+
+        body = await request.json()
+        rows: list[dict[str, Any]] = body if isinstance(body, list) else [body]
+
+        # Foreign key violation if an id doesn't exist
+        for column, foreign_table in FOREIGN_KEYS.items():
+            foreign_ids = {row[column] for row in self.tables[foreign_table]}
+            if any(column in row and row[column] not in foreign_ids for row in rows):
+                self.stats["foreign_key_violations"] += 1
+                return postgrest_error(
+                    409, "23503", f'insert on table "{table}" violates foreign key constraint on {column}')
+
+        # Give an id to the rows
+        id_column = ID_COLUMNS[table]
+        inserted: list[dict[str, Any]] = []
+        for row in rows:
+            self.stats[f"{table}_rows"] += 1
+            row = {id_column: self.stats[f"{table}_rows"]} | row
+            inserted.append(row)
+        if table in FOREIGN_KEYS.values() or self.keep_detections:
+            self.tables[table] += inserted
+
+        self.stats["inserts"] += 1
+        if "return=representation" in request.headers.get("Prefer", ""):
+            return web.json_response(inserted, status=201)
+        return web.Response(status=201)
+
+
+async def start_fake_postgrest(fake: FakePostgrest, port: int, host: str = "127.0.0.1") -> web.AppRunner:
+    """
+    Serve the fake PostgREST in the running event loop.
+    :return: The runner, to cleanup() at the end.
+    """
+    runner = web.AppRunner(fake.application())
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3999)
+    parser.add_argument("--latency", type=float, default=0, help="Seconds added to each request")
+    parser.add_argument("--latency-jitter", type=float, default=0, help="Random seconds added to the latency")
+    parser.add_argument("--failure-rate", type=float, default=0, help="Ratio of requests failing with 503")
+    parser.add_argument("--max-requests-per-second", type=float, default=0, help="Throttling with 429, 0 for none")
+    parser.add_argument("--keep-detections", action="store_true", help="Keep the detections (served by select)")
+    args = parser.parse_args()
+
+    fake = FakePostgrest(args.latency, args.latency_jitter, args.failure_rate, args.max_requests_per_second)
+    fake.keep_detections = args.keep_detections
+    web.run_app(fake.application(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Load test of the insertion path: hundreds of counters inserting concurrently.
+
+Each simulated counter is a PGClient with an in-memory spool, producing
+detections at a fixed rate and inserting its buffer periodically, with the
+same backoff as start_pgclient(). The database is the local fake PostgREST
+(fake_postgrest.py, started in the process) or a given url:
+
+    python tests/load_postgrest.py --counters 300 --duration 60 --latency 0.05 --failure-rate 0.05
+    python tests/load_postgrest.py --counters 100 --url http://127.0.0.1:3999
+
+The results (insertion latency percentiles, throughput, failures) are saved in JSON.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+sys.path.insert(0, str(Path(__file__).parents[1] / "sources"))
+
+from people_counter.pgclient import PGClient  # noqa: E402
+from fake_postgrest import FakePostgrest, start_fake_postgrest  # noqa: E402
+
+
+class SimulatedCounter:
+    """
+    Counter producing detections and inserting them like start_pgclient().
+    """
+
+    def __init__(self, index: int, url: str, args: argparse.Namespace) -> None:
+        self.index: int = index
+        self.args: argparse.Namespace = args
+
+        self.pgclient = PGClient()
+        self.pgclient.set_url(url)
+        self.pgclient.set_key("load.load.load")
+        self.pgclient.set_insertion_chunk_size(args.chunk_size)
+        self.pgclient.set_insertion_concurrency(args.concurrency)
+        self.pgclient.set_error_delay(args.error_delay)
+        # The tables of the fake PostgREST are empty
+        self.pgclient.toggle_foreign_key_insertion(force=True)
+        if args.rollup_durations:
+            self.pgclient.set_rollup_durations(args.rollup_durations)
+
+        # Durations of the insertions of the buffer (seconds) and their results
+        self.durations: list[float] = []
+        self.successes: int = 0
+        self.failures: int = 0
+        self.produced_count: int = 0
+
+    async def produce(self, end_time: float) -> None:
+        while time.monotonic() < end_time:
+            self.pgclient.insert_detection(random.randint(0, 20), random.randint(0, 2), random.randint(0, 2))
+            self.produced_count += 1
+            await asyncio.sleep(self.args.detection_period)
+
+    async def insert(self, end_time: float) -> None:
+        # Spread the first insertions of the counters
+        await asyncio.sleep(random.uniform(0, self.args.insertion_delay))
+        while time.monotonic() < end_time:
+            if self.pgclient.detection_buffer:
+                start = time.perf_counter()
+                inserted = await self.pgclient.insert_detection_buffer()
+                self.durations.append(time.perf_counter() - start)
+                if inserted:
+                    self.successes += 1
+                    self.pgclient.insertion_failures = 0
+                else:
+                    self.failures += 1
+                    self.pgclient.insertion_failures += 1
+                    await asyncio.sleep(self.pgclient.retry_delay())
+                    continue
+            await asyncio.sleep(self.args.insertion_delay)
+
+    async def run(self, duration: float) -> None:
+        self.pgclient.init_pgclient()
+        await self.pgclient.update_device(f"load-{self.index}")
+        await self.pgclient.update_location(f"load-{self.index}")
+        await self.pgclient.update_resolution(640, 480)
+
+        end_time = time.monotonic() + duration
+        await asyncio.gather(self.produce(end_time), self.insert(end_time))
+
+        # Last insertion of the remaining detections
+        if self.pgclient.detection_buffer:
+            await self.pgclient.insert_detection_buffer()
+        self.pgclient.close_http_client()
+
+
+def percentile(values: list[float], ratio: float) -> float:
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(int(len(values) * ratio), len(values) - 1)]
+
+
+async def run_load(args: argparse.Namespace) -> dict[str, Any]:
+    fake = None
+    runner = None
+    url = args.url
+    if url is None:
+        fake = FakePostgrest(args.latency, args.latency_jitter, args.failure_rate, args.max_requests_per_second)
+        runner = await start_fake_postgrest(fake, args.port)
+        url = f"http://127.0.0.1:{args.port}"
+
+    try:
+        counters = [SimulatedCounter(index, url, args) for index in range(args.counters)]
+        start = time.perf_counter()
+        await asyncio.gather(*(counter.run(args.duration) for counter in counters))
+        wall_time = time.perf_counter() - start
+    finally:
+        if runner is not None:
+            await runner.cleanup()
+
+    durations = [duration for counter in counters for duration in counter.durations]
+    produced_count = sum(counter.produced_count for counter in counters)
+    remaining_count = sum(counter.pgclient.detection_buffer.sizes["detections"] for counter in counters)
+    results: dict[str, Any] = {
+        "wall_time_s": wall_time,
+        "produced_count": produced_count,
+        "inserted_count": produced_count - remaining_count,
+        "remaining_count": remaining_count,
+        "dropped_count": sum(counter.pgclient.detection_buffer.dropped_count for counter in counters),
+        "insertions": len(durations),
+        "insertion_successes": sum(counter.successes for counter in counters),
+        "insertion_failures": sum(counter.failures for counter in counters),
+        "detections_per_s": (produced_count - remaining_count) / wall_time,
+        "p50_ms": percentile(durations, 0.50) * 1000,
+        "p90_ms": percentile(durations, 0.90) * 1000,
+        "p99_ms": percentile(durations, 0.99) * 1000,
+        "max_ms": max(durations, default=0) * 1000,
+    }
+    if fake is not None:
+        results["server"] = dict(fake.stats)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--counters", type=int, default=200, help="Number of simulated counters")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of detection production")
+    parser.add_argument("--detection-period", type=float, default=1, help="Seconds between two detections")
+    parser.add_argument("--insertion-delay", type=float, default=5, help="Seconds between two insertions")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=2)
+    parser.add_argument("--error-delay", type=int, default=8, help="Maximum backoff in seconds")
+    parser.add_argument("--rollup-durations", default="", help="Rollup durations, ex: 60,900")
+    parser.add_argument("--url", help="Database url, instead of the local fake PostgREST")
+    parser.add_argument("--port", type=int, default=3999, help="Port of the fake PostgREST")
+    parser.add_argument("--latency", type=float, default=0, help="Seconds added to each request")
+    parser.add_argument("--latency-jitter", type=float, default=0, help="Random seconds added to the latency")
+    parser.add_argument("--failure-rate", type=float, default=0, help="Ratio of requests failing with 503")
+    parser.add_argument("--max-requests-per-second", type=float, default=0, help="Throttling with 429, 0 for none")
+    parser.add_argument("--verbose", action="store_true", help="Logs of the PGClients")
+    parser.add_argument("--output", default="load_output.json")
+    args = parser.parse_args()
+
+    # The failures are expected, only the results are printed
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+
+    results = asyncio.run(run_load(args))
+    results = {"parameters": vars(args), "results": results}
+
+    for key, value in results["results"].items():
+        print(f"{key:<22} {value:.3f}" if isinstance(value, float) else f"{key:<22} {value}")
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results wrote to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Direction of the line crossings (LineCrossing), pinned to the baseline:
+- vertical line: moving right is IN, moving left is OUT,
+- horizontal line: moving downward is IN, moving upward is OUT,
+whatever the order of the points of the line.
+
+    python -m pytest tests/test_crossing.py
+    python tests/test_crossing.py
+"""
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parents[1] / "sources"))
+
+from people_counter.crossing import LineCrossing  # noqa: E402
+
+
+def cross(line: tuple[tuple[int, int], tuple[int, int]], previous: tuple[int, int], current: tuple[int, int]) -> int:
+    return int(LineCrossing(*line).crossings(np.array([previous]), np.array([current]))[0])
+
+
+def test_vertical_line() -> None:
+    for line in (((320, 0), (320, 480)), ((320, 480), (320, 0)), ((300, 0), (340, 480))):
+        assert cross(line, (300, 240), (340, 240)) == LineCrossing.IN, line  # Moving right
+        assert cross(line, (340, 240), (300, 240)) == LineCrossing.OUT, line  # Moving left
+
+
+def test_horizontal_line() -> None:
+    # Default line of the configuration, drawn from left to right
+    for line in (((0, 240), (640, 240)), ((640, 240), (0, 240)), ((0, 220), (640, 260))):
+        assert cross(line, (320, 200), (320, 280)) == LineCrossing.IN, line  # Moving downward
+        assert cross(line, (320, 280), (320, 200)) == LineCrossing.OUT, line  # Moving upward
+
+
+def test_no_crossing() -> None:
+    line = ((0, 240), (640, 240))
+    assert cross(line, (320, 200), (320, 230)) == 0  # Not reaching the line
+    assert cross(line, (700, 200), (700, 280)) == 0  # Beside the line
+    assert cross(line, (100, 240), (200, 240)) == 0  # Along the line
+
+
+if __name__ == "__main__":
+    test_vertical_line()
+    test_horizontal_line()
+    test_no_crossing()
+    print("OK")